@@ -56,13 +56,17 @@ INSTALLED_APPS = [
 ]
 
 
-EMAIL_BACKEND = 'django.core.mail.backends.console.EmailBackend'
+# email is queued and sent by the background workers through QUEUED_EMAIL_BACKEND, see jengabay.mail
+EMAIL_BACKEND = 'jengabay.mail.QueuedEmailBackend'
+QUEUED_EMAIL_BACKEND = 'django.core.mail.backends.console.EmailBackend'
 
 SITE_ID = 1
 
 MIDDLEWARE = [
+    'jengabay.instrumentation.InstrumentationMiddleware',
     'django.middleware.security.SecurityMiddleware',
-     'whitenoise.middleware.WhiteNoiseMiddleware',
+    'jengabay.routers.ReplicaRoutingMiddleware',
+     'jengabay.middleware.StaticFilesMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'corsheaders.middleware.CorsMiddleware',
@@ -105,6 +109,23 @@ DATABASES = {
     }
 }
 
+# read replicas of the default database serving the catalog reads, see jengabay.routers.
+# to try it locally point DATABASE_REPLICA_NAME at a second SQLite file and keep it
+# current with `python manage.py sync_replicas --interval 5`
+DATABASE_REPLICAS = []
+if os.environ.get('DATABASE_REPLICA_NAME'):
+    DATABASES['replica'] = {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': os.environ['DATABASE_REPLICA_NAME'],
+        'TEST': {'MIRROR': 'default'},
+    }
+    DATABASE_REPLICAS = ['replica']
+
+DATABASE_ROUTERS = ['jengabay.routers.PrimaryReplicaRouter']
+
+# seconds a client reads from the primary after writing, so it sees its own writes
+REPLICA_PIN_SECONDS = 15
+
 
 # Password validation
 # https://docs.djangoproject.com/en/3.2/ref/settings/#auth-password-validators
@@ -155,16 +176,78 @@ DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media/')
 MEDIA_URL = '/media/'
 
+# uploads are stored under the digest of their content, see jengabay.images
+STORAGES = {
+    'default': {'BACKEND': 'jengabay.images.ContentAddressedStorage'},
+    'staticfiles': {'BACKEND': 'django.contrib.staticfiles.storage.StaticFilesStorage'},
+}
+
+# background tasks run by `python manage.py run_workers`, see jengabay.tasks. A failed task is
+# retried up to TASK_MAX_ATTEMPTS times, TASK_RETRY_DELAY seconds after its first failure and twice
+# as long after every following one, tasks running longer than TASK_LEASE_SECONDS are requeued
+TASK_WORKERS = 2
+TASK_MAX_ATTEMPTS = 5
+TASK_RETRY_DELAY = 10  # seconds
+TASK_LEASE_SECONDS = 600
+
 REST_FRAMEWORK = {
     'DEFAULT_FILTER_BACKENDS': ['django_filters.rest_framework.DjangoFilterBackend'],
     'DEFAULT_AUTHENTICATION_CLASSES': [
-        'jengabay.token_authentication.ExpiringTokenAuthentication',
+        'jengabay.token_authentication.SignedTokenAuthentication',
         'rest_framework.authentication.SessionAuthentication',
         'rest_framework.authentication.BasicAuthentication',
     ],
-    'DEFAULT_PERMISSION_CLASSES': ['rest_framework.permissions.AllowAny',]
+    'DEFAULT_PERMISSION_CLASSES': ['rest_framework.permissions.AllowAny',],
+    # orjson backed JSON, byte for byte the output of DRF's JSONRenderer, which renders the floats orjson
+    # writes differently, see jengabay.renderers
+    'DEFAULT_RENDERER_CLASSES': [
+        'jengabay.renderers.FastJSONRenderer',
+        'rest_framework.renderers.BrowsableAPIRenderer',
+    ],
+    'DEFAULT_PARSER_CLASSES': [
+        'jengabay.renderers.FastJSONParser',
+        'rest_framework.parsers.FormParser',
+        'rest_framework.parsers.MultiPartParser',
+    ],
 }
 
+# bounded cache of rendered catalog responses, see jengabay.cache.
+# the file based backend is shared by the worker processes of a host so invalidations reach all of them
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    'responses': {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': os.path.join(BASE_DIR, 'cache', 'responses'),
+        'TIMEOUT': 300,
+        'OPTIONS': {'MAX_ENTRIES': 5000},
+    },
+}
+RESPONSE_CACHE_ALIAS = 'responses'
+
+# in-process cache of authentication token lookups, see jengabay.token_authentication
+TOKEN_CACHE_MAX_SIZE = 1024
+TOKEN_CACHE_TTL = 60  # seconds
+
+# issue HMAC signed access tokens, verified without a database query, at login instead of database
+# tokens, see jengabay.signed_tokens. Database tokens issued before keep working until they expire
+SIGNED_TOKENS = os.environ.get('SIGNED_TOKENS') == '1'
+SIGNED_TOKEN_LIFETIME = 24 * 60 * 60  # seconds
+
+# requests slower than SLOW_REQUEST_MS are logged to the 'jengabay.slow_requests' logger, the fraction
+# of them timed by jengabay.instrumentation (0 disables it) also return their query, authentication,
+# permission, serializer and rendering times in a Server-Timing header and in the log record
+REQUEST_TIMING_SAMPLE_RATE = float(os.environ.get('REQUEST_TIMING_SAMPLE_RATE', '0'))
+SLOW_REQUEST_MS = 500
+
+# serve the catalog and profile read views and the login as native coroutines,
+# set by backend.asgi since under WSGI every async view would run in its own event loop
+ASYNC_VIEWS = os.environ.get('ASYNC_VIEWS') == '1'
+
+# threads verifying passwords for the async login, see jengabay.passwords
+PASSWORD_HASHING_WORKERS = 4
+
 
 # CORS_ALLOWED_ORIGINS = [
 #     "https://localhost:3000",
@@ -8,4 +8,8 @@ admin.site.register(Seller)
 admin.site.register(Item)
 admin.site.register(Order)
 admin.site.register(Buyer)
-admin.site.register(Transaction)
\ No newline at end of file
+admin.site.register(Transaction)
+admin.site.register(SellerDailySales)
+admin.site.register(ItemSales)
+admin.site.register(ItemFacetCount)
+admin.site.register(Task)
\ No newline at end of file
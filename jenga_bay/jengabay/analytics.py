@@ -0,0 +1,129 @@
+"""Seller sales dashboard aggregates.
+
+The dashboard reads summary tables instead of the raw orders: SellerDailySales holds the
+revenue, order count and delivered count of the orders a seller received per day they
+were placed, ItemSales the number of orders including an item. Writes to orders, their
+payment transactions and ordered items are applied to the summary rows as increments
+(see jengabay.signals), rebuild_summaries recomputes them from the orders, e.g. for the
+orders placed before the summaries existed.
+"""
+from itertools import islice
+
+from django.db import transaction
+from django.db.models import Count, F, Q, Sum
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+from .models import Item, ItemSales, Order, SellerDailySales
+
+BATCH_SIZE = 500
+
+
+def sales_date(value):
+    """returns the day an order placed at `value` is counted on, in the current time zone"""
+    if timezone.is_aware(value):
+        value = timezone.localtime(value)
+    return value.date()
+
+
+def order_sales(order):
+    """returns the contribution of an order to the daily sales of its seller as a
+    (seller_id, date, revenue, delivered) tuple, None for orders without a payment or date"""
+    payment = order.payment_transaction
+    if payment is None or order.date_placed is None:
+        return None
+    return payment.recipient_id, sales_date(order.date_placed), payment.amount, int(order.is_delivered)
+
+
+def stored_order_sales(orders):
+    """returns {order id: contribution} for the stored state of the orders in a queryset"""
+    rows = orders.filter(payment_transaction__isnull=False, date_placed__isnull=False).values_list(
+        'id', 'payment_transaction__recipient_id', 'date_placed', 'payment_transaction__amount', 'is_delivered')
+    return {
+        order_id: (seller_id, sales_date(date_placed), amount, int(is_delivered))
+        for order_id, seller_id, date_placed, amount, is_delivered in rows
+    }
+
+
+def _add_daily_sales(sales, sign):
+    seller_id, date, revenue, delivered = sales
+    if sign > 0:
+        # the row is created empty and incremented in place, concurrent orders never overwrite each other
+        SellerDailySales.objects.bulk_create([SellerDailySales(seller_id=seller_id, date=date)], ignore_conflicts=True)
+    SellerDailySales.objects.filter(seller_id=seller_id, date=date).update(
+        revenue=F('revenue') + sign * revenue,
+        order_count=F('order_count') + sign,
+        delivered_count=F('delivered_count') + sign * delivered,
+    )
+
+
+def update_order_sales(old, new):
+    """moves the contribution of an order from `old` to `new`, either being None when
+    the order did not or does no longer count"""
+    if old == new:
+        return
+    if old is not None:
+        _add_daily_sales(old, -1)
+    if new is not None:
+        _add_daily_sales(new, 1)
+
+
+def count_deliveries(seller_id, day_counts, sign):
+    """adds (sign 1) or removes (sign -1) deliveries to the daily sales of a seller, `day_counts`
+    maps the days the orders were placed on to their number, for bulk updates skipping the signals"""
+    for date, count in day_counts.items():
+        SellerDailySales.objects.filter(seller_id=seller_id, date=date).update(
+            delivered_count=F('delivered_count') + sign * count)
+
+
+def count_item_orders(item_ids, delta):
+    """adds `delta` to the order counts of the items"""
+    item_ids = list(item_ids)
+    if not item_ids or not delta:
+        return
+    if delta > 0:
+        ItemSales.objects.bulk_create([ItemSales(item_id=item_id) for item_id in item_ids], ignore_conflicts=True)
+    ItemSales.objects.filter(item_id__in=item_ids).update(order_count=F('order_count') + delta)
+
+
+def rebuild_summaries(seller_ids=None):
+    """recomputes the summary rows of the given sellers, or of every seller, from their orders
+    and returns the number of daily and item rows written"""
+    orders = Order.objects.filter(payment_transaction__isnull=False, date_placed__isnull=False)
+    daily_sales = SellerDailySales.objects.all()
+    items = Item.objects.all()
+    if seller_ids is not None:
+        orders = orders.filter(payment_transaction__recipient__in=seller_ids)
+        daily_sales = daily_sales.filter(seller__in=seller_ids)
+        items = items.filter(item_seller__in=seller_ids)
+
+    daily_rows = orders.values(recipient=F('payment_transaction__recipient'), day=TruncDate('date_placed')).annotate(
+        revenue=Sum('payment_transaction__amount'),
+        order_count=Count('id'),
+        delivered_count=Count('id', filter=Q(is_delivered=True)),
+    ).order_by()
+    item_rows = items.annotate(order_count=Count('order')).filter(order_count__gt=0).values_list('id', 'order_count')
+
+    with transaction.atomic():
+        daily_sales.delete()
+        ItemSales.objects.filter(item__in=items).delete()
+        # the rows are streamed from the aggregate queries and written in batches
+        daily_count = _write_batches(SellerDailySales, (
+            SellerDailySales(seller_id=row['recipient'], date=row['day'], revenue=row['revenue'],
+                             order_count=row['order_count'], delivered_count=row['delivered_count'])
+            for row in daily_rows.iterator(chunk_size=BATCH_SIZE)
+        ))
+        item_count = _write_batches(ItemSales, (
+            ItemSales(item_id=item_id, order_count=order_count)
+            for item_id, order_count in item_rows.iterator(chunk_size=BATCH_SIZE)
+        ))
+    return daily_count, item_count
+
+
+def _write_batches(model, objects):
+    count = 0
+    while True:
+        batch = list(islice(objects, BATCH_SIZE))
+        if not batch:
+            return count
+        model.objects.bulk_create(batch)
+        count += len(batch)
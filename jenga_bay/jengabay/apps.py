@@ -4,3 +4,11 @@ from django.apps import AppConfig
 class JengabayConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'jengabay'
+
+    def ready(self):
+        # connect the model signal receivers
+        from . import signals
+        # record the queries of the requests timed by jengabay.instrumentation
+        from django.db.backends.signals import connection_created
+        from .instrumentation import install_query_recorder
+        connection_created.connect(install_query_recorder)
@@ -0,0 +1,316 @@
+"""Endpoint benchmark harness.
+
+`seed_dataset()` generates a deterministic marketplace with jengabay.seeding whose size
+scales with a factor, `build_endpoints()` lists a request for every route of jengabay.urls
+against it and `run_benchmarks()` sends them through the test client, measuring per endpoint
+the latency percentiles, sequential throughput, SQL queries and their time and the peak
+memory allocated by a request. Results are plain dicts so runs can be stored as JSON and
+diffed against a baseline with `compare()`, see the `benchmark` management command.
+
+`run_render_benchmarks()` times the JSON renderers and parsers alone on /items pages of
+several sizes, see the `benchmark_renderers` management command.
+"""
+import io
+import math
+import time
+import tracemalloc
+from datetime import timedelta
+
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import User
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.db import connection
+from django.utils.timezone import localdate
+from rest_framework.authtoken.models import Token
+from rest_framework.parsers import JSONParser
+from rest_framework.renderers import JSONRenderer
+from rest_framework.test import APIClient, APIRequestFactory
+from . import signed_tokens
+from .models import Item, ItemListing, Order
+from .renderers import FastJSONParser, FastJSONRenderer
+from .serializers import ItemListingSerializer
+from .seeding import PASSWORD, MarketplaceSeeder
+
+# sizes of the seeded marketplace, multiplied by the scale
+SELLERS = 20
+ITEMS = 1000
+BUYERS = 20
+ORDERS = 200
+
+
+def percentile(values, fraction):
+    """returns the nearest rank percentile of sorted values"""
+    if not values:
+        return None
+    return values[max(0, math.ceil(fraction * len(values)) - 1)]
+
+
+def scaled(size, scale):
+    return max(1, int(size * scale))
+
+
+class Dataset:
+    """the seeded rows the endpoints are requested with, `tokens` maps users to their token keys"""
+
+    def __init__(self, seller, buyer, item, order, admin, tokens):
+        self.seller = seller
+        self.buyer = buyer
+        self.item = item
+        self.order = order
+        self.admin = admin
+        self.tokens = tokens
+
+
+def seed_dataset(scale=1, seed=0):
+    """seeds a marketplace with jengabay.seeding and returns the dataset, the same scale and seed
+    always produce the same rows"""
+    password_hash = make_password(PASSWORD)
+    MarketplaceSeeder(seed=seed, sellers=scaled(SELLERS, scale), items=scaled(ITEMS, scale), buyers=scaled(BUYERS, scale),
+                      orders=scaled(ORDERS, scale), password_hash=password_hash).run()
+    admin = User.objects.create(username='admin@jengabay.com', password=password_hash, is_staff=True, is_superuser=True)
+
+    # the endpoints act as the seller and buyer of the first order
+    order = Order.objects.select_related(
+        'payment_transaction__recipient__profile', 'payment_transaction__recipient__sub_county__county',
+        'payment_transaction__payer__profile').order_by('id').first()
+    seller, buyer = order.payment_transaction.recipient, order.payment_transaction.payer
+    item = Item.objects.filter(item_seller=seller).order_by('id').first()
+    tokens = {user.id: Token.objects.create(user=user).key for user in (seller.profile, buyer.profile, admin)}
+    return Dataset(seller, buyer, item, order, admin, tokens)
+
+
+class Endpoint:
+    """a request sent to a route, `path` and `data` may be functions of the iteration number
+    returning a different path or payload per request, e.g. to create unique accounts"""
+
+    def __init__(self, name, path, method='get', data=None, user=None, format=None, status=200, headers=None):
+        self.name = name
+        self.path = path
+        self.method = method
+        self.data = data
+        self.user = user
+        self.format = format
+        self.status = status
+        self.headers = headers
+
+    def get_path(self, iteration):
+        return self.path(iteration) if callable(self.path) else self.path
+
+    def send(self, client, dataset, iteration):
+        data = self.data(iteration) if callable(self.data) else self.data
+        headers = dict(self.headers(iteration) if callable(self.headers) else self.headers or {})
+        if self.user is not None:
+            headers['Authorization'] = 'Token ' + dataset.tokens[self.user.id]
+        response = getattr(client, self.method)(self.get_path(iteration), data, format=self.format, headers=headers)
+        if response.streaming:
+            b''.join(response.streaming_content)
+        return response
+
+
+def import_file(iteration):
+    rows = ['item_name,item_price,item_measurement_unit,category,sku']
+    rows += ['Imported {0} {1},{2},bag,cement,B-{0}-{1}'.format(iteration, number, 100 + number) for number in range(20)]
+    return {'file': SimpleUploadedFile('items.csv', '\n'.join(rows).encode())}
+
+
+def build_endpoints(dataset):
+    """returns the endpoints requested by the benchmark, one or more per route"""
+    seller, buyer, item, order = dataset.seller, dataset.buyer, dataset.item, dataset.order
+    sub_county = seller.sub_county
+    return [
+        Endpoint('create_seller_account', '/create_seller_account', 'post', format='json', status=201, data=lambda n: {
+            'profile': {'username': 'new-seller{}@jengabay.com'.format(n), 'password': PASSWORD,
+                        'email': 'new-seller{}@jengabay.com'.format(n)},
+            'sub_county': {'subcounty_name': sub_county.subcounty_name,
+                           'county': {'county_name': sub_county.county.county_name, 'code': sub_county.county.code}},
+            'business_name': 'New supplies {}'.format(n), 'business_reg_no': 'BN-NEW', 'phone_number': '0700000000',
+            'town': 'Town', 'local_area_name': 'Area', 'street': 'Street', 'building': 'Building',
+        }),
+        Endpoint('sellers', '/sellers/'),
+        Endpoint('seller', '/sellers/{}'.format(seller.id)),
+        Endpoint('seller_profile', '/sellers/{}/profile'.format(seller.id), user=seller.profile),
+        Endpoint('items', '/items'),
+        Endpoint('items_search', '/items?search=cement'),
+        Endpoint('items_category', '/items?category=cement'),
+        Endpoint('items_facets', '/items?facets=true'),
+        Endpoint('items_price_range', '/items?category=cement&min_price=500&max_price=5000&ordering=item_price'),
+        Endpoint('items_sparse', '/items?fields=id,item_name,item_price,item_main_image,item_seller.business_name'),
+        Endpoint('item_view', '/items/{}'.format(item.id)),
+        Endpoint('seller_items', '/sellers/{}/items'.format(seller.id)),
+        Endpoint('seller_items_search', '/sellers/{}/items?search=premium'.format(seller.id)),
+        Endpoint('add_item', '/sellers/{}/items/add_item'.format(seller.id), 'post', user=seller.profile, status=201,
+                 data=lambda n: {'item_name': 'Benchmark cement {}'.format(n), 'item_price': 750.0,
+                                 'item_measurement_unit': 'bag', 'category': 'cement'}),
+        Endpoint('import_items', '/sellers/{}/items/import'.format(seller.id), 'post', user=seller.profile,
+                 data=import_file, format='multipart'),
+        Endpoint('seller_specific_item', '/sellers/{}/items/{}'.format(seller.id, item.id), user=seller.profile),
+        Endpoint('seller_sales', '/sellers/{}/sales'.format(seller.id), user=seller.profile),
+        Endpoint('create_buyer', '/create_buyer', 'post', format='json', status=201, data=lambda n: {
+            'profile': {'username': 'new-buyer{}@jengabay.com'.format(n), 'password': PASSWORD,
+                        'email': 'new-buyer{}@jengabay.com'.format(n)},
+            'phone_number': '0711111111',
+        }),
+        Endpoint('buyer_profile', '/buyers/{}/profile'.format(buyer.id), user=buyer.profile),
+        Endpoint('buyer', '/buyers/{}'.format(buyer.id)),
+        Endpoint('submit_order', '/submit_order', 'post', user=buyer.profile, format='json', status=201, data={
+            'ordered_items': [item.id], 'total_amount_payable': item.item_price,
+            'payment_transaction': {'transaction_mode': 'm-pesa', 'amount': item.item_price,
+                                    'transaction_code': 'QX-BENCH', 'recipient': seller.id},
+        }),
+        Endpoint('orders', '/sellers/{}/orders'.format(seller.id), user=seller.profile),
+        Endpoint('orders_sparse', '/sellers/{}/orders?fields=id,date_placed,total_amount_payable,is_delivered'.format(seller.id),
+                 user=seller.profile),
+        Endpoint('orders_by_date', '/sellers/{}/orders?ordering=-date_placed&date_placed_after={}'.format(
+            seller.id, localdate() - timedelta(days=90)), user=seller.profile),
+        # toggles the delivery of the seller's orders, every other request marks them pending again
+        Endpoint('fulfil_orders', '/sellers/{}/orders/fulfil'.format(seller.id), 'post', user=seller.profile, format='json',
+                 data=lambda n: {'filter': {'date_placed_before': str(localdate())}, 'is_delivered': n % 2 == 0}),
+        Endpoint('export_orders', '/sellers/{}/orders/export'.format(seller.id), user=seller.profile),
+        Endpoint('export_transactions', '/sellers/{}/transactions/export?format=jsonl&date_placed_after={}'.format(
+            seller.id, localdate() - timedelta(days=90)), user=seller.profile),
+        Endpoint('order_edit', '/sellers/{}/orders/{}/edit'.format(seller.id, order.id), user=seller.profile),
+        Endpoint('order', '/sellers/{}/orders/{}'.format(seller.id, order.id), user=seller.profile),
+        Endpoint('buyer_orders', '/buyers/{}/orders'.format(buyer.id), user=buyer.profile),
+        Endpoint('login', '/login', 'post', data={'username': seller.profile.username, 'password': PASSWORD}),
+        # signed tokens are issued without a query, every logout revokes a new one
+        Endpoint('orders_signed_token', '/sellers/{}/orders'.format(seller.id), headers={
+            'Authorization': 'Token ' + signed_tokens.issue(seller.profile_id, 'seller', seller.id, 0)}),
+        Endpoint('logout', '/logout', 'post', headers=lambda n: {
+            'Authorization': 'Token ' + signed_tokens.issue(buyer.profile_id, 'buyer', buyer.id, 0)}),
+        Endpoint('cache_stats', '/stats/cache', user=dataset.admin),
+    ]
+
+
+class QueryRecorder:
+    """counts and times the SQL queries run on a connection, installed with execute_wrapper()"""
+
+    def __init__(self):
+        self.count = 0
+        self.time = 0.0
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.count += 1
+            self.time += time.perf_counter() - started
+
+
+def measure(endpoint, dataset, requests, warmup=0, client=None):
+    """sends `warmup` and then `requests` requests to the endpoint and returns its measurements,
+    the peak memory is measured on one more request since tracing slows requests down"""
+    client = client or APIClient()
+    for iteration in range(warmup):
+        endpoint.send(client, dataset, iteration)
+
+    latencies = []
+    errors = 0
+    recorder = QueryRecorder()
+    with connection.execute_wrapper(recorder):
+        started = time.perf_counter()
+        for iteration in range(warmup, warmup + requests):
+            request_started = time.perf_counter()
+            response = endpoint.send(client, dataset, iteration)
+            latencies.append(time.perf_counter() - request_started)
+            errors += response.status_code != endpoint.status
+        elapsed = time.perf_counter() - started
+
+    tracemalloc.start()
+    try:
+        endpoint.send(client, dataset, warmup + requests)
+        peak_memory = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+    latencies.sort()
+    return {
+        'method': endpoint.method.upper(),
+        'path': endpoint.get_path(warmup),
+        'requests': requests,
+        'errors': errors,
+        'p50_ms': percentile(latencies, 0.5) * 1000,
+        'p95_ms': percentile(latencies, 0.95) * 1000,
+        'p99_ms': percentile(latencies, 0.99) * 1000,
+        'throughput': requests / elapsed,
+        'queries': recorder.count / requests,
+        'query_ms': recorder.time * 1000 / requests,
+        'peak_memory_kb': peak_memory / 1024,
+    }
+
+
+def run_benchmarks(dataset, requests=50, warmup=5, names=None):
+    """measures the endpoints of the dataset, or the ones named in `names`, and returns {name: measurements}"""
+    results = {}
+    for endpoint in build_endpoints(dataset):
+        if names and endpoint.name not in names:
+            continue
+        results[endpoint.name] = measure(endpoint, dataset, requests, warmup)
+    return results
+
+
+def compare(results, baseline, threshold=20):
+    """compares the endpoints of two runs and returns the rows of (name, metric, baseline value,
+    value, change in percent, regressed) for the p95 latency, throughput and query count. Latencies
+    regress when they grow more than `threshold` percent, query counts on any increase"""
+    rows = []
+    for name, current in results.items():
+        previous = baseline.get(name)
+        if previous is None:
+            continue
+        for metric, limit in (('p95_ms', threshold), ('throughput', -threshold), ('queries', 0)):
+            if previous[metric]:
+                change = (current[metric] - previous[metric]) * 100 / previous[metric]
+            else:
+                change = math.inf if current[metric] else 0.0
+            regressed = change < limit if limit < 0 else change > limit
+            rows.append((name, metric, previous[metric], current[metric], change, regressed))
+    return rows
+
+
+# the renderers and parsers compared by run_render_benchmarks()
+JSON_CODECS = {'drf': (JSONRenderer, JSONParser), 'fast': (FastJSONRenderer, FastJSONParser)}
+
+
+def item_page(size):
+    """returns the data of an /items page of the first `size` listings, as AllItemsListView serializes it"""
+    request = APIRequestFactory().get('/items', {'page_size': size})
+    listings = ItemListing.objects.order_by('item_id')[:size]
+    results = ItemListingSerializer(listings, many=True, context={'request': request}).data
+    return {'next': request.build_absolute_uri('/items?cursor=cD0xMDA%3D'), 'previous': None, 'results': results}
+
+
+def time_calls(function, repeat):
+    """returns the sorted durations of `repeat` calls of a function, in milliseconds"""
+    durations = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        function()
+        durations.append((time.perf_counter() - started) * 1000)
+    return sorted(durations)
+
+
+def run_render_benchmarks(sizes=(100, 1000, 10000), repeat=20):
+    """renders and parses /items pages of every size with every codec of JSON_CODECS and returns
+    {size: {codec: measurements}}, telling for every codec whether its output is byte for byte
+    the one of DRF's JSONRenderer"""
+    results = {}
+    for size in sizes:
+        data = item_page(size)
+        expected = JSONRenderer().render(data)
+        results[size] = {}
+        for name, (renderer_class, parser_class) in JSON_CODECS.items():
+            renderer, parser = renderer_class(), parser_class()
+            content = renderer.render(data)
+            render_times = time_calls(lambda: renderer.render(data), repeat)
+            parse_times = time_calls(lambda: parser.parse(io.BytesIO(content)), repeat)
+            results[size][name] = {
+                'items': len(data['results']),
+                'bytes': len(content),
+                'identical': content == expected,
+                'render_p50_ms': percentile(render_times, 0.5),
+                'render_min_ms': render_times[0],
+                'parse_p50_ms': percentile(parse_times, 0.5),
+                'parse_min_ms': parse_times[0],
+            }
+    return results
@@ -0,0 +1,141 @@
+"""Versioned response cache for the public catalog endpoints.
+
+Cached responses are keyed on the request path, the normalized query parameters and
+the current version of every scope the response depends on (e.g. 'items:category:<name>',
+'item:<id>', 'seller:<id>'). Writes bump the versions of the scopes they affect
+through model signals, which orphans exactly the responses built from the old rows;
+orphaned entries age out of the bounded cache.
+"""
+import hashlib
+import threading
+import uuid
+from urllib.parse import quote
+
+from django.conf import settings
+from django.core.cache import caches
+from .models import Item
+
+
+CATEGORIES = frozenset(category for category, label in Item.options)
+
+
+def item_scopes(item_id, seller_id, categories):
+    """returns the scopes holding the representation of an item, the catalog pages
+    listing it are the ones of its categories, see catalog_scopes()"""
+    return ['item:{}'.format(item_id), 'seller-items:{}'.format(seller_id)] + category_scopes(categories)
+
+
+def category_scopes(categories):
+    """returns the scopes of the catalog pages listing items of the categories, with 'items'
+    for categories that are not among the options, listed by the pages of every category"""
+    categories = set(categories)
+    scopes = ['items:category:{}'.format(category) for category in categories]
+    if not categories <= CATEGORIES:
+        scopes.append('items')
+    return scopes
+
+
+def catalog_scopes(category=None):
+    """returns the scopes of a catalog page of a category, pages of every category
+    depend on all of them so an edit only evicts the pages of its own category"""
+    if category:
+        return category_scopes([category])
+    return ['items'] + category_scopes(CATEGORIES)
+
+
+def seller_items_scopes(seller_ids, rows):
+    """returns the scopes holding the representation of sellers and of their items,
+    `rows` being the (item id, seller id, category) of these items"""
+    scopes = ['sellers'] + ['seller:{}'.format(seller_id) for seller_id in seller_ids]
+    for item_id, seller_id, category in rows:
+        scopes += item_scopes(item_id, seller_id, [category])
+    return scopes
+
+
+def version_key(scope):
+    """returns the cache key of the version of a scope, category names hold spaces,
+    which memcached does not accept in keys"""
+    return 'version:' + quote(scope, safe=':')
+
+
+class ResponseCache:
+    """Stores rendered responses under keys built from the versions of their scopes,
+    and counts the hits and misses of this process"""
+
+    def __init__(self, alias):
+        self.alias = alias
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+    @property
+    def cache(self):
+        return caches[self.alias]
+
+    def get_versions(self, scopes):
+        """returns the current version of every scope, a scope whose version is not
+        stored (never bumped or evicted) gets a fresh one"""
+        version_keys = [version_key(scope) for scope in scopes]
+        versions = self.cache.get_many(version_keys)
+        missing = {key: uuid.uuid4().hex for key in version_keys if key not in versions}
+        if missing:
+            self.cache.set_many(missing, timeout=None)
+            versions.update(missing)
+        return [versions[key] for key in version_keys]
+
+    async def aget_versions(self, scopes):
+        version_keys = [version_key(scope) for scope in scopes]
+        versions = await self.cache.aget_many(version_keys)
+        missing = {key: uuid.uuid4().hex for key in version_keys if key not in versions}
+        if missing:
+            await self.cache.aset_many(missing, timeout=None)
+            versions.update(missing)
+        return [versions[key] for key in version_keys]
+
+    def bump(self, scopes):
+        """invalidates every cached response depending on one of the scopes"""
+        if scopes:
+            self.cache.set_many({version_key(scope): uuid.uuid4().hex for scope in set(scopes)}, timeout=None)
+
+    def build_key(self, request, renderer_format, versions):
+        query = sorted((key, value) for key, values in request.query_params.lists() for value in values if value != '')
+        parts = [request.path, repr(query), renderer_format] + versions
+        return 'response:' + hashlib.md5('|'.join(parts).encode()).hexdigest()
+
+    def make_key(self, request, scopes, renderer_format):
+        return self.build_key(request, renderer_format, self.get_versions(scopes))
+
+    async def amake_key(self, request, scopes, renderer_format):
+        return self.build_key(request, renderer_format, await self.aget_versions(scopes))
+
+    def count(self, entry):
+        with self._lock:
+            if entry is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+        return entry
+
+    def get(self, key):
+        return self.count(self.cache.get(key))
+
+    async def aget(self, key):
+        return self.count(await self.cache.aget(key))
+
+    def set(self, key, entry):
+        self.cache.set(key, entry)
+
+    def clear(self):
+        self.cache.clear()
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_ratio': self.hits / lookups if lookups else 0.0,
+            }
+
+
+response_cache = ResponseCache(getattr(settings, 'RESPONSE_CACHE_ALIAS', 'default'))
@@ -0,0 +1,76 @@
+"""Streaming exports of the orders and transactions of a seller.
+
+The rows are read with a server-side cursor `BATCH_SIZE` rows at a time
+(`QuerySet.iterator()`), and the orders and ordered item ids of every batch are fetched
+with one prefetch query each, so an export holds one batch of rows in memory whatever its
+size. The rows are flat dicts rendered by jengabay.renderers.
+"""
+from django.db.models import Prefetch
+from rest_framework.fields import DateTimeField
+from .models import Item, Order, Transaction
+
+BATCH_SIZE = 2000
+
+ORDER_FIELDS = ['id', 'date_placed', 'total_amount_payable', 'is_delivered', 'date_delivered',
+                'transaction_id', 'transaction_code', 'transaction_mode', 'amount', 'payer', 'ordered_items']
+
+TRANSACTION_FIELDS = ['id', 'transaction_code', 'transaction_mode', 'amount', 'recipient', 'payer',
+                      'date_placed', 'orders', 'ordered_items']
+
+# dates are written as the apis return them
+_datetime = DateTimeField()
+
+
+def ordered_item_ids():
+    return Prefetch('ordered_items', queryset=Item.objects.only('id').order_by('pk'))
+
+
+def seller_orders(seller):
+    """returns the orders paid to the seller, oldest first, with the relations walked by `order_rows()`"""
+    return (Order.objects.filter(payment_transaction__recipient=seller).select_related('payment_transaction')
+            .prefetch_related(ordered_item_ids()).order_by('pk'))
+
+
+def seller_transactions(seller):
+    """returns the transactions paid to the seller, oldest first, with the relations walked by `transaction_rows()`"""
+    orders = Order.objects.only('id', 'date_placed', 'payment_transaction').prefetch_related(ordered_item_ids())
+    return (Transaction.objects.filter(recipient=seller)
+            .prefetch_related(Prefetch('order_set', queryset=orders.order_by('pk'))).order_by('pk'))
+
+
+def order_rows(orders):
+    """yields the rows of the orders of a `seller_orders()` queryset"""
+    for order in orders.iterator(chunk_size=BATCH_SIZE):
+        payment = order.payment_transaction
+        yield {
+            'id': order.id,
+            'date_placed': _datetime.to_representation(order.date_placed),
+            'total_amount_payable': order.total_amount_payable,
+            'is_delivered': order.is_delivered,
+            'date_delivered': _datetime.to_representation(order.date_delivered),
+            'transaction_id': payment.id,
+            'transaction_code': payment.transaction_code,
+            'transaction_mode': payment.transaction_mode,
+            'amount': payment.amount,
+            'payer': payment.payer_id,
+            'ordered_items': [item.id for item in order.ordered_items.all()],
+        }
+
+
+def transaction_rows(transactions):
+    """yields the rows of the transactions of a `seller_transactions()` queryset, with the ids of
+    the orders they paid for, the date the first one was placed and the ids of their items"""
+    for payment in transactions.iterator(chunk_size=BATCH_SIZE):
+        orders = payment.order_set.all()
+        dates = [order.date_placed for order in orders if order.date_placed is not None]
+        yield {
+            'id': payment.id,
+            'transaction_code': payment.transaction_code,
+            'transaction_mode': payment.transaction_mode,
+            'amount': payment.amount,
+            'recipient': payment.recipient_id,
+            'payer': payment.payer_id,
+            'date_placed': _datetime.to_representation(min(dates)) if dates else None,
+            'orders': [order.id for order in orders],
+            'ordered_items': [item.id for order in orders for item in order.ordered_items.all()],
+        }
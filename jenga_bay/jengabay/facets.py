@@ -0,0 +1,129 @@
+"""Category, county and sub county facet counts of the item catalog.
+
+ItemFacetCount holds the number of items per (category, sub county) cell and is kept up
+to date incrementally by signals, see jengabay.signals. The counts of the whole catalog,
+or of one category, are folded from these cells without touching the items. Other
+filtered results (e.g. searches) are counted with a single GROUP BY over the matching
+item listings.
+"""
+from collections import Counter
+
+from django.db import transaction
+from django.db.models import Count, F
+from .models import Item, ItemFacetCount, ItemListing, Seller, SubCounty
+
+
+def add_items(cells, delta=1):
+    """adds `delta` items to every (category, sub county id) cell listed in `cells`,
+    a cell listed n times is incremented n times"""
+    for (category, sub_county_id), count in Counter(cells).items():
+        if delta > 0:
+            # the cell is created empty and incremented in place, concurrent writes never overwrite each other
+            ItemFacetCount.objects.bulk_create(
+                [ItemFacetCount(category=category, sub_county_id=sub_county_id)], ignore_conflicts=True)
+        ItemFacetCount.objects.filter(category=category, sub_county_id=sub_county_id).update(
+            item_count=F('item_count') + delta * count)
+
+
+def move_items(old_cells, new_cells):
+    """moves items from their `old_cells` to their `new_cells`, skipping the ones that stay"""
+    removed = Counter(old_cells)
+    added = Counter(new_cells)
+    add_items((removed - added).elements(), -1)
+    add_items((added - removed).elements(), 1)
+
+
+def seller_sub_county(seller_id):
+    return Seller.objects.filter(pk=seller_id).values_list('sub_county_id', flat=True).first()
+
+
+def item_cell(item):
+    """returns the (category, sub county id) cell counting an item, None if its seller is gone"""
+    if Item.item_seller.is_cached(item):
+        sub_county_id = item.item_seller.sub_county_id
+    else:
+        sub_county_id = seller_sub_county(item.item_seller_id)
+    return None if sub_county_id is None else (item.category, sub_county_id)
+
+
+def move_seller_items(seller_id, old_sub_county_id, new_sub_county_id):
+    """moves the items of a seller that changed location to the cells of the new sub county"""
+    categories = list(Item.objects.filter(item_seller=seller_id).values_list('category', flat=True))
+    add_items([(category, old_sub_county_id) for category in categories], -1)
+    add_items([(category, new_sub_county_id) for category in categories], 1)
+
+
+def rebuild_sub_county_counts(sub_county_id):
+    """recounts the cells of a sub county from its items, after bulk writes that skipped the item signals"""
+    rows = Item.objects.filter(item_seller__sub_county=sub_county_id).order_by().values_list(
+        'category').annotate(count=Count('id'))
+    with transaction.atomic():
+        ItemFacetCount.objects.filter(sub_county=sub_county_id).delete()
+        ItemFacetCount.objects.bulk_create([
+            ItemFacetCount(category=category, sub_county_id=sub_county_id, item_count=count)
+            for category, count in rows
+        ])
+
+
+def rebuild_counts():
+    """recounts the cells of every sub county and returns the number of sub counties"""
+    sub_county_ids = list(SubCounty.objects.values_list('id', flat=True))
+    for sub_county_id in sub_county_ids:
+        rebuild_sub_county_counts(sub_county_id)
+    return len(sub_county_ids)
+
+
+def catalog_rows(category=None):
+    """returns the (category, sub county id, count) rows of the whole catalog, or of a category,
+    from the precomputed cells"""
+    cells = ItemFacetCount.objects.filter(item_count__gt=0)
+    if category is not None:
+        cells = cells.filter(category=category)
+    return cells.values_list('category', 'sub_county_id', 'item_count')
+
+
+def queryset_rows(queryset):
+    """returns the (category, sub county id, count) rows of the listings of a filtered queryset"""
+    listings = ItemListing.objects.filter(pk__in=queryset.values('pk')).order_by()
+    return listings.values_list('category', 'sub_county_id').annotate(count=Count('pk'))
+
+
+def build_facets(rows):
+    """folds (category, sub county id, count) rows into the category, county and sub county facets"""
+    rows = list(rows)
+    sub_county_ids = {sub_county_id for category, sub_county_id, count in rows}
+    return fold_facets(rows, SubCounty.objects.select_related('county').in_bulk(sub_county_ids) if rows else {})
+
+
+async def abuild_facets(rows):
+    rows = [row async for row in rows]
+    sub_county_ids = {sub_county_id for category, sub_county_id, count in rows}
+    return fold_facets(rows, await SubCounty.objects.select_related('county').ain_bulk(sub_county_ids) if rows else {})
+
+
+def fold_facets(rows, sub_counties):
+    """returns the facets listing their values by descending count, `sub_counties` maps the sub
+    county ids of the rows to the sub counties"""
+    categories = Counter()
+    sub_county_counts = Counter()
+    for category, sub_county_id, count in rows:
+        categories[category] += count
+        sub_county_counts[sub_county_id] += count
+
+    counties = {}
+    county_counts = Counter()
+    for sub_county_id, count in sub_county_counts.items():
+        county = sub_counties[sub_county_id].county
+        counties[county.id] = county
+        county_counts[county.id] += count
+
+    labels = dict(Item.options)
+    return {
+        'category': [{'value': category, 'label': labels.get(category, category), 'count': count}
+                     for category, count in sorted(categories.items(), key=lambda entry: (-entry[1], entry[0]))],
+        'county': [{'id': county_id, 'name': counties[county_id].county_name, 'count': count}
+                   for county_id, count in sorted(county_counts.items(), key=lambda entry: (-entry[1], entry[0]))],
+        'sub_county': [{'id': sub_county_id, 'name': sub_counties[sub_county_id].subcounty_name,
+                        'county': sub_counties[sub_county_id].county_id, 'count': count}
+                       for sub_county_id, count in sorted(sub_county_counts.items(), key=lambda entry: (-entry[1], entry[0]))],
+    }
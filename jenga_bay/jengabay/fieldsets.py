@@ -0,0 +1,235 @@
+"""Sparse fieldsets and opt-in expansion of nested relations.
+
+The item, seller, order and transaction apis read two query parameters:
+
+- `fields` lists the fields to return, comma separated. Dotted paths select the fields of
+  nested relations, e.g. `fields=item_name,item_price,item_seller.business_name`.
+- `expand` lists relations returned as ids by default to return nested instead, e.g.
+  `expand=recipient` on transactions. Dotted paths expand the relations of those, and a
+  dotted path in `fields` expands the relations it goes through.
+
+Without them the responses are unchanged. Serializers taking part mix in
+FieldsetSerializerMixin, their `expandable_fields` map relations to the serializer
+expanding them. Views mixing in FieldsetViewMixin hand the requested Fieldset to their
+serializer and load only what it returns: `shape_queryset()` walks the fields of the
+serializer to restrict the columns with `only()`, join the nested relations with
+`select_related()` and prefetch the many relations, dropping the relations of the view
+queryset that are not returned.
+"""
+from django.core.exceptions import FieldDoesNotExist
+from django.db.models import Prefetch
+from rest_framework import serializers
+from rest_framework.relations import ManyRelatedField, RelatedField
+
+
+def parse_paths(value):
+    """returns comma separated dotted paths as a tree of nested dicts,
+    e.g. 'a,b.c,b.d' as {'a': {}, 'b': {'c': {}, 'd': {}}}"""
+    tree = {}
+    for path in value.split(','):
+        node = tree
+        for name in path.strip().split('.'):
+            if name:
+                node = node.setdefault(name.strip(), {})
+    return tree
+
+
+class Fieldset:
+    """The fields to return from a serializer and the relations to expand, `fields` is None
+    to return every field, both are trees of nested dicts as parsed by `parse_paths()`"""
+
+    def __init__(self, fields=None, expand=None, path=''):
+        self.fields = fields
+        self.expand = expand or {}
+        self.path = path
+
+    @classmethod
+    def from_query_params(cls, query_params):
+        """returns the fieldset requested by the `fields` and `expand` parameters, None without them"""
+        fields = query_params.get('fields')
+        expand = query_params.get('expand')
+        if not fields and not expand:
+            return None
+        return cls(parse_paths(fields) if fields else None, parse_paths(expand or ''))
+
+    def child(self, name):
+        """returns the fieldset of a nested relation, None if it is returned in full"""
+        fields = self.fields.get(name) if self.fields is not None else None
+        expand = self.expand.get(name)
+        if not fields and not expand:
+            return None
+        return Fieldset(fields or None, expand, '{}{}.'.format(self.path, name))
+
+    def paths(self, names):
+        return ', '.join(self.path + name for name in sorted(names))
+
+
+class FieldsetSerializerMixin:
+    """A mixin for model serializers returning the fields and expanding the relations of the
+    requested Fieldset: the one in the 'fieldset' context of the root serializer, nested
+    serializers get theirs from their parent. `expandable_fields` maps relation fields to
+    functions returning the serializer expanding them"""
+
+    expandable_fields = {}
+
+    def get_fieldset(self):
+        parent = self.parent.parent if isinstance(self.parent, serializers.ListSerializer) else self.parent
+        if parent is None:
+            return self.context.get('fieldset')
+        return getattr(self, 'fieldset', None)
+
+    def get_fields(self):
+        fields = super().get_fields()
+        fieldset = self.get_fieldset()
+        if fieldset is None:
+            return fields
+
+        # a dotted path in `fields` expands the relation it goes through,
+        # relations nested by default are only gone through
+        selected = fieldset.fields or {}
+        expand = set(fieldset.expand) | {name for name, nested in selected.items()
+                                         if nested and name in self.expandable_fields}
+        expand = {name for name in expand if name not in fields or nested_serializer(fields[name]) is None}
+        unknown = expand - set(self.expandable_fields)
+        if unknown:
+            raise serializers.ValidationError({'expand': ['Cannot expand {}.'.format(fieldset.paths(unknown))]})
+        for name in expand:
+            fields[name] = self.expandable_fields[name]()
+
+        if fieldset.fields is not None:
+            unknown = set(selected) - set(fields)
+            # only nested relations have fields to select
+            unknown |= {name for name, nested in selected.items()
+                        if nested and name in fields and nested_serializer(fields[name]) is None}
+            if unknown:
+                raise serializers.ValidationError({'fields': ['Unknown fields {}.'.format(fieldset.paths(unknown))]})
+            fields = {name: field for name, field in fields.items() if name in selected}
+
+        for name, field in fields.items():
+            nested = nested_serializer(field)
+            if isinstance(nested, FieldsetSerializerMixin):
+                nested.fieldset = fieldset.child(name)
+        return fields
+
+
+class FieldsetViewMixin:
+    """A mixin for views reading their serializer's fieldset from the query parameters of
+    GET requests, their queryset only loads the returned fields, see `shape_queryset()`.
+    Objects looked up with `get_object()` keep the view's queryset, as their object
+    permissions may read relations the fieldset leaves out"""
+
+    # whether filter_queryset() shapes the queryset to the fieldset
+    shape_fieldset_queryset = True
+
+    def get_fieldset(self):
+        if self.request.method not in ('GET', 'HEAD'):
+            return None
+        if not hasattr(self, '_fieldset'):
+            self._fieldset = Fieldset.from_query_params(self.request.query_params)
+        return self._fieldset
+
+    def get_serializer_context(self):
+        context = super().get_serializer_context()
+        context['fieldset'] = self.get_fieldset()
+        return context
+
+    def filter_queryset(self, queryset):
+        queryset = super().filter_queryset(queryset)
+        if self.get_fieldset() is None or not self.shape_fieldset_queryset:
+            return queryset
+        return self.shape_queryset(queryset, self.get_serializer())
+
+    def get_object(self):
+        # a single row, e.g. an order whose payment transaction HasSellerPermission reads
+        self.shape_fieldset_queryset = False
+        return super().get_object()
+
+    def get_required_columns(self):
+        """returns the columns the view reads besides the serialized ones, its orderings and validators"""
+        orderings = list(getattr(self, 'ordering_fields', None) or [])
+        orderings += list(getattr(self.pagination_class, 'ordering', None) or [])
+        orderings += list(getattr(self, 'validator_fields', None) or [])
+        return [ordering.lstrip('-') for ordering in orderings]
+
+    def shape_queryset(self, queryset, serializer):
+        return shape_queryset(queryset, serializer, self.get_required_columns())
+
+
+def nested_serializer(field):
+    """returns the serializer of a nested relation field, many or not, None for other fields"""
+    if isinstance(field, serializers.ListSerializer):
+        field = field.child
+    return field if isinstance(field, serializers.Serializer) else None
+
+
+def collect_lookups(serializer, model, prefix, columns, related, prefetches):
+    """adds the lookups of the columns and relations `serializer` reads from `model`, reached
+    through `prefix`, to the lists. Returns False if the columns of a field are unknown"""
+    known = True
+    for field in serializer.fields.values():
+        if field.write_only:
+            continue
+        if field.source == '*':
+            # fields of the whole instance, e.g. ImageDerivativesField, may name the columns they read
+            source_fields = getattr(field, 'get_source_fields', None)
+            if source_fields is None:
+                known = False
+            else:
+                columns.extend(prefix + name for name in source_fields(model))
+            continue
+
+        name = field.source_attrs[0]
+        try:
+            model_field = model._meta.get_field(name)
+        except FieldDoesNotExist:
+            known = False
+            continue
+        if isinstance(field, (serializers.ListSerializer, ManyRelatedField)):
+            # to-many relations are prefetched, with only the ids of the related rows unless nested
+            child = field.child if isinstance(field, serializers.ListSerializer) else None
+            queryset = model_field.related_model._default_manager.all()
+            queryset = shape_queryset(queryset, child) if child is not None else queryset.only('pk')
+            prefetches.append(Prefetch(prefix + name, queryset=queryset))
+        elif isinstance(field, serializers.Serializer):
+            columns.append(prefix + name)
+            related.append(prefix + name)
+            known &= collect_lookups(field, model_field.related_model, prefix + name + '__', columns, related, prefetches)
+        elif isinstance(field, RelatedField) or model_field.concrete:
+            columns.append(prefix + name)
+        else:
+            known = False
+    return known
+
+
+def required_lookups(serializer):
+    """returns the (columns, related, prefetches) lookups serializing with `serializer` reads,
+    columns is None if some are unknown"""
+    columns, related, prefetches = [], [], []
+    known = collect_lookups(serializer, serializer.Meta.model, '', columns, related, prefetches)
+    return (columns if known else None), related, prefetches
+
+
+def shape_queryset(queryset, serializer, required_columns=()):
+    """returns the queryset loading only the columns and relations `serializer` returns, with
+    the `required_columns` of the queryset model the caller reads"""
+    columns, related, prefetches = required_lookups(serializer)
+    queryset = queryset.select_related(None).prefetch_related(None)
+    if related:
+        queryset = queryset.select_related(*related)
+    if prefetches:
+        queryset = queryset.prefetch_related(*prefetches)
+    if columns is not None:
+        queryset = queryset.only(*columns, *concrete_columns(queryset.model, required_columns))
+    return queryset
+
+
+def concrete_columns(model, names):
+    """returns the names of concrete fields of the model among `names`"""
+    columns = []
+    for name in names:
+        try:
+            if model._meta.get_field(name).concrete:
+                columns.append(name)
+        except FieldDoesNotExist:
+            pass
+    return columns
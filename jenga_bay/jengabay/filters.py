@@ -0,0 +1,66 @@
+"""Filters and orderings of the item and order lists.
+
+The filters and orderings offered are the ones the indexes of the listed tables serve,
+e.g. a category of the catalog with a price range reads the (category, item_price)
+index of the item listings.
+"""
+from django_filters import rest_framework as django_filters
+from rest_framework import filters
+from .models import Item, ItemListing, Order, Transaction
+
+
+class ItemFilter(django_filters.FilterSet):
+    """filters items by category and by an inclusive price range"""
+
+    min_price = django_filters.NumberFilter(field_name='item_price', lookup_expr='gte')
+    max_price = django_filters.NumberFilter(field_name='item_price', lookup_expr='lte')
+
+    class Meta:
+        model = Item
+        fields = ['category', 'min_price', 'max_price']
+
+
+class ItemListingFilter(ItemFilter):
+    """filters the catalog listings as ItemFilter filters items"""
+
+    class Meta(ItemFilter.Meta):
+        model = ItemListing
+
+
+class OrderFilter(django_filters.FilterSet):
+    """filters orders by delivery and by the days they were placed on,
+    'date_placed_after' and 'date_placed_before' are inclusive dates"""
+
+    date_placed = django_filters.DateFromToRangeFilter()
+
+    class Meta:
+        model = Order
+        fields = ['is_delivered', 'date_placed']
+
+
+class TransactionFilter(django_filters.FilterSet):
+    """filters transactions by the days their orders were placed on, as OrderFilter filters orders"""
+
+    date_placed = django_filters.DateFromToRangeFilter(field_name='order__date_placed', distinct=True)
+
+    class Meta:
+        model = Transaction
+        fields = ['date_placed']
+
+
+class KeysetOrderingFilter(filters.OrderingFilter):
+    """Orders a list by the field requested in the `ordering` parameter, one of the view's
+    `ordering_fields` optionally prefixed with '-' for a descending order. The primary key
+    breaks ties in the same direction, so the ordering is unique as cursor pagination needs.
+    Without a valid requested field the ordering is left to the other filters and the
+    pagination, unknown fields are ignored as DRF does"""
+
+    def get_ordering(self, request, queryset, view):
+        params = request.query_params.get(self.ordering_param)
+        if not params:
+            return None
+        fields = self.remove_invalid_fields(queryset, [params.split(',')[0].strip()], view, request)
+        if not fields:
+            return None
+        descending = fields[0].startswith('-')
+        return (fields[0], '-pk' if descending else 'pk')
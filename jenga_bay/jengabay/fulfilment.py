@@ -0,0 +1,42 @@
+"""Bulk fulfilment of the orders of a seller.
+
+`set_delivered()` marks many orders delivered (or pending again) with a single UPDATE limited
+to the orders paid to the seller, instead of one order round trip per order. The UPDATE skips
+the order signals, so the delivered counts of the sales summaries are adjusted here from one
+aggregate of the changed orders read in the same transaction.
+"""
+from django.db import transaction
+from django.db.models import Count
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+from . import analytics
+from .models import Order
+
+# order ids accepted per request
+MAX_ORDER_IDS = 1000
+
+
+def set_delivered(seller, orders, delivered=True):
+    """sets the delivery of the orders of a queryset paid to `seller` and returns the number of
+    orders changed and of the ones already in that state"""
+    owned = orders.filter(payment_transaction__recipient=seller)
+    changing = owned.exclude(is_delivered=delivered)
+    now = timezone.now()
+    with transaction.atomic():
+        matched = owned.count()
+        # the sales summaries count the orders on the day they were placed, orders without a date are not counted
+        day_counts = dict(changing.filter(date_placed__isnull=False).order_by().values_list(
+            TruncDate('date_placed')).annotate(count=Count('id')))
+        updated = changing.update(is_delivered=delivered, date_delivered=now if delivered else None, updated_at=now)
+        analytics.count_deliveries(seller.pk, day_counts, 1 if delivered else -1)
+    return updated, matched - updated
+
+
+def set_orders_delivered(seller, order_ids, delivered=True):
+    """sets the delivery of the listed orders, returns the counts of `set_delivered()` and
+    the requested ids rejected as missing or paid to another seller"""
+    order_ids = set(order_ids)
+    owned_ids = set(Order.objects.filter(pk__in=order_ids, payment_transaction__recipient=seller)
+                    .values_list('id', flat=True))
+    updated, unchanged = set_delivered(seller, Order.objects.filter(pk__in=owned_ids), delivered)
+    return updated, unchanged, sorted(order_ids - owned_ids)
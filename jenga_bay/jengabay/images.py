@@ -0,0 +1,158 @@
+"""Content addressed image storage and resized image derivatives.
+
+Uploaded files are stored under the sha256 digest of their content, so identical
+uploads share one file. Every uploaded image gets thumbnail and medium sized WebP and
+JPEG derivatives, rendered by the background workers of jengabay.tasks. The
+derivative names only depend on the name of the source image. They are only listed once
+rendered, which is looked up once per process for every image; the items and sellers
+showing an image are touched when its derivatives are rendered, so their cached
+responses list them from then on. A lookup finding them missing is not repeated for the
+rows that were not touched since.
+"""
+import hashlib
+import os
+import posixpath
+import re
+
+from django.core.files.storage import FileSystemStorage, default_storage
+from django.dispatch import Signal
+from django.utils import timezone
+from . import tasks
+from .models import Task
+
+DERIVATIVES_DIR = 'images/derivatives'
+
+# longest side in pixels of every derivative variant
+VARIANTS = {
+    'thumbnail': 320,
+    'medium': 1024,
+}
+
+# derivative formats with the file extension and save options used for them
+FORMATS = {
+    'webp': ('webp', {'quality': 80, 'method': 4}),
+    'jpeg': ('jpg', {'quality': 85, 'optimize': True, 'progressive': True}),
+}
+
+DIGEST_RE = re.compile(r'[0-9a-f]{64}')
+
+# sent with the `name` of a stored image once its derivatives are rendered
+derivatives_rendered = Signal()
+
+# keys of the images whose derivatives this process found rendered, derivatives never change
+_rendered = set()
+# keys of the images whose derivatives this process found missing, with the time of the lookup
+_missing = {}
+
+
+class ContentAddressedStorage(FileSystemStorage):
+    """A file system storage that names saved files after the sha256 digest of their content,
+    saving a file whose content is already stored returns the existing name"""
+
+    def save(self, name, content, max_length=None):
+        digest = hashlib.sha256()
+        for chunk in content.chunks():
+            digest.update(chunk)
+        content.seek(0)
+        directory, filename = posixpath.split(name.replace('\\', '/'))
+        extension = posixpath.splitext(filename)[1].lower()
+        name = posixpath.join(directory, digest.hexdigest() + extension)
+        if self.exists(name):
+            return name
+        return super().save(name, content, max_length)
+
+
+def derivative_key(name):
+    """returns the key naming the derivatives of a stored image, the content digest
+    for content addressed files and the digest of the name for others (e.g. the defaults)"""
+    stem = posixpath.splitext(posixpath.basename(name))[0]
+    if DIGEST_RE.fullmatch(stem):
+        return stem
+    return hashlib.sha256(name.encode()).hexdigest()
+
+
+def derivative_name(name, variant, image_format):
+    extension = FORMATS[image_format][0]
+    return '{}/{}/{}.{}'.format(DERIVATIVES_DIR, derivative_key(name), variant, extension)
+
+
+def is_rendered(name, updated_at=None):
+    """tells whether the derivatives of a stored image are rendered, looking up the one
+    rendered last until it is found. `updated_at` is the modification time of the row showing
+    the image, which rendering touches: a row not modified since the derivatives were found
+    missing skips the lookup"""
+    key = derivative_key(name)
+    if key in _rendered:
+        return True
+    missing_since = _missing.get(key)
+    if updated_at is not None and missing_since is not None and updated_at <= missing_since:
+        return False
+    looked_up_at = timezone.now()
+    variant, image_format = list(VARIANTS)[-1], list(FORMATS)[-1]
+    if not default_storage.exists(derivative_name(name, variant, image_format)):
+        _missing[key] = looked_up_at
+        return False
+    _rendered.add(key)
+    _missing.pop(key, None)
+    return True
+
+
+def derivative_sources(name, updated_at=None):
+    """returns the (src, srcset) of the rendered derivatives of a stored image, the url of the
+    largest JPEG and the [(url, width)] of the WebP variants, None until they are rendered"""
+    if not is_rendered(name, updated_at):
+        return None
+    variant = list(VARIANTS)[-1]
+    src = default_storage.url(derivative_name(name, variant, 'jpeg'))
+    srcset = [(default_storage.url(derivative_name(name, variant, 'webp')), size) for variant, size in VARIANTS.items()]
+    return src, srcset
+
+
+def render_derivatives(source_path, targets):
+    """renders the derivatives of the image at source_path,
+    targets being a list of (variant, format, path) tuples.
+    Runs in the worker processes so it only works with plain paths"""
+    from PIL import Image, ImageOps
+
+    with Image.open(source_path) as image:
+        image = ImageOps.exif_transpose(image)
+        for variant, image_format, path in targets:
+            size = VARIANTS[variant]
+            resized = image.copy()
+            resized.thumbnail((size, size))
+            if image_format == 'jpeg' and resized.mode != 'RGB':
+                resized = resized.convert('RGB')
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            # write to a temporary file first so a derivative is never served half written
+            temporary_path = '{}.{}.tmp'.format(path, os.getpid())
+            resized.save(temporary_path, format=image_format.upper(), **FORMATS[image_format][1])
+            os.replace(temporary_path, path)
+
+
+def missing_derivatives(name):
+    """returns the (variant, format, path) targets of a stored image that are not rendered yet"""
+    return [
+        (variant, image_format, default_storage.path(derivative_name(name, variant, image_format)))
+        for variant in VARIANTS for image_format in FORMATS
+        if not default_storage.exists(derivative_name(name, variant, image_format))
+    ]
+
+
+@tasks.task(max_attempts=3)
+def generate_derivatives(name):
+    """renders the missing derivatives of a stored image in the calling process"""
+    targets = missing_derivatives(name)
+    if targets and default_storage.exists(name):
+        render_derivatives(default_storage.path(name), targets)
+        _missing.pop(derivative_key(name), None)
+        derivatives_rendered.send(sender=generate_derivatives, name=name)
+
+
+def schedule_derivatives(names):
+    """queues the rendering of the stored images that are missing derivatives,
+    an image is only queued once while its derivatives wait to be rendered"""
+    for name in set(names):
+        if not name or not default_storage.exists(name) or not missing_derivatives(name):
+            continue
+        if not Task.objects.filter(status=Task.QUEUED, name=generate_derivatives.task_name, args=[name]).exists():
+            generate_derivatives.delay(name)
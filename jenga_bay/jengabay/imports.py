@@ -0,0 +1,182 @@
+"""Bulk import of seller items from CSV or JSON Lines uploads.
+
+Uploads are read row by row and handled in batches: every batch is validated
+with ItemImportSerializer and written with bulk_create/bulk_update in its own
+transaction, so memory use does not grow with the size of the upload.
+"""
+import csv
+import json
+from itertools import islice
+
+from django.db import IntegrityError, transaction
+from django.utils import timezone
+from rest_framework.exceptions import ValidationError
+from .models import Item
+from .serializers import ItemImportSerializer
+from .signals import items_bulk_saved
+
+BATCH_SIZE = 500
+
+# fields written by an import, and refreshed on the items matched by an upsert
+IMPORT_FIELDS = ['item_name', 'item_description', 'item_price', 'item_measurement_unit', 'category']
+
+
+# imported fields that may be left empty, their empty CSV cells are read as null
+NULLABLE_FIELDS = {field.name for field in Item._meta.concrete_fields if field.null and field.name in IMPORT_FIELDS}
+
+
+def decode_lines(upload, invalid_lines):
+    """yields the lines of an upload decoded as UTF-8 one at a time, without a byte order mark.
+    The numbers of the lines that are not UTF-8 are added to `invalid_lines`, these lines
+    are yielded with replacement characters"""
+    for line_number, line in enumerate(upload, start=1):
+        try:
+            yield line.decode('utf-8-sig' if line_number == 1 else 'utf-8')
+        except UnicodeDecodeError:
+            invalid_lines.add(line_number)
+            yield line.decode('utf-8', 'replace')
+
+
+def invalid_line_error(line_number):
+    return 'Line {} is not valid UTF-8.'.format(line_number)
+
+
+def read_csv_rows(upload):
+    """yields the rows of a CSV upload with a header line as dicts, a row read from a line
+    that is not UTF-8 is yielded as an error message. A header that is not UTF-8 raises
+    ValidationError"""
+    invalid_lines = set()
+    reader = csv.DictReader(decode_lines(upload, invalid_lines))
+    if reader.fieldnames is not None and invalid_lines:
+        raise ValidationError({'file': [invalid_line_error(min(invalid_lines))]})
+    for row in reader:
+        if invalid_lines:
+            # the lines of the row, which may span several
+            read = {line_number for line_number in invalid_lines if line_number <= reader.line_num}
+            invalid_lines -= read
+            if read:
+                yield invalid_line_error(min(read))
+                continue
+        yield {field: None if value == '' and field in NULLABLE_FIELDS else value for field, value in row.items()}
+
+
+def read_jsonl_rows(upload):
+    """yields the objects of a JSON Lines upload, a line that is not a UTF-8 JSON object
+    is yielded as an error message"""
+    for line_number, line in enumerate(upload, start=1):
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            row = json.loads(line.decode('utf-8-sig' if line_number == 1 else 'utf-8'))
+        except UnicodeDecodeError:
+            row = invalid_line_error(line_number)
+        except ValueError as error:
+            row = 'Invalid JSON: {}'.format(error)
+        yield row if isinstance(row, (dict, str)) else 'Expected a JSON object.'
+
+
+class ItemImport:
+    """Imports item rows for a seller and collects a per row error report.
+    In upsert mode a row whose sku matches an existing item of the seller updates that item,
+    otherwise such rows are rejected. Rows whose sku appears again later in the batch are
+    reported as superseded by the later row"""
+
+    def __init__(self, seller, upsert=False, batch_size=BATCH_SIZE):
+        self.seller = seller
+        self.upsert = upsert
+        self.batch_size = batch_size
+        self.created = 0
+        self.updated = 0
+        self.errors = []
+
+    def run(self, rows):
+        rows = enumerate(rows, start=1)
+        while True:
+            batch = list(islice(rows, self.batch_size))
+            if not batch:
+                return self.report()
+            self.import_batch(batch)
+
+    def report(self):
+        return {
+            'created': self.created,
+            'updated': self.updated,
+            'rejected': len(self.errors),
+            # superseded rows are only rejected once the later row is read
+            'errors': sorted(self.errors, key=lambda error: error['row']),
+        }
+
+    def reject(self, row_number, errors):
+        self.errors.append({'row': row_number, 'errors': errors})
+
+    def import_batch(self, batch):
+        valid = {}
+        without_sku = []
+        for row_number, row in batch:
+            if isinstance(row, str):
+                self.reject(row_number, {'non_field_errors': [row]})
+                continue
+            serializer = ItemImportSerializer(data=row)
+            if not serializer.is_valid():
+                self.reject(row_number, serializer.errors)
+                continue
+            data = serializer.validated_data
+            if data.get('sku') is None:
+                without_sku.append((row_number, data))
+            elif data['sku'] in valid and not self.upsert:
+                self.reject(row_number, {'sku': ['Duplicate sku in the upload.']})
+            else:
+                # on upserts the last row of an sku wins
+                if data['sku'] in valid:
+                    self.reject(valid[data['sku']][0], {'sku': ['Superseded by row {} with the same sku.'.format(row_number)]})
+                valid[data['sku']] = (row_number, data)
+
+        try:
+            created, updated, rejected = self.write(without_sku, list(valid.values()))
+        except IntegrityError:
+            # a concurrent import created one of the skus, the rows with an sku are written one
+            # at a time so that only the ones still conflicting are rejected
+            created, updated, rejected = self.write(without_sku, [])
+            for row_number, data in valid.values():
+                try:
+                    row_created, row_updated, row_rejected = self.write([], [(row_number, data)])
+                except IntegrityError:
+                    rejected.append((row_number, {'sku': ['An item with this sku was created by another import.']}))
+                    continue
+                created += row_created
+                updated += row_updated
+                rejected += row_rejected
+        for row_number, errors in rejected:
+            self.reject(row_number, errors)
+        self.created += len(created)
+        self.updated += len(updated)
+
+    def write(self, without_sku, with_sku):
+        """creates the (row number, data) rows without sku and creates or, in upsert mode, updates
+        the ones with an sku in one transaction. Returns the created and updated items and the
+        (row number, errors) of the rejected rows"""
+        with transaction.atomic():
+            existing = {item.sku: item for item in
+                        Item.objects.filter(item_seller=self.seller, sku__in=[data['sku'] for row_number, data in with_sku])}
+            new_items = [Item(item_seller=self.seller, **data) for row_number, data in without_sku]
+            updated_items = []
+            rejected = []
+            for row_number, data in with_sku:
+                item = existing.get(data['sku'])
+                if item is None:
+                    new_items.append(Item(item_seller=self.seller, **data))
+                elif self.upsert:
+                    for field in IMPORT_FIELDS:
+                        setattr(item, field, data.get(field, getattr(item, field)))
+                    item.updated_at = timezone.now()
+                    updated_items.append(item)
+                else:
+                    rejected.append((row_number, {'sku': ['An item with this sku already exists.']}))
+
+            new_items = Item.objects.bulk_create(new_items, batch_size=self.batch_size)
+            Item.objects.bulk_update(updated_items, IMPORT_FIELDS + ['updated_at'], batch_size=self.batch_size)
+            item_ids = [item.pk for item in new_items + updated_items]
+            if item_ids:
+                items_bulk_saved.send(sender=Item, seller=self.seller, item_ids=item_ids)
+        return new_items, updated_items, rejected
@@ -0,0 +1,192 @@
+"""Per-request performance instrumentation.
+
+InstrumentationMiddleware measures the duration of every request and logs the ones slower
+than SLOW_REQUEST_MS as a JSON record to the 'jengabay.slow_requests' logger. A sample of
+the requests, REQUEST_TIMING_SAMPLE_RATE of them, is timed in detail: the number and time
+of the SQL queries, the statements run more than once with different parameters (the
+signature of N+1 queries) and the time spent in the phases timed by
+mixins.InstrumentedViewMixin: authentication, permission checks, serializers and
+rendering. Sampled requests return these timings in a Server-Timing header and add them to
+their slow request record.
+
+The timings of the current request live in a context variable, which follows the request
+into the threads running its synchronous code, so queries are recorded by a wrapper every
+database connection gets when it is opened. Requests that are not sampled pay for two clock
+readings and a random number per request, and a context variable lookup per query.
+
+The duration ends once the response is returned, before the content of streaming responses
+(e.g. the seller exports) is sent, so the queries run while streaming are not counted.
+"""
+import json
+import logging
+import random
+import time
+from collections import Counter
+from contextlib import contextmanager
+from contextvars import ContextVar
+from functools import wraps
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+
+logger = logging.getLogger('jengabay.slow_requests')
+
+_current = ContextVar('request_timings', default=None)
+
+# Server-Timing metric names and descriptions of the view phases
+PHASES = {
+    'auth': 'authentication',
+    'perm': 'permissions',
+    'ser': 'serializer',
+    'render': 'renderer',
+}
+
+# repeated statements listed in a slow request record
+REPEATED_QUERIES_LOGGED = 5
+
+
+class RequestTimings:
+    """the queries and phase durations recorded during a request"""
+
+    def __init__(self):
+        self.query_time = 0.0
+        self.statements = Counter()
+        self.phases = Counter()
+
+    @property
+    def query_count(self):
+        return sum(self.statements.values())
+
+    def repeated_queries(self):
+        """returns (sql, count) of the statements run more than once, most repeated first"""
+        return [(sql, count) for sql, count in self.statements.most_common() if count > 1]
+
+    def server_timing(self, total):
+        repeated = sum(count for sql, count in self.repeated_queries())
+        metrics = ['db;dur={:.1f};desc="{} queries ({} repeated)"'.format(
+            self.query_time * 1000, self.query_count, repeated)]
+        metrics += ['{};dur={:.1f};desc="{}"'.format(phase, self.phases[phase] * 1000, description)
+                    for phase, description in PHASES.items() if phase in self.phases]
+        metrics.append('total;dur={:.1f}'.format(total * 1000))
+        return ', '.join(metrics)
+
+    def record(self):
+        """returns the timings added to the slow request record of a sampled request"""
+        return {
+            'queries': self.query_count,
+            'query_ms': round(self.query_time * 1000, 1),
+            'phases_ms': {PHASES[phase]: round(self.phases[phase] * 1000, 1) for phase in PHASES if phase in self.phases},
+            'repeated_queries': [{'sql': sql, 'count': count}
+                                 for sql, count in self.repeated_queries()[:REPEATED_QUERIES_LOGGED]],
+        }
+
+
+def current():
+    """returns the timings of the current request, None if it is not sampled"""
+    return _current.get()
+
+
+@contextmanager
+def phase(name):
+    """adds the duration of the block to a phase of the current request"""
+    timings = _current.get()
+    if timings is None:
+        yield
+        return
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        timings.phases[name] += time.perf_counter() - started
+
+
+def timed(name, function):
+    """returns the function adding the duration of its calls to a phase of the current request"""
+    @wraps(function)
+    def wrapper(*args, **kwargs):
+        with phase(name):
+            return function(*args, **kwargs)
+    return wrapper
+
+
+def record_query(execute, sql, params, many, context):
+    """database execute wrapper recording the queries of sampled requests"""
+    timings = _current.get()
+    if timings is None:
+        return execute(sql, params, many, context)
+    started = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        timings.query_time += time.perf_counter() - started
+        # the SQL keeps its placeholders, equal statements only differ by their parameters
+        timings.statements[sql] += 1
+
+
+def install_query_recorder(sender, connection, **kwargs):
+    """connection_created receiver, the recorder goes first so execute_wrapper() blocks
+    entered before the connection was opened still remove their own wrapper"""
+    if record_query not in connection.execute_wrappers:
+        connection.execute_wrappers.insert(0, record_query)
+
+
+class InstrumentationMiddleware:
+    """Logs the requests slower than SLOW_REQUEST_MS, and times a sample of the requests in
+    detail, returning their timings in a Server-Timing header"""
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def is_sampled(self):
+        rate = settings.REQUEST_TIMING_SAMPLE_RATE
+        return rate >= 1 or (rate > 0 and random.random() < rate)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        started = time.perf_counter()
+        if not self.is_sampled():
+            return self.report(request, self.get_response(request), started)
+        timings = RequestTimings()
+        token = _current.set(timings)
+        try:
+            response = self.get_response(request)
+        finally:
+            _current.reset(token)
+        return self.report(request, response, started, timings)
+
+    async def __acall__(self, request):
+        started = time.perf_counter()
+        if not self.is_sampled():
+            return self.report(request, await self.get_response(request), started)
+        timings = RequestTimings()
+        token = _current.set(timings)
+        try:
+            response = await self.get_response(request)
+        finally:
+            _current.reset(token)
+        return self.report(request, response, started, timings)
+
+    def report(self, request, response, started, timings=None):
+        total = time.perf_counter() - started
+        if timings is not None:
+            response['Server-Timing'] = timings.server_timing(total)
+        if total * 1000 >= settings.SLOW_REQUEST_MS:
+            match = request.resolver_match
+            record = {
+                'method': request.method,
+                'path': request.get_full_path(),
+                'view': match.view_name if match else None,
+                'status': response.status_code,
+                'duration_ms': round(total * 1000, 1),
+                'sampled': timings is not None,
+            }
+            if timings is not None:
+                record.update(timings.record())
+            logger.warning(json.dumps(record))
+        return response
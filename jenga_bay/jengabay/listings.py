@@ -0,0 +1,141 @@
+"""Flattened item listings the catalog is read from.
+
+ItemListing holds a copy of every item together with the fields of its seller, sub county
+and county, so catalog pages, searches and facet counts are single table queries instead of
+four table joins. Listings are copied from the source tables with one INSERT ... SELECT and
+kept current by signals, see jengabay.signals: saved items are copied again, while saved
+sellers and renamed sub counties and counties update their listings in place with a single
+UPDATE. Bulk writes skipping the signals are followed by `rebuild()`, also run by the
+rebuild_item_listings command.
+"""
+from django.db import connections
+from django.db.models import OuterRef, Subquery
+from . import fieldsets
+from .models import ItemListing, Seller, SubCounty
+
+# listing columns and the source column they copy
+COLUMNS = (
+    ('item_id', 'i.id'),
+    ('item_name', 'i.item_name'),
+    ('item_description', 'i.item_description'),
+    ('item_price', 'i.item_price'),
+    ('item_measurement_unit', 'i.item_measurement_unit'),
+    ('item_main_image', 'i.item_main_image'),
+    ('item_extra_image1', 'i.item_extra_image1'),
+    ('item_extra_image2', 'i.item_extra_image2'),
+    ('item_extra_image3', 'i.item_extra_image3'),
+    ('item_extra_image4', 'i.item_extra_image4'),
+    ('category', 'i.category'),
+    ('sku', 'i.sku'),
+    ('updated_at', 'i.updated_at'),
+    ('seller_id', 's.id'),
+    ('seller_profile_id', 's.profile_id'),
+    ('business_name', 's.business_name'),
+    ('phone_number', 's.phone_number'),
+    ('town', 's.town'),
+    ('local_area_name', 's.local_area_name'),
+    ('street', 's.street'),
+    ('building', 's.building'),
+    ('profile_pic', 's.profile_pic'),
+    ('seller_updated_at', 's.updated_at'),
+    ('sub_county_id', 'sc.id'),
+    ('subcounty_name', 'sc.subcounty_name'),
+    ('county_id', 'c.id'),
+    ('county_name', 'c.county_name'),
+    ('county_code', 'c.code'),
+)
+
+# the lookups from an item to the tables the listing columns are copied from
+LOOKUP_PREFIXES = {'i': '', 's': 'item_seller__', 'sc': 'item_seller__sub_county__', 'c': 'item_seller__sub_county__county__'}
+
+
+def lookup_columns():
+    """returns the listing field holding every field looked up from an item, e.g. 'item' for
+    'id', 'seller' for the 'item_seller' relation and 'county_code' for 'item_seller__sub_county__county__code'"""
+    names = {field.attname: field.name for field in ItemListing._meta.concrete_fields}
+    lookups = {}
+    for column, source in COLUMNS:
+        alias, name = source.split('.')
+        prefix = LOOKUP_PREFIXES[alias]
+        lookups[prefix + name.removesuffix('_id')] = names[column]
+        if name == 'id' and prefix:
+            lookups[prefix[:-2]] = names[column]
+    return lookups
+
+
+def shape_queryset(queryset, serializer, required_columns=()):
+    """returns the listings queryset loading only the columns of the item fields `serializer`
+    returns, see jengabay.fieldsets, and the `required_columns` read by the caller"""
+    columns, related, prefetches = fieldsets.required_lookups(serializer)
+    lookups = lookup_columns()
+    if columns is None or not all(column in lookups for column in columns):
+        return queryset
+    return queryset.only(*(lookups[column] for column in columns),
+                         *fieldsets.concrete_columns(ItemListing, required_columns))
+
+
+INSERT_SQL = (
+    "INSERT INTO jengabay_itemlisting ({}) SELECT {} "
+    "FROM jengabay_item i "
+    "INNER JOIN jengabay_seller s ON s.id = i.item_seller_id "
+    "INNER JOIN jengabay_subcounty sc ON sc.id = s.sub_county_id "
+    "INNER JOIN jengabay_county c ON c.id = sc.county_id"
+).format(', '.join(column for column, source in COLUMNS), ', '.join(source for column, source in COLUMNS))
+
+
+def refresh_items(item_ids, using='default', created=False):
+    """copies the given items again after they were saved, new items have no listing to replace"""
+    if not item_ids:
+        return
+    item_ids = list(item_ids)
+    placeholders = ', '.join(['%s'] * len(item_ids))
+    with connections[using].cursor() as cursor:
+        if not created:
+            cursor.execute("DELETE FROM jengabay_itemlisting WHERE item_id IN ({})".format(placeholders), item_ids)
+        cursor.execute(INSERT_SQL + " WHERE i.id IN ({})".format(placeholders), item_ids)
+
+
+def refresh_item(item_id, using='default', created=False):
+    refresh_items([item_id], using, created)
+
+
+def seller_updated_at():
+    """the modification time of the seller of a listing, as an UPDATE value"""
+    return Subquery(Seller.objects.filter(pk=OuterRef('seller')).values('updated_at')[:1])
+
+
+def update_seller(seller, using='default'):
+    """copies the details of a saved seller to the listings of their items"""
+    if Seller.sub_county.is_cached(seller):
+        sub_county = seller.sub_county
+    else:
+        sub_county = SubCounty.objects.using(using).select_related('county').get(pk=seller.sub_county_id)
+    ItemListing.objects.using(using).filter(seller=seller.pk).update(
+        seller_profile_id=seller.profile_id, business_name=seller.business_name, phone_number=seller.phone_number,
+        town=seller.town, local_area_name=seller.local_area_name, street=seller.street, building=seller.building,
+        profile_pic=seller.profile_pic.name, seller_updated_at=seller.updated_at,
+        sub_county=sub_county.pk, subcounty_name=sub_county.subcounty_name,
+        county=sub_county.county_id, county_name=sub_county.county.county_name, county_code=sub_county.county.code)
+
+
+def update_sub_county(sub_county, using='default'):
+    """copies a renamed (or moved) sub county to its listings, with the modification time of
+    their sellers moved forward by jengabay.signals"""
+    county = sub_county.county
+    ItemListing.objects.using(using).filter(sub_county=sub_county.pk).update(
+        subcounty_name=sub_county.subcounty_name, county=county.pk, county_name=county.county_name,
+        county_code=county.code, seller_updated_at=seller_updated_at())
+
+
+def update_county(county, using='default'):
+    ItemListing.objects.using(using).filter(county=county.pk).update(
+        county_name=county.county_name, county_code=county.code, seller_updated_at=seller_updated_at())
+
+
+def rebuild(using='default'):
+    """copies the whole catalog again in one statement and returns the number of listings"""
+    with connections[using].cursor() as cursor:
+        cursor.execute("DELETE FROM jengabay_itemlisting")
+        cursor.execute(INSERT_SQL)
+        cursor.execute("SELECT COUNT(*) FROM jengabay_itemlisting")
+        return cursor.fetchone()[0]
@@ -0,0 +1,64 @@
+"""Email sent from the background workers.
+
+QueuedEmailBackend, the EMAIL_BACKEND, queues every message as a `send_email` task instead
+of talking to the mail server in the request, so the password reset and account emails of
+django_rest_passwordreset, dj_rest_auth and allauth are sent by the workers through
+QUEUED_EMAIL_BACKEND.
+"""
+import base64
+
+from django.conf import settings
+from django.core.mail import EmailMultiAlternatives, get_connection, send_mail
+from django.core.mail.backends.base import BaseEmailBackend
+from django.urls import reverse
+from . import tasks
+
+
+def message_data(message):
+    """returns the JSON serializable fields of an email message, attachments being
+    (filename, base64 content, mimetype) lists"""
+    attachments = []
+    for attachment in message.attachments:
+        filename, content, mimetype = attachment
+        if isinstance(content, str):
+            content = content.encode()
+        attachments.append([filename, base64.b64encode(content).decode(), mimetype])
+    return {
+        'subject': message.subject, 'body': message.body, 'from_email': message.from_email,
+        'to': message.to, 'cc': message.cc, 'bcc': message.bcc, 'reply_to': message.reply_to,
+        'headers': message.extra_headers, 'alternatives': list(getattr(message, 'alternatives', [])),
+        'attachments': attachments,
+    }
+
+
+@tasks.task(priority=10)
+def send_email(data):
+    """sends a message queued by QueuedEmailBackend"""
+    message = EmailMultiAlternatives(
+        data['subject'], data['body'], data['from_email'], data['to'], data['bcc'],
+        cc=data['cc'], reply_to=data['reply_to'], headers=data['headers'],
+        alternatives=[tuple(alternative) for alternative in data['alternatives']],
+        connection=get_connection(settings.QUEUED_EMAIL_BACKEND))
+    for filename, content, mimetype in data['attachments']:
+        message.attach(filename, base64.b64decode(content), mimetype)
+    message.send()
+
+
+class QueuedEmailBackend(BaseEmailBackend):
+    """An email backend queuing the messages for the background workers"""
+
+    def send_messages(self, email_messages):
+        for message in email_messages:
+            send_email.delay(message_data(message))
+        return len(email_messages)
+
+
+def send_password_reset(reset_password_token, request=None):
+    """emails the token of a password reset requested through django_rest_passwordreset"""
+    confirm_url = reverse('password_reset:reset-password-confirm')
+    if request is not None:
+        confirm_url = request.build_absolute_uri(confirm_url)
+    body = ('Use the token below to choose a new password for your JengaBay account {}.\n\n{}\n\n'
+            'Post it together with your new password to {}\n').format(
+        reset_password_token.user.email, reset_password_token.key, confirm_url)
+    send_mail('Password reset for JengaBay', body, None, [reset_password_token.user.email])
@@ -0,0 +1,83 @@
+import json
+import shutil
+import tempfile
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test.utils import override_settings, setup_test_environment, teardown_test_environment
+from jengabay import benchmarks
+
+
+class Command(BaseCommand):
+    help = ('Seeds a throwaway test database and measures the latency percentiles, throughput, SQL queries '
+            'and peak memory of every api endpoint through the test client, optionally against a stored baseline')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--scale', type=float, default=1, help='size of the seeded dataset relative to the default')
+        parser.add_argument('--seed', type=int, default=0, help='seed of the generated dataset')
+        parser.add_argument('--requests', type=int, default=50, help='measured requests per endpoint')
+        parser.add_argument('--warmup', type=int, default=5, help='requests per endpoint before measuring')
+        parser.add_argument('--endpoint', action='append', dest='endpoints',
+                            help='name of an endpoint to measure, may be repeated (defaults to every endpoint)')
+        parser.add_argument('--response-cache', action='store_true',
+                            help='serve cacheable responses from the response cache as in production')
+        parser.add_argument('--output', help='file to write the results to as JSON')
+        parser.add_argument('--baseline', help='JSON results of an earlier run to compare with')
+        parser.add_argument('--threshold', type=float, default=20,
+                            help='percent change of the p95 latency or throughput reported as a regression')
+        parser.add_argument('--fail-on-regression', action='store_true',
+                            help='exit with an error when an endpoint regressed against the baseline')
+
+    def handle(self, *args, **options):
+        baseline = None
+        if options['baseline']:
+            with open(options['baseline']) as baseline_file:
+                baseline = json.load(baseline_file)['endpoints']
+
+        media_root = tempfile.mkdtemp()
+        responses = {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache' if options['response_cache']
+                     else 'django.core.cache.backends.dummy.DummyCache'}
+        # an in-memory test database, local caches and media, background tasks are queued but not run
+        overrides = override_settings(
+            CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}, 'responses': responses},
+            DATABASE_REPLICAS=[], MEDIA_ROOT=media_root)
+        setup_test_environment()
+        old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True, serialize=False)
+        try:
+            with overrides:
+                started = time.perf_counter()
+                dataset = benchmarks.seed_dataset(options['scale'], options['seed'])
+                self.stdout.write('Seeded the dataset in {:.1f}s'.format(time.perf_counter() - started))
+                results = benchmarks.run_benchmarks(dataset, options['requests'], options['warmup'], options['endpoints'])
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+            teardown_test_environment()
+            shutil.rmtree(media_root, ignore_errors=True)
+
+        self.report(results)
+        if options['output']:
+            with open(options['output'], 'w') as output:
+                json.dump({'options': {key: options[key] for key in ('scale', 'seed', 'requests', 'warmup', 'response_cache')},
+                           'endpoints': results}, output, indent=2)
+        if baseline is not None:
+            regressions = self.report_comparison(benchmarks.compare(results, baseline, options['threshold']))
+            if regressions and options['fail_on_regression']:
+                raise CommandError('{} endpoint metrics regressed'.format(regressions))
+
+    def report(self, results):
+        self.stdout.write('{:<24}{:>7}{:>10}{:>10}{:>10}{:>9}{:>9}{:>10}{:>11}'.format(
+            'endpoint', 'errors', 'p50 ms', 'p95 ms', 'p99 ms', 'req/s', 'queries', 'query ms', 'peak KiB'))
+        for name, result in results.items():
+            line = '{:<24}{:>7}{:>10.2f}{:>10.2f}{:>10.2f}{:>9.1f}{:>9.1f}{:>10.2f}{:>11.1f}'.format(
+                name, result['errors'], result['p50_ms'], result['p95_ms'], result['p99_ms'], result['throughput'],
+                result['queries'], result['query_ms'], result['peak_memory_kb'])
+            self.stdout.write(self.style.ERROR(line) if result['errors'] else line)
+
+    def report_comparison(self, rows):
+        """writes the changes against the baseline and returns the number of regressions"""
+        self.stdout.write('{:<24}{:<12}{:>12}{:>12}{:>10}'.format('endpoint', 'metric', 'baseline', 'current', 'change'))
+        for name, metric, previous, current, change, regressed in rows:
+            line = '{:<24}{:<12}{:>12.2f}{:>12.2f}{:>+9.1f}%'.format(name, metric, previous, current, change)
+            self.stdout.write(self.style.ERROR(line) if regressed else line)
+        return sum(regressed for *row, regressed in rows)
@@ -0,0 +1,57 @@
+import json
+import time
+
+from django.contrib.auth.hashers import make_password
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test.utils import override_settings, setup_test_environment, teardown_test_environment
+from jengabay import benchmarks
+from jengabay.seeding import PASSWORD, MarketplaceSeeder
+
+
+class Command(BaseCommand):
+    help = ('Seeds a throwaway test database and times rendering and parsing /items pages of several sizes '
+            'with DRF\'s JSON renderer and parser and with the orjson backed ones of jengabay.renderers')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sizes', type=int, nargs='+', default=[100, 1000, 10000],
+                            help='numbers of items of the rendered pages')
+        parser.add_argument('--repeat', type=int, default=20, help='timed renders and parses per page and codec')
+        parser.add_argument('--seed', type=int, default=0, help='seed of the generated dataset')
+        parser.add_argument('--output', help='file to write the results to as JSON')
+
+    def handle(self, *args, **options):
+        items = max(options['sizes'])
+        setup_test_environment()
+        old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True, serialize=False)
+        try:
+            with override_settings(DATABASE_REPLICAS=[]):
+                started = time.perf_counter()
+                scale = items / benchmarks.ITEMS
+                MarketplaceSeeder(seed=options['seed'], sellers=benchmarks.scaled(benchmarks.SELLERS, scale), items=items,
+                                  buyers=1, orders=1, password_hash=make_password(PASSWORD)).run()
+                self.stdout.write('Seeded {} items in {:.1f}s'.format(items, time.perf_counter() - started))
+                results = benchmarks.run_render_benchmarks(options['sizes'], options['repeat'])
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+            teardown_test_environment()
+
+        self.report(results)
+        if options['output']:
+            with open(options['output'], 'w') as output:
+                json.dump({'options': {key: options[key] for key in ('sizes', 'repeat', 'seed')},
+                           'pages': results}, output, indent=2)
+        if not all(result['identical'] for codecs in results.values() for result in codecs.values()):
+            raise CommandError('A renderer wrote a page unlike DRF\'s JSONRenderer')
+
+    def report(self, results):
+        self.stdout.write('{:>7}{:>7}{:>12}{:>12}{:>12}{:>12}{:>12}{:>11}'.format(
+            'items', 'codec', 'KiB', 'render ms', 'parse ms', 'render x', 'parse x', 'identical'))
+        for size, codecs in results.items():
+            drf = codecs['drf']
+            for name, result in codecs.items():
+                line = '{:>7}{:>7}{:>12.1f}{:>12.2f}{:>12.2f}{:>12.2f}{:>12.2f}{:>11}'.format(
+                    result['items'], name, result['bytes'] / 1024, result['render_p50_ms'], result['parse_p50_ms'],
+                    drf['render_p50_ms'] / result['render_p50_ms'], drf['parse_p50_ms'] / result['parse_p50_ms'],
+                    'yes' if result['identical'] else 'no')
+                self.stdout.write(line if result['identical'] else self.style.ERROR(line))
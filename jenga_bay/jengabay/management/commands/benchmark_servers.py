@@ -0,0 +1,153 @@
+import http.client
+import json
+import math
+import os
+import socket
+import subprocess
+import sys
+import threading
+import time
+from itertools import count
+from urllib.parse import urlencode
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from jengabay.benchmarks import percentile
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+class Command(BaseCommand):
+    help = ('Compares the throughput and latency of the API served by gunicorn (WSGI, sync views) and '
+            'uvicorn (ASGI, native async views) with the same number of worker processes and concurrent clients')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--path', action='append', dest='paths',
+                            help='path requested by the clients, may be repeated (defaults to /items and /sellers/)')
+        parser.add_argument('--login', help='username:password of a user to include logins in the requests')
+        parser.add_argument('--concurrency', type=int, default=32, help='number of concurrent clients')
+        parser.add_argument('--workers', type=int, default=2, help='number of server worker processes')
+        parser.add_argument('--duration', type=float, default=10, help='seconds of load per server')
+        parser.add_argument('--warmup', type=float, default=2, help='seconds of load before measuring')
+        parser.add_argument('--bypass-cache', action='store_true',
+                            help='make every request unique so it misses the response cache')
+        parser.add_argument('--output', help='file to write the results to as JSON')
+
+    def handle(self, *args, **options):
+        requests = [('GET', path, None) for path in options['paths'] or ['/items', '/sellers/']]
+        if options['login']:
+            username, _, password = options['login'].partition(':')
+            requests.append(('POST', '/login', urlencode({'username': username, 'password': password})))
+
+        # gunicorn threads match the concurrency of the clients, uvicorn workers serve them on their event loop
+        threads = math.ceil(options['concurrency'] / options['workers'])
+        servers = {
+            'wsgi': ['gunicorn', 'backend.wsgi:application', '--worker-class', 'gthread',
+                     '--workers', str(options['workers']), '--threads', str(threads)],
+            'asgi': ['uvicorn', 'backend.asgi:application', '--workers', str(options['workers']), '--no-access-log'],
+        }
+        results = {}
+        for name, command in servers.items():
+            port = free_port()
+            if name == 'wsgi':
+                command = command + ['--bind', '127.0.0.1:{}'.format(port)]
+            else:
+                command = command + ['--host', '127.0.0.1', '--port', str(port)]
+            self.stdout.write('Benchmarking {} on port {}'.format(name, port))
+            results[name] = self.benchmark(command, port, requests, options)
+
+        self.stdout.write('{:<6}{:>10}{:>8}{:>10}{:>10}{:>10}'.format('server', 'requests', 'errors', 'req/s', 'p50 ms', 'p99 ms'))
+        for name, result in results.items():
+            self.stdout.write('{:<6}{:>10}{:>8}{:>10.1f}{:>10.1f}{:>10.1f}'.format(
+                name, result['requests'], result['errors'], result['throughput'], result['p50_ms'], result['p99_ms']))
+        if options['output']:
+            with open(options['output'], 'w') as output:
+                json.dump({'options': {key: options[key] for key in ('concurrency', 'workers', 'duration', 'bypass_cache')},
+                           'results': results}, output, indent=2)
+
+    def benchmark(self, command, port, requests, options):
+        env = dict(os.environ, DJANGO_SETTINGS_MODULE='backend.settings')
+        env.pop('ASYNC_VIEWS', None)
+        server = subprocess.Popen([sys.executable, '-m'] + command, cwd=settings.BASE_DIR, env=env,
+                                  stdout=subprocess.DEVNULL, stderr=subprocess.PIPE)
+        try:
+            self.wait_until_ready(server, port)
+            self.load(port, requests, options['concurrency'], options['warmup'], options['bypass_cache'])
+            latencies, errors, elapsed = self.load(port, requests, options['concurrency'], options['duration'],
+                                                   options['bypass_cache'])
+        finally:
+            server.terminate()
+            server.wait(timeout=30)
+
+        latencies.sort()
+        return {
+            'requests': len(latencies),
+            'errors': errors,
+            'throughput': len(latencies) / elapsed,
+            'p50_ms': (percentile(latencies, 0.5) or 0) * 1000,
+            'p99_ms': (percentile(latencies, 0.99) or 0) * 1000,
+        }
+
+    def wait_until_ready(self, server, port, timeout=30):
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            if server.poll() is not None:
+                raise CommandError('The server exited: {}'.format(server.stderr.read().decode()[-2000:]))
+            try:
+                connection = http.client.HTTPConnection('127.0.0.1', port, timeout=5)
+                connection.request('GET', '/items')
+                connection.getresponse().read()
+                return
+            except OSError:
+                time.sleep(0.2)
+        raise CommandError('The server did not start within {} seconds'.format(timeout))
+
+    def load(self, port, requests, concurrency, duration, bypass_cache):
+        """runs `concurrency` clients sending the requests in turn over keep-alive connections for
+        `duration` seconds, returns the latencies of the successful requests, the number of errors
+        and the elapsed time"""
+        latencies = []
+        errors = []
+        numbers = count()
+        deadline = time.monotonic() + duration
+
+        def client(offset):
+            connection = http.client.HTTPConnection('127.0.0.1', port, timeout=30)
+            client_latencies = []
+            client_errors = 0
+            turn = offset
+            while time.monotonic() < deadline:
+                method, path, body = requests[turn % len(requests)]
+                turn += 1
+                if bypass_cache and method == 'GET':
+                    path += ('&' if '?' in path else '?') + '_={}'.format(next(numbers))
+                headers = {'Content-Type': 'application/x-www-form-urlencoded'} if body else {}
+                started = time.perf_counter()
+                try:
+                    connection.request(method, path, body=body, headers=headers)
+                    response = connection.getresponse()
+                    response.read()
+                except (OSError, http.client.HTTPException):
+                    client_errors += 1
+                    connection.close()
+                    connection = http.client.HTTPConnection('127.0.0.1', port, timeout=30)
+                    continue
+                if response.status >= 400:
+                    client_errors += 1
+                else:
+                    client_latencies.append(time.perf_counter() - started)
+            connection.close()
+            latencies.extend(client_latencies)
+            errors.append(client_errors)
+
+        started = time.monotonic()
+        clients = [threading.Thread(target=client, args=(offset,)) for offset in range(concurrency)]
+        for thread in clients:
+            thread.start()
+        for thread in clients:
+            thread.join()
+        return latencies, sum(errors), time.monotonic() - started
@@ -0,0 +1,20 @@
+from django.core.management.base import BaseCommand
+from jengabay import images
+from jengabay.models import Item, Seller
+
+
+class Command(BaseCommand):
+    help = 'Renders the missing resized derivatives of every stored item and seller image'
+
+    def handle(self, *args, **options):
+        names = set()
+        for model in (Item, Seller):
+            for field in model.derivative_image_fields:
+                names.update(model.objects.exclude(**{field: ''}).exclude(**{field + '__isnull': True})
+                             .values_list(field, flat=True).distinct().iterator())
+        for name in sorted(names):
+            try:
+                images.generate_derivatives(name)
+            except Exception as error:
+                self.stderr.write('Skipped {}: {}'.format(name, error))
+        self.stdout.write(self.style.SUCCESS('Checked the derivatives of {} images'.format(len(names))))
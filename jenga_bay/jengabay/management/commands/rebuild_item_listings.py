@@ -0,0 +1,13 @@
+from django.core.management.base import BaseCommand
+from jengabay import listings
+
+
+class Command(BaseCommand):
+    help = 'Copies every item, with its seller and location, to the flattened listings the catalog is read from'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--database', default='default', help='database alias to rebuild the listings on')
+
+    def handle(self, *args, **options):
+        count = listings.rebuild(options['database'])
+        self.stdout.write(self.style.SUCCESS('Copied {} items to the catalog listings'.format(count)))
@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+from jengabay import analytics
+
+
+class Command(BaseCommand):
+    help = 'Recomputes the seller sales dashboard summaries from the existing orders'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--seller', type=int, action='append', dest='sellers',
+                            help='id of a seller to rebuild the summaries of, may be repeated (defaults to every seller)')
+
+    def handle(self, *args, **options):
+        daily_count, item_count = analytics.rebuild_summaries(options['sellers'])
+        self.stdout.write(self.style.SUCCESS('Wrote {} daily sales and {} item sales summaries'.format(daily_count, item_count)))
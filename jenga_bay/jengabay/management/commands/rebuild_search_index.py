@@ -0,0 +1,16 @@
+from django.core.management.base import BaseCommand, CommandError
+from jengabay import search
+
+
+class Command(BaseCommand):
+    help = 'Rebuilds the item full text search index from the existing catalog'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--database', default='default', help='database alias to rebuild the index on')
+
+    def handle(self, *args, **options):
+        using = options['database']
+        if not search.is_available(using):
+            raise CommandError('The item search index is only available on SQLite databases')
+        count = search.rebuild_index(using)
+        self.stdout.write(self.style.SUCCESS('Indexed {} items'.format(count)))
@@ -0,0 +1,74 @@
+import multiprocessing
+import signal
+import threading
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import connections
+from jengabay import tasks
+
+
+class Command(BaseCommand):
+    help = 'Runs the queued background tasks, such as emails and image derivatives, until interrupted'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=None,
+                            help='number of workers, TASK_WORKERS by default')
+        parser.add_argument('--processes', action='store_true',
+                            help='run the workers in forked processes rather than threads, for CPU bound tasks (not on Windows)')
+        parser.add_argument('--batch-size', type=int, default=tasks.BATCH_SIZE,
+                            help='number of tasks a worker claims at once')
+        parser.add_argument('--poll-interval', type=float, default=1.0,
+                            help='seconds an idle worker waits before looking for due tasks again')
+        parser.add_argument('--requeue-dead', action='store_true',
+                            help='queue the dead tasks again before starting')
+        parser.add_argument('--once', action='store_true',
+                            help='run the due tasks in this process and exit')
+
+    def handle(self, *args, **options):
+        if options['requeue_dead']:
+            self.stdout.write('Requeued {} dead tasks'.format(tasks.requeue_dead()))
+        if options['once']:
+            tasks.requeue_stale()
+            self.stdout.write('Ran {} tasks'.format(tasks.run_pending()))
+            return
+
+        count = options['workers'] or settings.TASK_WORKERS
+        if options['processes']:
+            # forked workers open their own database connections
+            connections.close_all()
+            context = multiprocessing.get_context('fork')
+            stop = context.Event()
+            start = context.Process
+        else:
+            stop = threading.Event()
+            start = threading.Thread
+        workers = [start(target=tasks.Worker(index, options['batch_size'], options['poll_interval']).run,
+                         args=(stop,), name='task-worker-{}'.format(index))
+                   for index in range(count)]
+        # forked workers ignore ctrl-c and termination, sent to the whole process group,
+        # and stop after their current task once the event is set
+        interrupt = signal.signal(signal.SIGINT, signal.SIG_IGN)
+        signal.signal(signal.SIGTERM, signal.SIG_IGN)
+        try:
+            for worker in workers:
+                worker.start()
+        finally:
+            signal.signal(signal.SIGINT, interrupt)
+            signal.signal(signal.SIGTERM, self.terminate)
+        self.stdout.write('Started {} {} workers'.format(count, 'process' if options['processes'] else 'thread'))
+        try:
+            while any(worker.is_alive() for worker in workers) and not stop.is_set():
+                stop.wait(1)
+        except KeyboardInterrupt:
+            pass
+        finally:
+            # the workers finish the task they are running
+            stop.set()
+            for worker in workers:
+                worker.join()
+        self.stdout.write('Stopped the workers')
+
+    def terminate(self, signum, frame):
+        # stops the workers as ctrl-c does, setting the event in a handler could deadlock the waiting main thread
+        raise KeyboardInterrupt
@@ -0,0 +1,32 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.test.utils import override_settings
+from jengabay.models import Seller
+from jengabay.seeding import BATCH_SIZE, PASSWORD, MarketplaceSeeder
+
+
+class Command(BaseCommand):
+    help = ('Fills an empty database with a generated marketplace of 47 counties, their sub counties, '
+            'sellers, buyers, items and orders for scale testing, the same seed always generates the same rows')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--seed', type=int, default=0, help='seed of the generated rows')
+        parser.add_argument('--scale', type=float, default=1,
+                            help='fraction of the default sizes to generate, e.g. 0.01 for a quick dataset')
+        parser.add_argument('--sellers', type=int, default=10000)
+        parser.add_argument('--items', type=int, default=1000000)
+        parser.add_argument('--buyers', type=int, default=50000)
+        parser.add_argument('--orders', type=int, default=2000000)
+        parser.add_argument('--batch-size', type=int, default=BATCH_SIZE, help='rows written per transaction')
+
+    def handle(self, *args, **options):
+        if Seller.objects.exists():
+            raise CommandError('The database already has sellers, seed an empty database')
+
+        sizes = {name: max(1, int(options[name] * options['scale'])) for name in ('sellers', 'items', 'buyers', 'orders')}
+        seeder = MarketplaceSeeder(seed=options['seed'], batch_size=options['batch_size'], progress=self.stdout.write, **sizes)
+        # the debug cursor would keep the last queries, millions of inserted values, in memory
+        with override_settings(DEBUG=False):
+            seeder.run()
+        self.stdout.write(self.style.SUCCESS(
+            'Seeded {sellers} sellers, {items} items, {buyers} buyers and {orders} orders, '.format(**sizes) +
+            "users are named seller<n>@jengabay.com and buyer<n>@jengabay.com with the password '{}'".format(PASSWORD)))
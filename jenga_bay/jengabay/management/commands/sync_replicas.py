@@ -0,0 +1,40 @@
+import sqlite3
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+from jengabay.routers import get_replicas
+
+
+class Command(BaseCommand):
+    help = ('Copies the default SQLite database onto every SQLite replica in DATABASE_REPLICAS, '
+            'a local stand-in for database replication')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--interval', type=float, default=None,
+                            help='keep copying every INTERVAL seconds, simulating replication lag')
+
+    def handle(self, *args, **options):
+        replicas = get_replicas()
+        if not replicas:
+            raise CommandError('No DATABASE_REPLICAS are configured')
+        for alias in ['default'] + replicas:
+            if connections[alias].vendor != 'sqlite':
+                raise CommandError('sync_replicas only copies SQLite databases, {} is not one'.format(alias))
+
+        while True:
+            self.sync(replicas)
+            if options['interval'] is None:
+                return
+            time.sleep(options['interval'])
+
+    def sync(self, replicas):
+        primary = connections['default']
+        primary.ensure_connection()
+        for alias in replicas:
+            replica = sqlite3.connect(connections[alias].settings_dict['NAME'])
+            try:
+                primary.connection.backup(replica)
+            finally:
+                replica.close()
+            self.stdout.write('Synced {} from default'.format(alias))
@@ -0,0 +1,42 @@
+from django.db import migrations
+
+CREATE_SQL = (
+    "CREATE VIRTUAL TABLE IF NOT EXISTS jengabay_item_fts USING fts5("
+    "item_name, item_description, category, seller, location, "
+    "tokenize = 'unicode61 remove_diacritics 2')"
+)
+
+POPULATE_SQL = (
+    "INSERT INTO jengabay_item_fts(rowid, item_name, item_description, category, seller, location) "
+    "SELECT i.id, i.item_name, COALESCE(i.item_description, ''), i.category, s.business_name, "
+    "s.local_area_name || ' ' || s.town || ' ' || s.building || ' ' || s.street || ' ' || "
+    "sc.subcounty_name || ' ' || c.county_name "
+    "FROM jengabay_item i "
+    "INNER JOIN jengabay_seller s ON s.id = i.item_seller_id "
+    "INNER JOIN jengabay_subcounty sc ON sc.id = s.sub_county_id "
+    "INNER JOIN jengabay_county c ON c.id = sc.county_id"
+)
+
+
+def create_search_index(apps, schema_editor):
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    schema_editor.execute(CREATE_SQL)
+    schema_editor.execute(POPULATE_SQL)
+
+
+def drop_search_index(apps, schema_editor):
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    schema_editor.execute("DROP TABLE IF EXISTS jengabay_item_fts")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("jengabay", "0002_alter_order_payment_transaction_and_more"),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
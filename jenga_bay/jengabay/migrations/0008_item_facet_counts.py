@@ -0,0 +1,39 @@
+# Generated by Django 5.0.7 on 2026-10-18 15:38
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import Count
+
+
+def count_items(apps, schema_editor):
+    Item = apps.get_model('jengabay', 'Item')
+    ItemFacetCount = apps.get_model('jengabay', 'ItemFacetCount')
+    rows = Item.objects.order_by().values_list('category', 'item_seller__sub_county').annotate(count=Count('id'))
+    ItemFacetCount.objects.bulk_create([
+        ItemFacetCount(category=category, sub_county_id=sub_county_id, item_count=count)
+        for category, sub_county_id, count in rows
+    ])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('jengabay', '0007_sales_summaries'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ItemFacetCount',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('category', models.CharField(choices=[('metal and steel work', 'Metal and Steel Work'), ('cement', 'Cement'), ('ceramics', 'Ceramics'), ('plastics', 'plastics'), ('wood and timber', 'Wood and Timber'), ('sand and stone', 'Sand and Stone'), ('bricks and masonry', 'Bricks and Masonry'), ('fabricators', 'Fabricators'), ('tools', 'Tools'), ('glass', 'Glass'), ('electrical systems', 'Electrical Systems'), ('paints', 'Paints'), ('plumbing', 'Plumbing'), ('security systems', 'Security Systems'), ('doors and windows', 'Doors and Windows'), ('telecommunications equipment', 'Telecomunications Equipment'), ('building safety', 'Building Safety'), ('furniture', 'Furniture'), ('surface finishing', 'Surface Finishing'), ('protection', 'Protection'), ('roofing', 'Roofing'), ('conveyor systems', 'Conveyor Systems'), ('composites', 'Composites'), ('flooring', 'Flooring'), ('adhesives', 'Adhesives'), ('others', 'Others')], max_length=50)),
+                ('item_count', models.IntegerField(default=0)),
+                ('sub_county', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='jengabay.subcounty')),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name='itemfacetcount',
+            constraint=models.UniqueConstraint(fields=('category', 'sub_county'), name='unique_item_facet_count'),
+        ),
+        migrations.RunPython(count_items, migrations.RunPython.noop),
+    ]
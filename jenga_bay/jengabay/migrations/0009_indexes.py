@@ -0,0 +1,48 @@
+# Generated by Django 5.0.7 on 2026-10-18 16:14
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('jengabay', '0008_item_facet_counts'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='item',
+            name='item_seller',
+            field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, to='jengabay.seller'),
+        ),
+        migrations.AlterField(
+            model_name='order',
+            name='payment_transaction',
+            field=models.ForeignKey(db_index=False, null=True, on_delete=django.db.models.deletion.SET_NULL, to='jengabay.transaction'),
+        ),
+        migrations.AddIndex(
+            model_name='item',
+            index=models.Index(fields=['item_seller', 'category'], name='item_seller_category_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='item',
+            index=models.Index(fields=['item_seller', 'item_price'], name='item_seller_price_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='item',
+            index=models.Index(fields=['category', 'id'], name='item_category_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='item',
+            index=models.Index(fields=['category', 'item_price'], name='item_category_price_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='item',
+            index=models.Index(fields=['item_price'], name='item_price_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='order',
+            index=models.Index(fields=['payment_transaction', 'date_placed'], name='order_transaction_date_idx'),
+        ),
+    ]
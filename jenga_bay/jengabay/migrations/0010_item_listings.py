@@ -0,0 +1,106 @@
+# Generated by Django 5.0.7 on 2026-10-18 16:22
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+COLUMNS = (
+    'item_id', 'item_name', 'item_description', 'item_price', 'item_measurement_unit', 'item_main_image',
+    'item_extra_image1', 'item_extra_image2', 'item_extra_image3', 'item_extra_image4', 'category', 'sku',
+    'updated_at', 'seller_id', 'seller_profile_id', 'business_name', 'phone_number', 'town', 'local_area_name',
+    'street', 'building', 'profile_pic', 'seller_updated_at', 'sub_county_id', 'subcounty_name', 'county_id',
+    'county_name', 'county_code',
+)
+
+POPULATE_SQL = (
+    "INSERT INTO jengabay_itemlisting ({}) "
+    "SELECT i.id, i.item_name, i.item_description, i.item_price, i.item_measurement_unit, i.item_main_image, "
+    "i.item_extra_image1, i.item_extra_image2, i.item_extra_image3, i.item_extra_image4, i.category, i.sku, "
+    "i.updated_at, s.id, s.profile_id, s.business_name, s.phone_number, s.town, s.local_area_name, "
+    "s.street, s.building, s.profile_pic, s.updated_at, sc.id, sc.subcounty_name, c.id, "
+    "c.county_name, c.code "
+    "FROM jengabay_item i "
+    "INNER JOIN jengabay_seller s ON s.id = i.item_seller_id "
+    "INNER JOIN jengabay_subcounty sc ON sc.id = s.sub_county_id "
+    "INNER JOIN jengabay_county c ON c.id = sc.county_id"
+).format(', '.join(COLUMNS))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('jengabay', '0009_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ItemListing',
+            fields=[
+                ('item', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='listing', serialize=False, to='jengabay.item')),
+                ('item_name', models.CharField(max_length=100)),
+                ('item_description', models.TextField(null=True)),
+                ('item_price', models.FloatField()),
+                ('item_measurement_unit', models.CharField(max_length=100)),
+                ('item_main_image', models.CharField(max_length=100)),
+                ('item_extra_image1', models.CharField(max_length=100, null=True)),
+                ('item_extra_image2', models.CharField(max_length=100, null=True)),
+                ('item_extra_image3', models.CharField(max_length=100, null=True)),
+                ('item_extra_image4', models.CharField(max_length=100, null=True)),
+                ('category', models.CharField(choices=[('metal and steel work', 'Metal and Steel Work'), ('cement', 'Cement'), ('ceramics', 'Ceramics'), ('plastics', 'plastics'), ('wood and timber', 'Wood and Timber'), ('sand and stone', 'Sand and Stone'), ('bricks and masonry', 'Bricks and Masonry'), ('fabricators', 'Fabricators'), ('tools', 'Tools'), ('glass', 'Glass'), ('electrical systems', 'Electrical Systems'), ('paints', 'Paints'), ('plumbing', 'Plumbing'), ('security systems', 'Security Systems'), ('doors and windows', 'Doors and Windows'), ('telecommunications equipment', 'Telecomunications Equipment'), ('building safety', 'Building Safety'), ('furniture', 'Furniture'), ('surface finishing', 'Surface Finishing'), ('protection', 'Protection'), ('roofing', 'Roofing'), ('conveyor systems', 'Conveyor Systems'), ('composites', 'Composites'), ('flooring', 'Flooring'), ('adhesives', 'Adhesives'), ('others', 'Others')], max_length=50)),
+                ('sku', models.CharField(max_length=100, null=True)),
+                ('updated_at', models.DateTimeField()),
+                ('seller_profile_id', models.IntegerField()),
+                ('business_name', models.CharField(max_length=200)),
+                ('phone_number', models.CharField(max_length=15)),
+                ('town', models.CharField(max_length=50)),
+                ('local_area_name', models.CharField(max_length=100)),
+                ('street', models.CharField(max_length=100)),
+                ('building', models.CharField(max_length=100)),
+                ('profile_pic', models.CharField(max_length=100)),
+                ('seller_updated_at', models.DateTimeField()),
+                ('subcounty_name', models.CharField(max_length=100)),
+                ('county_name', models.CharField(max_length=100)),
+                ('county_code', models.IntegerField()),
+            ],
+        ),
+        migrations.RemoveIndex(
+            model_name='item',
+            name='item_category_idx',
+        ),
+        migrations.RemoveIndex(
+            model_name='item',
+            name='item_category_price_idx',
+        ),
+        migrations.RemoveIndex(
+            model_name='item',
+            name='item_price_idx',
+        ),
+        migrations.AddField(
+            model_name='itemlisting',
+            name='county',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='jengabay.county'),
+        ),
+        migrations.AddField(
+            model_name='itemlisting',
+            name='seller',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='jengabay.seller'),
+        ),
+        migrations.AddField(
+            model_name='itemlisting',
+            name='sub_county',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='jengabay.subcounty'),
+        ),
+        # the listings are copied before they are indexed
+        migrations.RunSQL(POPULATE_SQL, migrations.RunSQL.noop),
+        migrations.AddIndex(
+            model_name='itemlisting',
+            index=models.Index(fields=['category', 'item'], name='listing_category_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='itemlisting',
+            index=models.Index(fields=['category', 'item_price', 'item'], name='listing_category_price_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='itemlisting',
+            index=models.Index(fields=['item_price', 'item'], name='listing_price_idx'),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.0.7 on 2026-10-18 18:20
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('jengabay', '0013_transaction_updated_at'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='transaction',
+            name='idempotency_hash',
+            field=models.CharField(blank=True, default=None, max_length=64, null=True),
+        ),
+    ]
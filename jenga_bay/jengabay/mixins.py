@@ -0,0 +1,259 @@
+import hashlib
+import inspect
+
+from django.db.models import Count, Max
+from django.http import HttpResponse
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date, parse_http_date_safe, quote_etag
+from rest_framework.response import Response
+from . import instrumentation, routers
+from .cache import response_cache
+
+
+class ConditionalResponseMixin:
+    """A mixin for list and retrieve views that sets ETag and Last-Modified headers and
+    answers If-None-Match/If-Modified-Since requests with 304 Not Modified.
+
+    The validators come from the `updated_at` timestamps named in `validator_fields`,
+    lists take their maximum and row count in one aggregate query over the filtered
+    queryset instead of serializing it, retrieved objects use their own timestamps"""
+
+    validator_fields = ('updated_at',)
+
+    def get_list_validators(self):
+        """returns the row count and the latest timestamps of the filtered queryset"""
+        aggregates = {'count': Count('pk')}
+        aggregates.update({field: Max(field) for field in self.validator_fields})
+        values = self.filter_queryset(self.get_queryset()).aggregate(**aggregates)
+        return [values.pop('count')], [values[field] for field in self.validator_fields]
+
+    def get_object_validators(self, instance):
+        timestamps = []
+        for field in self.validator_fields:
+            value = instance
+            for attribute in field.split('__'):
+                value = getattr(value, attribute)
+            timestamps.append(value)
+        return [instance.pk], timestamps
+
+    async def aget_list_validators(self):
+        aggregates = {'count': Count('pk')}
+        aggregates.update({field: Max(field) for field in self.validator_fields})
+        values = await self.filter_queryset(self.get_queryset()).aaggregate(**aggregates)
+        return [values.pop('count')], [values[field] for field in self.validator_fields]
+
+    def get_validators(self, request, keys, timestamps):
+        """returns the ETag and the Last-Modified timestamp of a representation"""
+        timestamps = [timestamp for timestamp in timestamps if timestamp is not None]
+        last_modified = int(max(timestamps).timestamp()) if timestamps else None
+        version = '|'.join([request.get_full_path()] + [str(key) for key in keys]
+                           + [timestamp.isoformat() for timestamp in timestamps])
+        return quote_etag(hashlib.md5(version.encode()).hexdigest()), last_modified
+
+    def set_validators(self, response, etag, last_modified):
+        if response.status_code == 200:
+            response['ETag'] = etag
+            if last_modified is not None:
+                response['Last-Modified'] = http_date(last_modified)
+        return response
+
+    def conditional_response(self, request, keys, timestamps, respond):
+        """returns 304 Not Modified if the client holds the current representation,
+        otherwise the response of `respond()` carrying the validators"""
+        etag, last_modified = self.get_validators(request, keys, timestamps)
+        response = get_conditional_response(request, etag=etag, last_modified=last_modified)
+        if response is None:
+            response = self.set_validators(respond(), etag, last_modified)
+        return response
+
+    async def aconditional_response(self, request, keys, timestamps, arespond):
+        etag, last_modified = self.get_validators(request, keys, timestamps)
+        response = get_conditional_response(request, etag=etag, last_modified=last_modified)
+        if response is None:
+            response = self.set_validators(await arespond(), etag, last_modified)
+        return response
+
+    def list(self, request, *args, **kwargs):
+        keys, timestamps = self.get_list_validators()
+        return self.conditional_response(request, keys, timestamps,
+                                         lambda: super(ConditionalResponseMixin, self).list(request, *args, **kwargs))
+
+    async def alist(self, request, *args, **kwargs):
+        keys, timestamps = await self.aget_list_validators()
+        return await self.aconditional_response(request, keys, timestamps,
+                                                lambda: super(ConditionalResponseMixin, self).alist(request, *args, **kwargs))
+
+    def retrieve(self, request, *args, **kwargs):
+        # the object is looked up first so that its permissions are checked before anything is answered
+        instance = self.get_object()
+        keys, timestamps = self.get_object_validators(instance)
+        return self.conditional_response(request, keys, timestamps,
+                                         lambda: Response(self.get_serializer(instance).data))
+
+
+
+class CachedResponseMixin:
+    """A mixin for public read views that serves repeated GET requests from the versioned
+    response cache, see jengabay.cache.
+    Views list the scopes a response depends on in `get_cache_scopes()`, only JSON
+    responses are cached since the browsable API shows the logged in user. Misses are
+    built from the primary, as a replica may not hold the writes that evicted them yet"""
+
+    cached_headers = ('ETag', 'Last-Modified')
+
+    def get_cache_scopes(self):
+        raise NotImplementedError('`get_cache_scopes()` must be implemented.')
+
+    def cached_response(self, request, entry):
+        content, content_type, headers = entry
+        last_modified = parse_http_date_safe(headers['Last-Modified']) if 'Last-Modified' in headers else None
+        response = get_conditional_response(request, etag=headers.get('ETag'), last_modified=last_modified)
+        if response is None:
+            response = HttpResponse(content, content_type=content_type)
+            for header, value in headers.items():
+                response[header] = value
+        response['X-Cache'] = 'HIT'
+        return response
+
+    def cache_response(self, key, response):
+        """stores the response once it is rendered"""
+        response['X-Cache'] = 'MISS'
+        if response.status_code == 200:
+            response.add_post_render_callback(lambda response: response_cache.set(key, (
+                response.content, response['Content-Type'],
+                {header: response[header] for header in self.cached_headers if response.has_header(header)},
+            )))
+        return response
+
+    def get(self, request, *args, **kwargs):
+        if request.accepted_renderer.format != 'json':
+            return super().get(request, *args, **kwargs)
+
+        key = response_cache.make_key(request, self.get_cache_scopes(), request.accepted_renderer.format)
+        entry = response_cache.get(key)
+        if entry is not None:
+            return self.cached_response(request, entry)
+        routers.read_primary()
+        return self.cache_response(key, super().get(request, *args, **kwargs))
+
+    async def aget(self, request, *args, **kwargs):
+        if request.accepted_renderer.format != 'json':
+            return await super().aget(request, *args, **kwargs)
+
+        key = await response_cache.amake_key(request, self.get_cache_scopes(), request.accepted_renderer.format)
+        entry = await response_cache.aget(key)
+        if entry is not None:
+            return self.cached_response(request, entry)
+        routers.read_primary()
+        return self.cache_response(key, await super().aget(request, *args, **kwargs))
+
+
+class InstrumentedViewMixin:
+    """A mixin timing the authentication, permission checks, serializers and renderer of the
+    requests sampled by jengabay.instrumentation. The authenticators, serializers and renderer
+    are created per request, their methods are wrapped on the instances"""
+
+    def get_authenticators(self):
+        authenticators = super().get_authenticators()
+        if instrumentation.current() is not None:
+            # authentication may run lazily, on the first access of request.user
+            for authenticator in authenticators:
+                authenticator.authenticate = instrumentation.timed('auth', authenticator.authenticate)
+        return authenticators
+
+    def check_permissions(self, request):
+        with instrumentation.phase('perm'):
+            super().check_permissions(request)
+
+    def check_object_permissions(self, request, obj):
+        with instrumentation.phase('perm'):
+            super().check_object_permissions(request, obj)
+
+    def get_serializer(self, *args, **kwargs):
+        serializer = super().get_serializer(*args, **kwargs)
+        if instrumentation.current() is not None:
+            serializer.is_valid = instrumentation.timed('ser', serializer.is_valid)
+            serializer.to_representation = instrumentation.timed('ser', serializer.to_representation)
+        return serializer
+
+    def finalize_response(self, request, response, *args, **kwargs):
+        response = super().finalize_response(request, response, *args, **kwargs)
+        renderer = getattr(response, 'accepted_renderer', None)
+        if renderer is not None and instrumentation.current() is not None:
+            # responses are rendered after the view returns
+            renderer.render = instrumentation.timed('render', renderer.render)
+        return response
+
+
+class AsyncDispatchMixin:
+    """The asynchronous counterpart of APIView.dispatch, prepended to views by `as_async_view()`.
+    Authentication is deferred to the first access of `request.user`, as it may query the database"""
+
+    async def dispatch(self, request, *args, **kwargs):
+        self.args = args
+        self.kwargs = kwargs
+        request = self.initialize_request(request, *args, **kwargs)
+        self.request = request
+        self.headers = self.default_response_headers
+
+        try:
+            self.initial(request, *args, **kwargs)
+            if request.method.lower() in self.http_method_names:
+                handler = getattr(self, request.method.lower(), self.http_method_not_allowed)
+            else:
+                handler = self.http_method_not_allowed
+            response = handler(request, *args, **kwargs)
+            if inspect.isawaitable(response):
+                response = await response
+        except Exception as exc:
+            response = self.handle_exception(exc)
+
+        self.response = self.finalize_response(request, response, *args, **kwargs)
+        return self.response
+
+    def perform_authentication(self, request):
+        pass
+
+
+def _native_handler(method):
+    async def handler(self, request, *args, **kwargs):
+        return await getattr(self, 'a' + method)(request, *args, **kwargs)
+    handler.__name__ = method
+    return handler
+
+
+class AsyncViewMixin:
+    """A mixin for views that can also be served as native coroutines with `as_async_view()`,
+    e.g. under ASGI, instead of going through the sync adapter on every request.
+
+    Views implement the handlers served this way as coroutines named after the method with
+    an 'a' prefix (`aget`, `apost`), those must not touch `request.user` or query the
+    database synchronously. `as_view()` keeps serving the regular handlers"""
+
+    @classmethod
+    def as_async_view(cls, **initkwargs):
+        methods = [method for method in cls.http_method_names if hasattr(cls, 'a' + method)]
+        handlers = {method: _native_handler(method) for method in methods}
+        handlers['http_method_names'] = methods + (['head'] if 'get' in methods else []) + ['options']
+        async_view_class = type('Async' + cls.__name__, (AsyncDispatchMixin, cls), handlers)
+        return async_view_class.as_view(**initkwargs)
+
+
+class AsyncListMixin(AsyncViewMixin):
+    """Serves list views natively, the mixins above provide async counterparts of their
+    methods and the rows are fetched with the async ORM"""
+
+    async def aget(self, request, *args, **kwargs):
+        return await self.alist(request, *args, **kwargs)
+
+    async def apaginate_queryset(self, queryset):
+        if self.paginator is None:
+            return None
+        return await self.paginator.apaginate_queryset(queryset, self.request, view=self)
+
+    async def alist(self, request, *args, **kwargs):
+        queryset = self.filter_queryset(self.get_queryset())
+        page = await self.apaginate_queryset(queryset)
+        if page is not None:
+            return self.get_paginated_response(self.get_serializer(page, many=True).data)
+        return Response(self.get_serializer([instance async for instance in queryset], many=True).data)
@@ -2,6 +2,7 @@ from django.db import models
 from django.db.models.deletion import CASCADE, PROTECT, SET_NULL
 from datetime import datetime, timezone
 from django.contrib.auth.models import User
+from django.utils.timezone import now
 from django.db.models.fields.related import ForeignKey
 class County(models.Model):
     '''Creates county entity instances'''
@@ -37,6 +38,10 @@ class Seller(models.Model):
     business_reg_doc = models.ImageField(upload_to='images/profile', default='images/profile/profile.jpg')
     profile_pic = models.ImageField(upload_to='images/profile', default='images/profile/profile.jpg')
     registration_date = models.DateTimeField(null=True, default=datetime.now)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    # images served with resized derivatives, see jengabay.images
+    derivative_image_fields = ('profile_pic',)
 
     def __str__(self):
         '''returns a string representation of an instance of this model'''
@@ -88,7 +93,8 @@ class Item(models.Model):
 
     item_name = models.CharField(max_length=100, null=False)
     item_description = models.TextField(null=True)
-    item_seller = models.ForeignKey(Seller, on_delete=CASCADE)
+    # indexed first in the (item_seller, category) index
+    item_seller = models.ForeignKey(Seller, on_delete=CASCADE, db_index=False)
     item_price = models.FloatField(null=False)
     item_measurement_unit = models.CharField(max_length=100, null=False)
     item_main_image = models.ImageField(upload_to='images/product', default='images/product/main.jpg', null=False)
@@ -97,6 +103,26 @@ class Item(models.Model):
     item_extra_image3 = models.ImageField(upload_to='images/product', default='images/product/extra3.jpg', null=True)
     item_extra_image4 = models.ImageField(upload_to='images/product', default='images/product/extra4.jpg', null=True)
     category = models.CharField(max_length=50, choices=options, default = 'others')
+    sku = models.CharField(max_length=100, null=True, blank=True, default=None)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    # images served with resized derivatives, see jengabay.images
+    derivative_image_fields = (
+        'item_main_image', 'item_extra_image1', 'item_extra_image2', 'item_extra_image3', 'item_extra_image4',
+    )
+
+    class Meta:
+        constraints = [
+            # a seller supplied stock keeping unit identifies an item of that seller on re-imports
+            models.UniqueConstraint(fields=['item_seller', 'sku'], condition=models.Q(sku__isnull=False),
+                                    name='unique_seller_item_sku'),
+        ]
+        # the orderings and filters of the seller item lists, see jengabay.filters,
+        # the catalog is read from ItemListing
+        indexes = [
+            models.Index(fields=['item_seller', 'category'], name='item_seller_category_idx'),
+            models.Index(fields=['item_seller', 'item_price'], name='item_seller_price_idx'),
+        ]
 
     def __str__(self):
         '''returns a string representation of an instance of this model'''
@@ -117,6 +143,17 @@ class Transaction(models.Model):
     transaction_code = models.CharField(max_length=200, null=False)
     recipient = models.ForeignKey(Seller, null=False, on_delete=CASCADE)
     payer = models.ForeignKey(Buyer, on_delete=SET_NULL, null=True)
+    # client supplied key of the order submission that created the transaction
+    idempotency_key = models.CharField(max_length=255, null=True, blank=True, default=None)
+    # sha256 of the submission, a retry must carry the same body
+    idempotency_hash = models.CharField(max_length=64, null=True, blank=True, default=None)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['payer', 'idempotency_key'], condition=models.Q(idempotency_key__isnull=False),
+                                    name='unique_payer_idempotency_key'),
+        ]
 
 class Order(models.Model):
     """Creats an instance of an order entity"""
@@ -126,4 +163,177 @@ class Order(models.Model):
     total_amount_payable = models.FloatField(null=False)
     is_delivered = models.BooleanField(default=False, null=False)
     date_delivered = models.DateTimeField(null=True)
-    payment_transaction = models.ForeignKey(Transaction, on_delete=SET_NULL, null=True)
\ No newline at end of file
+    # indexed first in the (payment_transaction, date_placed) index
+    payment_transaction = models.ForeignKey(Transaction, on_delete=SET_NULL, null=True, db_index=False)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        indexes = [
+            # the orders of a seller or buyer are found through the recipient or payer
+            # index of their transactions, then filtered by date from this index
+            models.Index(fields=['payment_transaction', 'date_placed'], name='order_transaction_date_idx'),
+        ]
+
+class SellerDailySales(models.Model):
+    """Sales summary of the orders a seller received on a day, kept up to date
+    incrementally by jengabay.analytics"""
+
+    seller = models.ForeignKey(Seller, on_delete=CASCADE)
+    date = models.DateField()
+    revenue = models.FloatField(default=0)
+    order_count = models.IntegerField(default=0)
+    delivered_count = models.IntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['seller', 'date'], name='unique_seller_daily_sales'),
+        ]
+
+    @property
+    def pending_count(self):
+        return self.order_count - self.delivered_count
+
+
+class ItemSales(models.Model):
+    """Number of orders including an item, kept up to date incrementally by jengabay.analytics"""
+
+    item = models.OneToOneField(Item, on_delete=CASCADE, primary_key=True)
+    order_count = models.IntegerField(default=0)
+
+
+class ItemFacetCount(models.Model):
+    """Number of items of a category sold in a sub county, kept up to date
+    incrementally by jengabay.facets"""
+
+    category = models.CharField(max_length=50, choices=Item.options)
+    sub_county = models.ForeignKey(SubCounty, on_delete=CASCADE)
+    item_count = models.IntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['category', 'sub_county'], name='unique_item_facet_count'),
+        ]
+
+
+class ItemListing(models.Model):
+    """Copy of an item flattened with its seller, sub county and county, the catalog is read
+    from this table without joins. Kept up to date by jengabay.listings"""
+
+    item = models.OneToOneField(Item, on_delete=CASCADE, primary_key=True, related_name='listing')
+    item_name = models.CharField(max_length=100)
+    item_description = models.TextField(null=True)
+    item_price = models.FloatField()
+    item_measurement_unit = models.CharField(max_length=100)
+    item_main_image = models.CharField(max_length=100)
+    item_extra_image1 = models.CharField(max_length=100, null=True)
+    item_extra_image2 = models.CharField(max_length=100, null=True)
+    item_extra_image3 = models.CharField(max_length=100, null=True)
+    item_extra_image4 = models.CharField(max_length=100, null=True)
+    category = models.CharField(max_length=50, choices=Item.options)
+    sku = models.CharField(max_length=100, null=True)
+    updated_at = models.DateTimeField()
+    seller = models.ForeignKey(Seller, on_delete=CASCADE, related_name='+')
+    seller_profile_id = models.IntegerField()
+    business_name = models.CharField(max_length=200)
+    phone_number = models.CharField(max_length=15)
+    town = models.CharField(max_length=50)
+    local_area_name = models.CharField(max_length=100)
+    street = models.CharField(max_length=100)
+    building = models.CharField(max_length=100)
+    profile_pic = models.CharField(max_length=100)
+    seller_updated_at = models.DateTimeField()
+    sub_county = models.ForeignKey(SubCounty, on_delete=CASCADE, related_name='+')
+    subcounty_name = models.CharField(max_length=100)
+    county = models.ForeignKey(County, on_delete=CASCADE, related_name='+')
+    county_name = models.CharField(max_length=100)
+    county_code = models.IntegerField()
+
+    class Meta:
+        # the orderings and filters of the catalog, see jengabay.filters. The item id breaking
+        # ties is listed, unlike the rowid it is not part of every SQLite index
+        indexes = [
+            models.Index(fields=['category', 'item'], name='listing_category_idx'),
+            models.Index(fields=['category', 'item_price', 'item'], name='listing_category_price_idx'),
+            models.Index(fields=['item_price', 'item'], name='listing_price_idx'),
+        ]
+
+    # the fields of the item, seller, sub county and county held by the listing columns
+    item_columns = {
+        'id': 'item_id', 'item_name': 'item_name', 'item_description': 'item_description',
+        'item_price': 'item_price', 'item_measurement_unit': 'item_measurement_unit',
+        'item_main_image': 'item_main_image', 'item_extra_image1': 'item_extra_image1',
+        'item_extra_image2': 'item_extra_image2', 'item_extra_image3': 'item_extra_image3',
+        'item_extra_image4': 'item_extra_image4', 'category': 'category', 'sku': 'sku', 'updated_at': 'updated_at',
+    }
+    seller_columns = {
+        'id': 'seller_id', 'profile_id': 'seller_profile_id', 'business_name': 'business_name',
+        'phone_number': 'phone_number', 'town': 'town', 'local_area_name': 'local_area_name', 'street': 'street',
+        'building': 'building', 'profile_pic': 'profile_pic', 'updated_at': 'seller_updated_at',
+    }
+    sub_county_columns = {'id': 'sub_county_id', 'subcounty_name': 'subcounty_name'}
+    county_columns = {'id': 'county_id', 'county_name': 'county_name', 'code': 'county_code'}
+
+    def as_item(self):
+        """returns the unsaved item held by the listing, with its seller, sub county and county.
+        The fields of deferred columns keep their defaults"""
+        loaded = self.__dict__
+
+        def copy(model, columns, **related):
+            return model(**{field: loaded[column] for field, column in columns.items() if column in loaded}, **related)
+
+        county = copy(County, self.county_columns)
+        sub_county = copy(SubCounty, self.sub_county_columns, county=county)
+        seller = copy(Seller, self.seller_columns, sub_county=sub_county)
+        return copy(Item, self.item_columns, item_seller=seller)
+
+
+class Task(models.Model):
+    """A call of a background task function waiting for the workers of jengabay.tasks.
+    Tasks are deleted once they succeed, the ones failing every attempt are kept as dead"""
+
+    QUEUED = 'queued'
+    RUNNING = 'running'
+    DEAD = 'dead'
+    statuses = (
+        (QUEUED, 'Queued'),
+        (RUNNING, 'Running'),
+        (DEAD, 'Dead'),
+    )
+
+    name = models.CharField(max_length=200)
+    args = models.JSONField(default=list)
+    kwargs = models.JSONField(default=dict)
+    # higher priorities run first
+    priority = models.SmallIntegerField(default=0)
+    status = models.CharField(max_length=10, choices=statuses, default=QUEUED)
+    attempts = models.PositiveSmallIntegerField(default=0)
+    max_attempts = models.PositiveSmallIntegerField(default=5)
+    run_after = models.DateTimeField(default=now)
+    locked_by = models.CharField(max_length=100, null=True, blank=True)
+    locked_at = models.DateTimeField(null=True)
+    last_error = models.TextField(blank=True, default='')
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [
+            # the due tasks are claimed in this order
+            models.Index(fields=['status', '-priority', 'run_after'], name='task_queue_idx'),
+        ]
+
+    def __str__(self):
+        return '{} ({})'.format(self.name, self.status)
+
+
+class TokenVersion(models.Model):
+    """Version of the signed access tokens of a user, the tokens issued with an older version
+    are revoked, see jengabay.signed_tokens"""
+
+    user = models.OneToOneField(User, on_delete=CASCADE, primary_key=True, related_name='token_version')
+    version = models.PositiveIntegerField(default=0)
+
+
+class RevokedToken(models.Model):
+    """Id of a signed access token revoked before it expires e.g. on logout, kept until then"""
+
+    jti = models.CharField(max_length=32, primary_key=True)
+    expires_at = models.DateTimeField(db_index=True)
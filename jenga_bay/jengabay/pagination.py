@@ -0,0 +1,182 @@
+import json
+from datetime import date, datetime
+
+from django.core.exceptions import FieldDoesNotExist, ValidationError
+from django.db.models import Q
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import CursorPagination, _reverse_ordering
+
+
+def _is_nullable(model, name):
+    """returns True if the named field of the model may be NULL, False for the pk and annotations"""
+    try:
+        return model._meta.get_field(name).null
+    except FieldDoesNotExist:
+        return False
+
+
+def following_rows(model, ordering, position):
+    """returns the condition matching the rows after `position`, the values of the `ordering`
+    fields of a row, in that ordering: `(a > x) OR (a = x AND b > y) ...`.
+    NULLs sort first as in SQLite. A redundant bound on the first field lets the database
+    seek an index on it instead of testing every row"""
+    following = Q(pk__in=[])
+    equal = Q()
+    for order, value in zip(ordering, position):
+        name = order.lstrip('-')
+        descending = order.startswith('-')
+        nullable = _is_nullable(model, name)
+        if value is None:
+            # NULL is the first value ascending and the last one descending
+            after = Q(pk__in=[]) if descending else Q(**{name + '__isnull': False})
+            same = Q(**{name + '__isnull': True})
+        else:
+            after = Q(**{name + ('__lt' if descending else '__gt'): value})
+            if descending and nullable:
+                after |= Q(**{name + '__isnull': True})
+            same = Q(**{name: value})
+        following |= equal & after
+        equal &= same
+
+    first, value = ordering[0], position[0]
+    if value is not None and not (first.startswith('-') and _is_nullable(model, first.lstrip('-'))):
+        following &= Q(**{first.lstrip('-') + ('__lte' if first.startswith('-') else '__gte'): value})
+    return following
+
+
+class IdCursorPagination(CursorPagination):
+    """Keyset pagination over the primary key, or any ordering ending with it.
+    Pages are fetched with `WHERE id > <cursor> LIMIT n` instead of OFFSET and no COUNT(*)
+    is issued, cursors are opaque and stay valid while new rows are inserted.
+    Views may cap the page size a client can request with a `max_page_size` attribute.
+
+    The ordering is given by the first filter backend of the view returning one from its
+    `get_ordering()`, e.g. a search ranking or an `ordering` query parameter. Cursors hold
+    the values of every ordering field of the last row, so rows sharing e.g. a price are
+    neither skipped nor repeated across pages.
+
+    The page query is built by `get_page_queryset()` and the fetched rows are turned into
+    the page by `set_page()`, so async views can fetch the rows with the async ORM
+    through `apaginate_queryset()`"""
+
+    page_size = 50
+    page_size_query_param = 'page_size'
+    max_page_size = 200
+    ordering = ('pk',)
+
+    def get_page_queryset(self, queryset, request, view=None):
+        """returns the query of the rows of the requested page and the one following it,
+        None if the view is not paginated"""
+        self.max_page_size = getattr(view, 'max_page_size', self.max_page_size)
+        self.request = request
+        self.page_size = self.get_page_size(request)
+        if not self.page_size:
+            return None
+
+        self.base_url = request.build_absolute_uri()
+        self.ordering = self.get_ordering(request, queryset, view)
+        self.cursor = self.decode_cursor(request)
+        if self.cursor is None:
+            offset, reverse, current_position = 0, False, None
+        else:
+            offset, reverse, current_position = self.cursor
+
+        if reverse:
+            queryset = queryset.order_by(*_reverse_ordering(self.ordering))
+        else:
+            queryset = queryset.order_by(*self.ordering)
+
+        if current_position is not None:
+            ordering = _reverse_ordering(self.ordering) if reverse else self.ordering
+            try:
+                queryset = queryset.filter(following_rows(queryset.model, ordering, self.decode_position(current_position)))
+            except (TypeError, ValueError, ValidationError):
+                raise NotFound(self.invalid_cursor_message)
+
+        # one extra row tells whether a following page exists
+        return queryset[offset:offset + self.page_size + 1]
+
+    def get_ordering(self, request, queryset, view):
+        """returns the ordering of the first filter backend ordering the list, unlike DRF which
+        only asks the first backend having a `get_ordering()`"""
+        for backend in getattr(view, 'filter_backends', []):
+            if hasattr(backend, 'get_ordering'):
+                ordering = backend().get_ordering(request, queryset, view)
+                if ordering:
+                    return tuple(ordering)
+        return self.ordering
+
+    def decode_position(self, position):
+        """returns the ordering values held by a cursor position"""
+        try:
+            values = json.loads(position)
+        except ValueError:
+            raise NotFound(self.invalid_cursor_message)
+        if not isinstance(values, list):
+            # a bare id, as held by the cursors issued before positions listed every ordering field
+            values = [values]
+        if len(values) != len(self.ordering):
+            raise NotFound(self.invalid_cursor_message)
+        return values
+
+    def _get_position_from_instance(self, instance, ordering):
+        values = []
+        for order in ordering:
+            value = getattr(instance, order.lstrip('-'))
+            if isinstance(value, (date, datetime)):
+                value = value.isoformat()
+            values.append(value)
+        return json.dumps(values, separators=(',', ':'))
+
+    def set_page(self, results):
+        """returns the page made of the rows fetched with the page queryset and sets up its links"""
+        offset, reverse, current_position = self.cursor if self.cursor is not None else (0, False, None)
+        self.page = list(results[:self.page_size])
+
+        if len(results) > len(self.page):
+            has_following_position = True
+            following_position = self._get_position_from_instance(results[-1], self.ordering)
+        else:
+            has_following_position = False
+            following_position = None
+
+        if reverse:
+            # reversed cursors query in reverse order
+            self.page = list(reversed(self.page))
+            self.has_next = (current_position is not None) or (offset > 0)
+            self.has_previous = has_following_position
+            if self.has_next:
+                self.next_position = current_position
+            if self.has_previous:
+                self.previous_position = following_position
+        else:
+            self.has_next = has_following_position
+            self.has_previous = (current_position is not None) or (offset > 0)
+            if self.has_next:
+                self.next_position = following_position
+            if self.has_previous:
+                self.previous_position = current_position
+
+        if (self.has_previous or self.has_next) and self.template is not None:
+            self.display_page_controls = True
+        return self.page
+
+    def paginate_queryset(self, queryset, request, view=None):
+        page_queryset = self.get_page_queryset(queryset, request, view)
+        if page_queryset is None:
+            return None
+        return self.set_page(list(page_queryset))
+
+    async def apaginate_queryset(self, queryset, request, view=None):
+        page_queryset = self.get_page_queryset(queryset, request, view)
+        if page_queryset is None:
+            return None
+        return self.set_page([instance async for instance in page_queryset])
+
+
+class NewestFirstCursorPagination(IdCursorPagination):
+    """Keyset pagination listing the most recently created rows first,
+    ids are assigned in creation order so this matches e.g. the order placement date
+    while staying unique"""
+
+    ordering = ('-pk',)
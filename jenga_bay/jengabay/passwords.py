@@ -0,0 +1,53 @@
+"""Password verification off the event loop.
+
+Password hashing deliberately takes tens of milliseconds of CPU. Async views verify
+passwords in a thread pool instead of the event loop, hashlib releases the GIL while
+hashing so the loop keeps serving other requests and logins are hashed in parallel.
+"""
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.contrib.auth.hashers import make_password, verify_password
+
+_executor = None
+_lock = threading.Lock()
+
+
+def _get_executor():
+    global _executor
+    with _lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=settings.PASSWORD_HASHING_WORKERS,
+                                           thread_name_prefix='password-hashing')
+        return _executor
+
+
+async def run_hashing(function, *args):
+    """runs a password hashing function in the hashing thread pool"""
+    return await asyncio.get_running_loop().run_in_executor(_get_executor(), function, *args)
+
+
+async def aauthenticate(username, password, users=None):
+    """authenticates the credentials like django's ModelBackend and returns the active user
+    or None, `users` is the queryset the user is read from e.g. to select related rows"""
+    UserModel = get_user_model()
+    if users is None:
+        users = UserModel._default_manager.all()
+    try:
+        user = await users.aget(**{UserModel.USERNAME_FIELD: username})
+    except UserModel.DoesNotExist:
+        # hash anyway so the response time does not tell whether the user exists
+        await run_hashing(make_password, password)
+        return None
+
+    is_correct, must_update = await run_hashing(verify_password, password, user.password)
+    if not is_correct or not user.is_active:
+        return None
+    if must_update:
+        # the hasher or its work factor changed since the password was set
+        user.password = await run_hashing(make_password, password)
+        await user.asave(update_fields=['password'])
+    return user
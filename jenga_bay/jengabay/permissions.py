@@ -1,5 +1,5 @@
 from rest_framework import permissions
-from . models import Buyer, Seller
+from .roles import get_buyer, get_seller
 
 class IsItemSeller(permissions.BasePermission):
     """
@@ -13,7 +13,8 @@ class IsItemSeller(permissions.BasePermission):
             return True
 
         # Write permissions are only allowed to the owner of the object.
-        return obj.item_seller.profile == request.user
+        seller = get_seller(request.user)
+        return seller is not None and obj.item_seller_id == seller.id
 
 
 class IsAccountOwner(permissions.BasePermission):
@@ -23,8 +24,7 @@ class IsAccountOwner(permissions.BasePermission):
 
     def has_object_permission(self, request, view, obj):
         # Read and Write permissions are only allowed to the owner of the object.
-        if obj.profile == request.user:
-            return True
+        return obj.profile_id == request.user.id
 
 class IsABuyer(permissions.BasePermission):
     """
@@ -33,8 +33,7 @@ class IsABuyer(permissions.BasePermission):
 
     def has_permission(self, request, veiw):
         #Create permissions are only allowed to buyers.
-        if Buyer.objects.filter(profile=request.user).exists():
-            return True
+        return get_buyer(request.user) is not None
 
 class HasSellerPermission(permissions.BasePermission):
     """
@@ -43,8 +42,9 @@ class HasSellerPermission(permissions.BasePermission):
 
     def has_object_permission(self, request, view, obj):
         # Read and Write permissions are only allowed to the owner of the object.
-        if obj.payment_transaction.recipient.profile == request.user:
-            return True
+        seller = get_seller(request.user)
+        transaction = obj.payment_transaction
+        return seller is not None and transaction is not None and transaction.recipient_id == seller.id
 
 class HasBuyerOrderPermission(permissions.BasePermission):
     """
@@ -53,8 +53,9 @@ class HasBuyerOrderPermission(permissions.BasePermission):
 
     def has_object_permission(self, request, view, obj):
         # Read and Write permissions are only allowed to the owner of the object.
-        if obj.payment_transaction.sender.profile == request.user:
-            return True
+        buyer = get_buyer(request.user)
+        transaction = obj.payment_transaction
+        return buyer is not None and transaction is not None and transaction.payer_id == buyer.id
 
 class HasTransactionViewPermission(permissions.BasePermission):
     """
@@ -63,16 +64,15 @@ class HasTransactionViewPermission(permissions.BasePermission):
 
     def has_object_permission(self, request, view, obj):
         # Read and Write permissions are only allowed to the owner of the object.
-        if obj.recipient.profile == request.user:
-            return True
+        seller = get_seller(request.user)
+        return seller is not None and obj.recipient_id == seller.id
 
 
 class HasAddItemPermission(permissions.BasePermission):
     """
-    Custom permission to only allow a registered and logged in buyer to create an order.
+    Custom permission to only allow a registered and logged in seller to add an item.
     """
 
     def has_permission(self, request, veiw):
-        #Create permissions are only allowed to buyers.
-        if Seller.objects.filter(profile=request.user).exists():
-            return True
\ No newline at end of file
+        #Create permissions are only allowed to sellers.
+        return get_seller(request.user) is not None
@@ -0,0 +1,188 @@
+"""Renderers of API responses as JSON, and of flat rows as CSV and JSON Lines.
+
+FastJSONRenderer and FastJSONParser, the default JSON renderer and parser, encode and decode
+with orjson when it is installed. The responses are byte for byte the ones of DRF's
+JSONRenderer: values orjson writes differently (dates, decimals, lazy strings, integers over
+64 bits, non string keys) are handed to DRF's encoder or make the response fall back to it.
+Floats json writes in exponent notation are found in orjson's output, which also falls back.
+As orjson writes both None and floats that are not finite (which JSONRenderer refuses) as
+null, an output holding a null has its data looked through for these floats instead. Bodies holding integer literals over 18 digits, which orjson parses as
+floats, and bodies orjson rejects are parsed by DRF's JSONParser. Views may still pick DRF's
+JSONRenderer.
+
+Besides rendering the data of a Response (a row or a list of rows, e.g. an error), the
+row renderers stream an iterable of rows with `stream()`, encoding them in chunks of
+`rows_per_chunk` rows for a StreamingHttpResponse, so an export never holds more than a
+chunk of rendered rows in memory.
+"""
+import csv
+import io
+import json
+from decimal import Decimal
+
+from django.conf import settings
+from rest_framework.parsers import JSONParser
+from rest_framework.renderers import BaseRenderer, JSONRenderer
+from rest_framework.utils.encoders import JSONEncoder
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+# maps the digits to '0', an integer literal orjson may not parse exactly holds LONG_DIGITS
+DIGITS = bytes.maketrans(b'0123456789', b'0' * 10)
+LONG_DIGITS = b'0' * 19
+# deletes the digits, signs and points, and maps the ends of values to ',', so a float orjson
+# writes in exponent notation, e.g. 1e16 or 1.5e-7, becomes EXPONENT
+NUMBERS = bytes.maketrans(b'E:[]}', b'e,,,,')
+NUMBER_CHARACTERS = b'0123456789+-.'
+EXPONENT = b',e,'
+# how orjson starts the floats under 1e-4 it writes without an exponent, e.g. 0.00001
+SMALL_FLOAT = b'0.0000'
+
+
+def written_in_exponent_notation(content):
+    """tells whether orjson's output may hold a float json writes in exponent notation, 1e16
+    and 0.00001 being written as 1e+16 and 1e-05 by json, a string looking like one only
+    costs a fallback"""
+    numbers = content.translate(NUMBERS, NUMBER_CHARACTERS)
+    return EXPONENT in numbers or numbers == b'e' or SMALL_FLOAT in content
+
+
+def in_exponent_notation(value):
+    """tells whether json.dumps writes a float in exponent notation, or whether it is not finite"""
+    value = float(value)
+    return value != 0 and not 1e-4 <= abs(value) < 1e16
+
+
+def has_float(value, test):
+    """tells whether data holds a float, or a Decimal DRF's encoder turns into one, passing `test`"""
+    if isinstance(value, (float, Decimal)):
+        return test(value)
+    if isinstance(value, dict):
+        value = value.values()
+    elif not isinstance(value, (list, tuple)):
+        return False
+    for item in value:
+        # the exact types of most values skip the call
+        kind = type(item)
+        if kind is not str and kind is not int and item is not None and kind is not bool and has_float(item, test):
+            return True
+    return False
+
+
+class FastJSONRenderer(JSONRenderer):
+    """renders JSON with orjson, falling back to JSONRenderer for indented or ASCII output,
+    or when the data holds values orjson would write differently"""
+
+    # dates, times and dataclasses are encoded by DRF's encoder, as the other types orjson lacks
+    options = (orjson.OPT_PASSTHROUGH_DATETIME | orjson.OPT_PASSTHROUGH_DATACLASS) if orjson else 0
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+        indent = self.get_indent(accepted_media_type, renderer_context or {})
+        if orjson is None or indent is not None or self.ensure_ascii or not self.compact or not self.strict:
+            return super().render(data, accepted_media_type, renderer_context)
+        try:
+            content = orjson.dumps(data, default=self.encoder_class().default, option=self.options)
+        except TypeError:
+            # e.g. integers over 64 bits or non string keys
+            return super().render(data, accepted_media_type, renderer_context)
+        if b'null' in content:
+            # orjson writes floats that are not finite as null, as None, which only the data tells apart
+            fallback = has_float(data, in_exponent_notation)
+        else:
+            fallback = written_in_exponent_notation(content)
+        if fallback:
+            # rendered, or refused, by JSONRenderer
+            return super().render(data, accepted_media_type, renderer_context)
+        # escaped as JSONRenderer does, so the output is a strict javascript subset
+        if b'\xe2' in content:
+            content = content.replace('\u2028'.encode(), b'\\u2028').replace('\u2029'.encode(), b'\\u2029')
+        return content
+
+
+class FastJSONParser(JSONParser):
+    """parses JSON with orjson, input it rejects is parsed by JSONParser, which raises its usual errors"""
+
+    renderer_class = FastJSONRenderer
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        encoding = (parser_context or {}).get('encoding', settings.DEFAULT_CHARSET)
+        if orjson is None or not self.strict or encoding.lower().replace('-', '') != 'utf8':
+            return super().parse(stream, media_type, parser_context)
+        content = stream.read()
+        if LONG_DIGITS in content.translate(DIGITS):
+            # json parses integers over 64 bits exactly
+            return super().parse(io.BytesIO(content), media_type, parser_context)
+        try:
+            return orjson.loads(content)
+        except orjson.JSONDecodeError:
+            # e.g. escaped lone surrogates, which json accepts
+            return super().parse(io.BytesIO(content), media_type, parser_context)
+
+
+class RowStreamRenderer(BaseRenderer):
+    """base of the renderers writing one line per row, subclasses implement `get_writer()`"""
+
+    charset = 'utf-8'
+    rows_per_chunk = 500
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+        rows = data if isinstance(data, list) else [data]
+        fields = list(rows[0]) if rows else []
+        return b''.join(self.stream(rows, fields))
+
+    def stream(self, rows, fields):
+        """yields the encoded rows in chunks, `fields` are the columns of the rows"""
+        buffer = io.StringIO()
+        write = self.get_writer(buffer, fields)
+        for count, row in enumerate(rows, start=1):
+            write(row)
+            if count % self.rows_per_chunk == 0:
+                yield self.flush(buffer)
+        yield self.flush(buffer)
+
+    def flush(self, buffer):
+        chunk = buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+        return chunk.encode(self.charset)
+
+    def get_writer(self, buffer, fields):
+        """returns the function writing a row to the buffer, after writing any header"""
+        raise NotImplementedError
+
+
+class CSVRenderer(RowStreamRenderer):
+    """renders rows as CSV lines after a header line, list values are joined with spaces"""
+
+    media_type = 'text/csv'
+    format = 'csv'
+
+    def get_writer(self, buffer, fields):
+        writer = csv.DictWriter(buffer, fields, extrasaction='ignore')
+        writer.writeheader()
+
+        def write(row):
+            writer.writerow({field: ' '.join(map(str, value)) if isinstance(value, list) else value
+                             for field, value in row.items()})
+        return write
+
+
+class JSONLinesRenderer(RowStreamRenderer):
+    """renders every row as a JSON object on its own line"""
+
+    media_type = 'application/jsonl'
+    format = 'jsonl'
+
+    def get_writer(self, buffer, fields):
+        def write(row):
+            buffer.write(json.dumps(row, cls=JSONEncoder, ensure_ascii=False, separators=(',', ':')))
+            buffer.write('\n')
+        return write
@@ -0,0 +1,38 @@
+"""Resolution of the Seller or Buyer account behind a user.
+
+The accounts are read through the reverse one-to-one accessors of the user, which cache
+their result (including a missing account) on the user instance. Token authentication
+loads both accessors in the token query, so a request resolves its role at most once.
+"""
+from .models import Buyer, Seller
+
+
+def get_seller(user):
+    """returns the Seller account of the user or None"""
+    if not user or not user.is_authenticated:
+        return None
+    try:
+        return user.seller
+    except Seller.DoesNotExist:
+        return None
+
+
+def get_buyer(user):
+    """returns the Buyer account of the user or None"""
+    if not user or not user.is_authenticated:
+        return None
+    try:
+        return user.buyer
+    except Buyer.DoesNotExist:
+        return None
+
+
+def get_role(user):
+    """returns a (session status, account) pair, session status being 'seller', 'buyer' or None"""
+    seller = get_seller(user)
+    if seller is not None:
+        return 'seller', seller
+    buyer = get_buyer(user)
+    if buyer is not None:
+        return 'buyer', buyer
+    return None, None
@@ -0,0 +1,109 @@
+"""Read/write splitting over the default (primary) database and its read replicas.
+
+Reads of jengabay models go to a replica listed in DATABASE_REPLICAS only while
+ReplicaRoutingMiddleware allows it: during safe method requests to views with
+`read_from_replica = True`. Everything else, including authentication, reads the
+primary. A request is pinned to the primary as soon as it writes, and the client
+gets a cookie pinning its following requests for REPLICA_PIN_SECONDS so it reads
+its own writes while the replicas catch up. Responses stored for other clients, such as
+the ones of the response cache, are built from the primary with `read_primary()` so that
+a lagging replica's rows are not served past the writes that invalidated them.
+"""
+import contextvars
+import random
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from rest_framework.permissions import SAFE_METHODS
+
+PIN_COOKIE = 'primary_pin'
+
+# apps whose models may be read from a replica
+REPLICATED_APPS = {'jengabay'}
+
+_replica_reads = contextvars.ContextVar('replica_reads', default=False)
+_wrote = contextvars.ContextVar('wrote', default=False)
+
+
+def get_replicas():
+    return getattr(settings, 'DATABASE_REPLICAS', [])
+
+
+def read_primary():
+    """makes the rest of the request read the primary"""
+    _replica_reads.set(False)
+
+
+class PrimaryReplicaRouter:
+
+    def db_for_read(self, model, **hints):
+        replicas = get_replicas()
+        if replicas and _replica_reads.get() and model._meta.app_label in REPLICATED_APPS:
+            return random.choice(replicas)
+        return None
+
+    def db_for_write(self, model, **hints):
+        # the rest of the request reads its own writes
+        _replica_reads.set(False)
+        _wrote.set(True)
+        return 'default'
+
+    def allow_relation(self, obj1, obj2, **hints):
+        databases = {'default', *get_replicas()}
+        if obj1._state.db in databases and obj2._state.db in databases:
+            return True
+        return None
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        # replicas are copies of the primary, see the sync_replicas command
+        if db in get_replicas():
+            return False
+        return None
+
+
+class ReplicaRoutingMiddleware:
+    """Allows the router to read from the replicas during safe method requests
+    to views opting in with `read_from_replica`, and pins clients that wrote to the primary"""
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        replica_reads = _replica_reads.set(False)
+        wrote = _wrote.set(False)
+        try:
+            return self.pin_writer(request, self.get_response(request))
+        finally:
+            _replica_reads.reset(replica_reads)
+            _wrote.reset(wrote)
+
+    async def __acall__(self, request):
+        replica_reads = _replica_reads.set(False)
+        wrote = _wrote.set(False)
+        try:
+            return self.pin_writer(request, await self.get_response(request))
+        finally:
+            _replica_reads.reset(replica_reads)
+            _wrote.reset(wrote)
+
+    def pin_writer(self, request, response):
+        if get_replicas() and (_wrote.get() or request.method not in SAFE_METHODS):
+            response.set_cookie(PIN_COOKIE, '1', max_age=settings.REPLICA_PIN_SECONDS,
+                                httponly=True, samesite='Lax')
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        view_class = getattr(view_func, 'cls', None) or getattr(view_func, 'view_class', None)
+        _replica_reads.set(
+            request.method in SAFE_METHODS
+            and getattr(view_class, 'read_from_replica', False)
+            and PIN_COOKIE not in request.COOKIES
+        )
+        return None
@@ -0,0 +1,154 @@
+"""Full text search for the item catalog.
+
+Items are indexed in an SQLite FTS5 table keyed on the item id (the FTS rowid)
+together with their seller and location text, so a catalog search is answered
+from the index instead of LIKE scans over four joined tables.
+"""
+import re
+
+from django.db import connections
+from django.db.models import FloatField
+from django.db.models.expressions import RawSQL
+from rest_framework import filters
+
+FTS_TABLE = 'jengabay_item_fts'
+
+# indexed columns, in table order
+FTS_COLUMNS = ('item_name', 'item_description', 'category', 'seller', 'location')
+
+# bm25 weights for the columns above, a name match outranks a description match
+FTS_WEIGHTS = (10.0, 2.0, 4.0, 5.0, 3.0)
+
+CREATE_SQL = (
+    "CREATE VIRTUAL TABLE IF NOT EXISTS jengabay_item_fts USING fts5("
+    "item_name, item_description, category, seller, location, "
+    "tokenize = 'unicode61 remove_diacritics 2')"
+)
+
+DOCUMENT_SQL = (
+    "SELECT i.id, i.item_name, COALESCE(i.item_description, ''), i.category, s.business_name, "
+    "s.local_area_name || ' ' || s.town || ' ' || s.building || ' ' || s.street || ' ' || "
+    "sc.subcounty_name || ' ' || c.county_name "
+    "FROM jengabay_item i "
+    "INNER JOIN jengabay_seller s ON s.id = i.item_seller_id "
+    "INNER JOIN jengabay_subcounty sc ON sc.id = s.sub_county_id "
+    "INNER JOIN jengabay_county c ON c.id = sc.county_id"
+)
+
+INSERT_SQL = "INSERT INTO jengabay_item_fts(rowid, {}) ".format(', '.join(FTS_COLUMNS)) + DOCUMENT_SQL
+
+
+def is_available(using='default'):
+    """returns True if the database behind the given alias carries the search index"""
+    return connections[using].vendor == 'sqlite'
+
+
+def _reindex(where, params, using='default'):
+    """replaces the index rows of every item matched by the where clause of DOCUMENT_SQL"""
+    if not is_available(using):
+        return
+    with connections[using].cursor() as cursor:
+        cursor.execute(
+            "DELETE FROM jengabay_item_fts WHERE rowid IN (SELECT i.id FROM jengabay_item i "
+            "INNER JOIN jengabay_seller s ON s.id = i.item_seller_id "
+            "INNER JOIN jengabay_subcounty sc ON sc.id = s.sub_county_id WHERE " + where + ")",
+            params,
+        )
+        cursor.execute(INSERT_SQL + " WHERE " + where, params)
+
+
+def index_item(item_id, using='default'):
+    _reindex("i.id = %s", [item_id], using)
+
+
+def index_items(item_ids, using='default'):
+    if item_ids:
+        _reindex("i.id IN ({})".format(', '.join(['%s'] * len(item_ids))), list(item_ids), using)
+
+
+def index_seller_items(seller_id, using='default'):
+    _reindex("s.id = %s", [seller_id], using)
+
+
+def index_subcounty_items(subcounty_id, using='default'):
+    _reindex("sc.id = %s", [subcounty_id], using)
+
+
+def index_county_items(county_id, using='default'):
+    _reindex("sc.county_id = %s", [county_id], using)
+
+
+def remove_item(item_id, using='default'):
+    if not is_available(using):
+        return
+    with connections[using].cursor() as cursor:
+        cursor.execute("DELETE FROM jengabay_item_fts WHERE rowid = %s", [item_id])
+
+
+def rebuild_index(using='default'):
+    """drops every index row and re-indexes the whole catalog in one statement,
+    returns the number of indexed items"""
+    with connections[using].cursor() as cursor:
+        cursor.execute(CREATE_SQL)
+        cursor.execute("DELETE FROM jengabay_item_fts")
+        cursor.execute(INSERT_SQL)
+        cursor.execute("INSERT INTO jengabay_item_fts(jengabay_item_fts) VALUES('optimize')")
+        cursor.execute("SELECT COUNT(*) FROM jengabay_item_fts")
+        return cursor.fetchone()[0]
+
+
+def build_match_expression(search_terms, columns=None):
+    """builds an FTS5 MATCH expression requiring every term, each as a prefix,
+    optionally restricted to the given index columns.
+    Returns None when no usable term is left"""
+    phrases = []
+    for term in search_terms:
+        for token in re.findall(r'\w+', term):
+            phrases.append('"{}"*'.format(token))
+    if not phrases:
+        return None
+    expression = ' '.join(phrases)
+    if columns:
+        expression = '{%s} : (%s)' % (' '.join(columns), expression)
+    return expression
+
+
+class ItemSearchFilter(filters.SearchFilter):
+    """A search filter for item and item listing querysets that matches against the full text index
+    and orders the results by relevance.
+    Views may set `search_index_columns` to restrict the indexed columns searched,
+    databases without the index fall back to the regular `search_fields` lookups"""
+
+    def get_match_expression(self, request, queryset, view):
+        search_terms = self.get_search_terms(request)
+        if not search_terms or not is_available(queryset.db):
+            return None
+        return build_match_expression(search_terms, getattr(view, 'search_index_columns', None))
+
+    def get_ordering(self, request, queryset, view):
+        """the relevance ordering of searches, used by cursor pagination to page through the ranked results"""
+        if self.get_match_expression(request, queryset, view) is not None:
+            return ('search_rank', 'pk')
+        return None
+
+    def filter_queryset(self, request, queryset, view):
+        expression = self.get_match_expression(request, queryset, view)
+        if expression is None:
+            return super().filter_queryset(request, queryset, view)
+
+        # the index is keyed on the item id, the primary key of items and of their listings
+        item_table = queryset.model._meta.db_table
+        item_id = queryset.model._meta.pk.column
+        weights = ', '.join(str(weight) for weight in FTS_WEIGHTS)
+        return queryset.filter(
+            pk__in=RawSQL(
+                "SELECT rowid FROM jengabay_item_fts WHERE jengabay_item_fts MATCH %s", (expression,)
+            )
+        ).annotate(
+            search_rank=RawSQL(
+                "SELECT bm25(jengabay_item_fts, {}) FROM jengabay_item_fts "
+                "WHERE jengabay_item_fts MATCH %s AND jengabay_item_fts.rowid = {}.{}".format(weights, item_table, item_id),
+                (expression,),
+                output_field=FloatField(),
+            )
+        ).order_by('search_rank', 'pk')
@@ -0,0 +1,245 @@
+"""Deterministic generation of a marketplace dataset for scale testing.
+
+MarketplaceSeeder writes counties, sub counties, seller and buyer accounts, items across
+every category, and orders paid by transactions with their ordered items. Rows are
+generated lazily and written with bulk_create in batches, each in its own transaction, so
+memory use does not grow with the number of rows: only the ids and prices of the items
+and the ids of the sellers and buyers are kept, in compact arrays, to link the orders.
+Every user shares one password hashed once. The same seed and sizes always produce the
+same rows, dated relative to the time they are written.
+
+bulk_create skips the signals maintaining the item listings, search index, facet counts
+and sales summaries, they are rebuilt once all rows are written.
+"""
+import random
+import time
+from array import array
+from datetime import timedelta
+from itertools import accumulate, islice
+
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import User
+from django.db import transaction
+from django.utils import timezone
+from . import analytics, facets, listings, search
+from .models import Buyer, County, Item, Order, Seller, SubCounty, Transaction
+
+BATCH_SIZE = 5000
+PASSWORD = 'Password@123'
+
+# the counties of Kenya and their codes
+COUNTIES = (
+    'Mombasa', 'Kwale', 'Kilifi', 'Tana River', 'Lamu', 'Taita Taveta', 'Garissa', 'Wajir', 'Mandera', 'Marsabit',
+    'Isiolo', 'Meru', 'Tharaka Nithi', 'Embu', 'Kitui', 'Machakos', 'Makueni', 'Nyandarua', 'Nyeri', 'Kirinyaga',
+    "Murang'a", 'Kiambu', 'Turkana', 'West Pokot', 'Samburu', 'Trans Nzoia', 'Uasin Gishu', 'Elgeyo Marakwet',
+    'Nandi', 'Baringo', 'Laikipia', 'Nakuru', 'Narok', 'Kajiado', 'Kericho', 'Bomet', 'Kakamega', 'Vihiga',
+    'Bungoma', 'Busia', 'Siaya', 'Kisumu', 'Homa Bay', 'Migori', 'Kisii', 'Nyamira', 'Nairobi',
+)
+SUB_COUNTY_NAMES = ('Central', 'East', 'West', 'North', 'South', 'Town', 'Rural', 'Lake', 'Hills', 'Plains')
+BRANDS = ('Bamburi', 'Crown', 'Mabati', 'Devki', 'Simba', 'Basco', 'Kenbro', 'Tororo', 'Savannah', 'Rhino',
+          'Jenga', 'Kifaru', 'Tembo', 'Nyati', 'Duma')
+GRADES = ('standard', 'premium', 'heavy duty', 'economy', 'professional', 'classic', 'extra', 'industrial')
+UNITS = ('piece', 'bag', 'kg', 'tonne', 'metre', 'litre', 'tin', 'roll', 'set', 'box')
+WORDS = ('durable', 'weatherproof', 'quality', 'certified', 'imported', 'local', 'bulk', 'delivery', 'strong',
+         'lightweight', 'galvanised', 'treated', 'smooth', 'finish', 'grade', 'site', 'project', 'warranty')
+
+# probability an order is delivered, and the most items on an order
+DELIVERED_RATIO = 0.6
+MAX_ORDER_ITEMS = 5
+ORDER_DAYS = 365
+
+
+def batches(rows, size):
+    """yields lists of at most `size` rows of an iterable"""
+    rows = iter(rows)
+    while True:
+        batch = list(islice(rows, size))
+        if not batch:
+            return
+        yield batch
+
+
+class MarketplaceSeeder:
+    """Writes a generated marketplace of the given size, `progress` is called with a message
+    after every table"""
+
+    def __init__(self, seed=0, sellers=10000, items=1000000, buyers=50000, orders=2000000,
+                 batch_size=BATCH_SIZE, password_hash=None, progress=None):
+        self.seed = seed
+        self.sizes = {'sellers': sellers, 'items': items, 'buyers': buyers, 'orders': orders}
+        self.batch_size = batch_size
+        self.password_hash = password_hash
+        self.progress = progress or (lambda message: None)
+        self.now = timezone.now()
+        self.sub_county_ids = array('q')
+        self.seller_ids = array('q')
+        self.buyer_ids = array('q')
+        self.item_ids = array('q')
+        self.item_prices = array('d')
+        # the items of the n-th seller are item_ids[item_offsets[n]:item_offsets[n + 1]]
+        self.item_offsets = array('q', [0])
+
+    def random(self, table):
+        """returns the random generator of a table, seeded independently of the other tables
+        and of the batch size"""
+        return random.Random('{}:{}'.format(self.seed, table))
+
+    def report(self, model, count, started):
+        elapsed = time.perf_counter() - started
+        self.progress('Wrote {} {} rows in {:.1f}s ({:.0f} rows/s)'.format(
+            count, model._meta.label, elapsed, count / elapsed if elapsed else 0))
+
+    def write(self, model, rows, on_batch=None):
+        """bulk creates the rows in batches, calls `on_batch` with the created objects of every
+        batch and returns the number of rows"""
+        started = time.perf_counter()
+        count = 0
+        for batch in batches(rows, self.batch_size):
+            with transaction.atomic():
+                objects = model.objects.bulk_create(batch)
+            if on_batch is not None:
+                on_batch(objects)
+            count += len(batch)
+        self.report(model, count, started)
+        return count
+
+    def run(self):
+        """writes every table, rebuilds the derived tables and returns the number of rows per model"""
+        if self.password_hash is None:
+            self.password_hash = make_password(PASSWORD)
+        counts = {
+            'counties': self.write_counties(),
+            'sellers': self.write_sellers(),
+            'buyers': self.write_buyers(),
+            'items': self.write_items(),
+            'orders': self.write_orders(),
+        }
+        started = time.perf_counter()
+        listings.rebuild()
+        search.rebuild_index()
+        facets.rebuild_counts()
+        analytics.rebuild_summaries()
+        self.progress('Rebuilt the item listings, search index, facet counts and sales summaries in {:.1f}s'.format(
+            time.perf_counter() - started))
+        return counts
+
+    def write_counties(self):
+        generator = self.random('sub_counties')
+        counties = County.objects.bulk_create([
+            County(county_name=name, code=code) for code, name in enumerate(COUNTIES, start=1)
+        ])
+        sub_counties = [
+            SubCounty(subcounty_name='{} {}'.format(county.county_name, name), county=county)
+            for county in counties for name in generator.sample(SUB_COUNTY_NAMES, generator.randint(3, 8))
+        ]
+        self.write(SubCounty, sub_counties, lambda objects: self.sub_county_ids.extend(row.id for row in objects))
+        return len(counties)
+
+    def write_accounts(self, model, role, count, make_account, ids):
+        """writes `count` users and their seller or buyer accounts made by `make_account(number, user)`
+        in batches, appending the account ids to `ids`"""
+        started = time.perf_counter()
+        for numbers in batches(range(count), self.batch_size):
+            users = []
+            for number in numbers:
+                email = '{}{}@jengabay.com'.format(role, number)
+                users.append(User(username=email, email=email, password=self.password_hash, date_joined=self.now))
+            with transaction.atomic():
+                users = User.objects.bulk_create(users)
+                accounts = model.objects.bulk_create([make_account(number, user) for number, user in zip(numbers, users)])
+            ids.extend(account.id for account in accounts)
+        self.report(model, count, started)
+        return count
+
+    def write_sellers(self):
+        generator = self.random('sellers')
+        # a few sub counties hold most of the sellers, as the larger towns do
+        ranks = list(range(1, len(self.sub_county_ids) + 1))
+        generator.shuffle(ranks)
+        cum_weights = list(accumulate(1 / rank for rank in ranks))
+
+        def seller(number, user):
+            return Seller(
+                profile=user, sub_county_id=generator.choices(self.sub_county_ids, cum_weights=cum_weights)[0],
+                business_name='{} {} Hardware'.format(generator.choice(BRANDS), generator.choice(WORDS).title()),
+                business_reg_no='BN-{:07d}'.format(number), phone_number='07{:08d}'.format(number),
+                town='Town {}'.format(number % 100), local_area_name='Area {}'.format(number % 1000),
+                street='Street {}'.format(number % 500), building='Building {}'.format(number),
+                registration_date=self.now - timedelta(days=generator.randint(0, 3 * 365)))
+
+        return self.write_accounts(Seller, 'seller', self.sizes['sellers'], seller, self.seller_ids)
+
+    def write_buyers(self):
+        generator = self.random('buyers')
+
+        def buyer(number, user):
+            return Buyer(profile=user, phone_number='07{:08d}'.format(generator.randrange(10 ** 8)))
+
+        return self.write_accounts(Buyer, 'buyer', self.sizes['buyers'], buyer, self.buyer_ids)
+
+    def write_items(self):
+        """writes the items seller by seller, so the items of a seller have consecutive offsets"""
+        generator = self.random('items')
+        categories = Item.options
+        seller_count = len(self.seller_ids)
+        # every seller gets at least one item, the rest are spread unevenly
+        per_seller = [1] * seller_count
+        for index in generator.choices(range(seller_count), [generator.paretovariate(1.5) for _ in range(seller_count)],
+                                       k=max(0, self.sizes['items'] - seller_count)):
+            per_seller[index] += 1
+
+        def items():
+            for seller_id, count in zip(self.seller_ids, per_seller):
+                self.item_offsets.append(self.item_offsets[-1] + count)
+                for number in range(count):
+                    category, label = generator.choice(categories)
+                    yield Item(
+                        item_seller_id=seller_id, category=category, sku='SKU-{}-{}'.format(seller_id, number),
+                        item_name='{} {} {}'.format(generator.choice(BRANDS), label.lower(), generator.choice(GRADES)),
+                        item_description=' '.join(generator.sample(WORDS, 6)),
+                        item_price=round(generator.lognormvariate(7, 1.2), 2),
+                        item_measurement_unit=generator.choice(UNITS))
+
+        def remember(objects):
+            self.item_ids.extend(row.id for row in objects)
+            self.item_prices.extend(row.item_price for row in objects)
+
+        return self.write(Item, items(), remember)
+
+    def write_orders(self):
+        """writes the orders in batches of their payment transactions, orders and ordered items,
+        every order buys one to five items of one seller"""
+        generator = self.random('orders')
+        OrderedItem = Order.ordered_items.through
+
+        def orders():
+            """yields the unsaved transaction and order and the item offsets of every order"""
+            for number in range(self.sizes['orders']):
+                seller = generator.randrange(len(self.seller_ids))
+                first, last = self.item_offsets[seller], self.item_offsets[seller + 1]
+                offsets = generator.sample(range(first, last), min(last - first, generator.randint(1, MAX_ORDER_ITEMS)))
+                amount = round(sum(self.item_prices[offset] for offset in offsets), 2)
+                payment = Transaction(transaction_mode='m-pesa', amount=amount, transaction_code='QX{:08d}'.format(number),
+                                      recipient_id=self.seller_ids[seller], payer_id=generator.choice(self.buyer_ids))
+                date_placed = self.now - timedelta(seconds=generator.randrange(ORDER_DAYS * 24 * 3600))
+                is_delivered = generator.random() < DELIVERED_RATIO
+                order = Order(total_amount_payable=amount, date_placed=date_placed, is_delivered=is_delivered,
+                              date_delivered=date_placed + timedelta(days=generator.randint(1, 7)) if is_delivered else None)
+                yield payment, order, offsets
+
+        count = 0
+        started = time.perf_counter()
+        for batch in batches(orders(), self.batch_size):
+            with transaction.atomic():
+                # bulk_create sets the ids of the objects, linking the orders to their payments and items
+                Transaction.objects.bulk_create([payment for payment, order, offsets in batch])
+                for payment, order, offsets in batch:
+                    order.payment_transaction = payment
+                Order.objects.bulk_create([order for payment, order, offsets in batch])
+                OrderedItem.objects.bulk_create([
+                    OrderedItem(order_id=order.id, item_id=self.item_ids[offset])
+                    for payment, order, offsets in batch for offset in offsets
+                ])
+            count += len(batch)
+        self.report(Order, count, started)
+        return count
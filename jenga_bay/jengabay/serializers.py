@@ -1,14 +1,93 @@
+from django.core.exceptions import ValidationError as DjangoValidationError
+from django.db import transaction
 from django.db.models import fields
 from rest_framework import serializers
+from rest_framework.authtoken.serializers import AuthTokenSerializer
+from rest_framework.relations import MANY_RELATION_KWARGS
 from .models import *
 from django.forms.models import model_to_dict
-
-class CountySerializer(serializers.ModelSerializer):
+from .roles import get_buyer, get_seller
+from .images import derivative_sources
+from .fulfilment import MAX_ORDER_IDS
+from . import analytics
+from .fieldsets import FieldsetSerializerMixin
+
+class ImageDerivativesField(serializers.Field):
+    """A read only field listing the resized derivatives of every image in
+    `derivative_image_fields` of the model as {image field: {'src': url, 'srcset': srcset}},
+    the srcset listing the WebP variants with their widths. Images whose derivatives are not
+    rendered yet have the url of the image itself as src and no srcset, the `updated_at` of
+    the instance tells whether to look them up again"""
+
+    def __init__(self, **kwargs):
+        kwargs['source'] = '*'
+        kwargs['read_only'] = True
+        super().__init__(**kwargs)
+
+    def to_representation(self, instance):
+        request = self.context.get('request')
+        absolute = request.build_absolute_uri if request is not None else str
+        derivatives = {}
+        for field in instance.derivative_image_fields:
+            image = getattr(instance, field)
+            if not image.name:
+                derivatives[field] = None
+                continue
+            sources = derivative_sources(image.name, instance.updated_at)
+            if sources is None:
+                derivatives[field] = {'src': absolute(image.url), 'srcset': None}
+                continue
+            src, srcset = sources
+            derivatives[field] = {
+                'src': absolute(src),
+                'srcset': ', '.join('{} {}w'.format(absolute(url), width) for url, width in srcset),
+            }
+        return derivatives
+
+    def get_source_fields(self, model):
+        """the columns read by the field, see jengabay.fieldsets"""
+        return ('updated_at',) + model.derivative_image_fields
+
+class BulkManyRelatedField(serializers.ManyRelatedField):
+    """A to-many relation field that looks up all the submitted primary keys in one query"""
+
+    def to_internal_value(self, data):
+        if isinstance(data, str) or not hasattr(data, '__iter__'):
+            self.fail('not_a_list', input_type=type(data).__name__)
+        if not self.allow_empty and len(data) == 0:
+            self.fail('empty')
+
+        child = self.child_relation
+        queryset = child.get_queryset()
+        pks = []
+        for value in data:
+            try:
+                if isinstance(value, bool):
+                    raise DjangoValidationError('')
+                pks.append(queryset.model._meta.pk.to_python(value))
+            except DjangoValidationError:
+                child.fail('incorrect_type', data_type=type(value).__name__)
+        objects = queryset.in_bulk(pks)
+        for pk in pks:
+            if pk not in objects:
+                child.fail('does_not_exist', pk_value=pk)
+        return [objects[pk] for pk in pks]
+
+class BulkPrimaryKeyRelatedField(serializers.PrimaryKeyRelatedField):
+    """A primary key relation whose many=True form validates in one query, see BulkManyRelatedField"""
+
+    @classmethod
+    def many_init(cls, *args, **kwargs):
+        list_kwargs = {'child_relation': cls(*args, **kwargs)}
+        list_kwargs.update({key: value for key, value in kwargs.items() if key in MANY_RELATION_KWARGS})
+        return BulkManyRelatedField(**list_kwargs)
+
+class CountySerializer(FieldsetSerializerMixin, serializers.ModelSerializer):
     class Meta:
         model = County
         fields = "__all__"
 
-class SubCountySerializer(serializers.ModelSerializer):
+class SubCountySerializer(FieldsetSerializerMixin, serializers.ModelSerializer):
     county = CountySerializer(many=False)
 
     class Meta:
@@ -97,8 +176,9 @@ class SellerProfileUpdateSerializer(serializers.ModelSerializer):
 
 
 
-class SellerSerializer(serializers.ModelSerializer):
+class SellerSerializer(FieldsetSerializerMixin, serializers.ModelSerializer):
     sub_county = SubCountySerializer(many=False)
+    image_derivatives = ImageDerivativesField()
     profile = serializers.PrimaryKeyRelatedField(queryset=User.objects.all(),many=False)
     class Meta:
         model = Seller
@@ -153,12 +233,19 @@ class BuyerProfileUpdateSerializer(serializers.ModelSerializer):
         instance.save()
 
         return instance
-class ItemViewSerializer(serializers.ModelSerializer):
+class ItemViewSerializer(FieldsetSerializerMixin, serializers.ModelSerializer):
     item_seller = SellerSerializer(many=False)
+    image_derivatives = ImageDerivativesField()
     class Meta:
         model = Item
         fields = "__all__"
 
+class ItemListingSerializer(ItemViewSerializer):
+    """serializes catalog listings as the items they copy, without touching the item tables"""
+
+    def to_representation(self, instance):
+        return super().to_representation(instance.as_item())
+
 class ItemCreateSerializer(serializers.ModelSerializer):
     item_seller = serializers.PrimaryKeyRelatedField(read_only=True, many=False)
     class Meta:
@@ -168,42 +255,112 @@ class ItemCreateSerializer(serializers.ModelSerializer):
 
     def create(self, validated_data):
         validated_data.pop('item_seller', None)
-        item_seller = Seller.objects.get(profile=self.context['request'].user)
+        item_seller = get_seller(self.context['request'].user)
         validated_data.update({'item_seller': item_seller})
         return Item.objects.create(**validated_data)
 
+class ItemImportSerializer(serializers.ModelSerializer):
+    """validates a row of a bulk item import, sku uniqueness is enforced by the import itself"""
+    sku = serializers.CharField(max_length=100, required=False, allow_null=True, allow_blank=True)
+
+    class Meta:
+        model = Item
+        fields = ['item_name', 'item_description', 'item_price', 'item_measurement_unit', 'category', 'sku']
+        validators = []
+
+    def validate_sku(self, value):
+        if value:
+            value = value.strip()
+        return value or None
+
 class ItemSerializer(serializers.ModelSerializer):
     item_seller = serializers.PrimaryKeyRelatedField(queryset=Seller.objects.all(), many=False)
     class Meta:
         model = Item
         fields = "__all__"
 
-class TransactionSerializer(serializers.ModelSerializer):
+class TransactionSerializer(FieldsetSerializerMixin, serializers.ModelSerializer):
     payer = serializers.PrimaryKeyRelatedField(read_only=True)
     recipient = serializers.PrimaryKeyRelatedField(queryset=Seller.objects.all())
+    expandable_fields = {'recipient': lambda: SellerSerializer(read_only=True)}
 
     class Meta:
         model = Transaction
-        fields = "__all__"
+        exclude = ['idempotency_key', 'idempotency_hash']
 
-class OrderSerializer(serializers.ModelSerializer):
+class OrderSerializer(FieldsetSerializerMixin, serializers.ModelSerializer):
     payment_transaction = TransactionSerializer(many=False)
+    ordered_items = BulkPrimaryKeyRelatedField(many=True, allow_empty=False, queryset=Item.objects.all())
+    expandable_fields = {'ordered_items': lambda: ItemViewSerializer(many=True, read_only=True)}
     class Meta:
         model = Order
         fields = "__all__"
 
     def create(self, validated_data):
-        """creates a new instances of a Transaction if it doesn't exist
-        and proceeds to create an instance of an Order"""
+        """creates the payment Transaction, the Order and its ordered items as one atomic unit
+        of three inserts, an `idempotency_key` and `idempotency_hash` passed to save() are stored
+        on the transaction"""
 
         order_items = validated_data.pop("ordered_items")
         transaction_data = validated_data.pop("payment_transaction")
         transaction_data.pop("payer", None)
-        payer = Buyer.objects.get(profile=self.context['request'].user)
-        transaction_data.update({"payer": payer})
-        transaction = Transaction.objects.create(**transaction_data)
-        validated_data.update({"payment_transaction": transaction})
-        order = Order.objects.create(**validated_data)
-        order.ordered_items.set(order_items)
-        order.save()
-        return order
\ No newline at end of file
+        payer = get_buyer(self.context['request'].user)
+        transaction_data.update({"payer": payer, "idempotency_key": validated_data.pop("idempotency_key", None),
+                                 "idempotency_hash": validated_data.pop("idempotency_hash", None)})
+        OrderedItem = Order.ordered_items.through
+        with transaction.atomic():
+            payment_transaction = Transaction.objects.create(**transaction_data)
+            validated_data.update({"payment_transaction": payment_transaction})
+            order = Order.objects.create(**validated_data)
+            item_ids = set(item.id for item in order_items)
+            OrderedItem.objects.bulk_create([OrderedItem(order_id=order.id, item_id=item_id) for item_id in item_ids])
+            # bulk_create skips the m2m_changed signal the sales summaries count the items of added orders on
+            analytics.count_item_orders(item_ids, 1)
+        return order
+
+class OrderFulfilmentSerializer(serializers.Serializer):
+    """validates a bulk fulfilment, of either the listed orders or the ones matching a filter
+    of the order list date parameters"""
+
+    filter_params = ('date_placed_after', 'date_placed_before')
+
+    order_ids = serializers.ListField(child=serializers.IntegerField(min_value=1), allow_empty=False,
+                                      max_length=MAX_ORDER_IDS, required=False)
+    filter = serializers.DictField(child=serializers.CharField(), allow_empty=False, required=False)
+    is_delivered = serializers.BooleanField(default=True)
+
+    def validate_filter(self, value):
+        # an unknown parameter would otherwise be ignored and widen the filter to every order
+        unknown = sorted(set(value) - set(self.filter_params))
+        if unknown:
+            raise serializers.ValidationError('Unknown filter parameters: {}, expected {}.'.format(
+                ', '.join(unknown), ' or '.join(self.filter_params)))
+        return value
+
+    def validate(self, attrs):
+        if ('order_ids' in attrs) == ('filter' in attrs):
+            raise serializers.ValidationError('Expected either order_ids or a filter.')
+        return attrs
+
+class SellerDailySalesSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = SellerDailySales
+        fields = ['date', 'revenue', 'order_count', 'delivered_count', 'pending_count']
+
+class ItemSalesSerializer(serializers.ModelSerializer):
+    item_name = serializers.CharField(source='item.item_name', read_only=True)
+
+    class Meta:
+        model = ItemSales
+        fields = ['item', 'item_name', 'order_count']
+
+
+class LoginSerializer(AuthTokenSerializer):
+    """validates the fields of a login, the credentials are checked by the async login view"""
+
+    default_error_messages = {
+        'invalid_credentials': 'Unable to log in with provided credentials.',
+    }
+
+    def validate(self, attrs):
+        return attrs
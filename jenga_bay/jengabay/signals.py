@@ -0,0 +1,325 @@
+from django.contrib.auth.models import User
+from django.db.models import Q
+from django.db.models.signals import m2m_changed, post_delete, post_save, pre_delete, pre_save
+from django.dispatch import Signal, receiver
+from django.utils import timezone
+from django_rest_passwordreset.signals import post_password_reset, reset_password_token_created
+from rest_framework.authtoken.models import Token
+from . import analytics, facets, images, listings, mail, search, signed_tokens
+from .cache import category_scopes, item_scopes, response_cache, seller_items_scopes
+from .models import Buyer, County, Item, Order, Seller, SubCounty, Transaction
+from .token_authentication import ExpiringTokenAuthentication
+
+# sent with the `seller` and the `item_ids` written by bulk operations,
+# which bypass the post_save signal of the items
+items_bulk_saved = Signal()
+
+
+@receiver(post_save, sender=Item)
+def index_saved_item(sender, instance, raw=False, using='default', **kwargs):
+    """keeps the search index entry of an item in sync with the item"""
+    if not raw:
+        search.index_item(instance.pk, using)
+
+
+@receiver(items_bulk_saved)
+def index_bulk_saved_items(sender, item_ids, **kwargs):
+    search.index_items(item_ids)
+
+
+@receiver(post_delete, sender=Item)
+def unindex_deleted_item(sender, instance, using='default', **kwargs):
+    search.remove_item(instance.pk, using)
+
+
+@receiver(post_save, sender=Seller)
+def index_seller_items(sender, instance, raw=False, using='default', **kwargs):
+    """re-indexes the items of a seller whose business or location details changed"""
+    if not raw:
+        search.index_seller_items(instance.pk, using)
+
+
+@receiver(post_save, sender=SubCounty)
+def touch_subcounty_sellers(sender, instance, raw=False, created=False, **kwargs):
+    """moves the modification time of the sellers forward, their representation nests the sub county"""
+    if not (raw or created):
+        Seller.objects.filter(sub_county=instance).update(updated_at=timezone.now())
+
+
+@receiver(post_save, sender=County)
+def touch_county_sellers(sender, instance, raw=False, created=False, **kwargs):
+    if not (raw or created):
+        Seller.objects.filter(sub_county__county=instance).update(updated_at=timezone.now())
+
+
+@receiver(post_save, sender=SubCounty)
+def index_subcounty_items(sender, instance, raw=False, created=False, using='default', **kwargs):
+    if not (raw or created):
+        search.index_subcounty_items(instance.pk, using)
+
+
+@receiver(post_save, sender=County)
+def index_county_items(sender, instance, raw=False, created=False, using='default', **kwargs):
+    if not (raw or created):
+        search.index_county_items(instance.pk, using)
+
+
+@receiver(post_save, sender=Item)
+def refresh_saved_item_listing(sender, instance, raw=False, created=False, using='default', **kwargs):
+    """copies a saved item to the catalog listings, see jengabay.listings"""
+    if not raw:
+        listings.refresh_item(instance.pk, using, created)
+
+
+@receiver(items_bulk_saved)
+def refresh_bulk_saved_item_listings(sender, item_ids, **kwargs):
+    listings.refresh_items(item_ids)
+
+
+@receiver(post_save, sender=Seller)
+def update_seller_listings(sender, instance, raw=False, created=False, using='default', **kwargs):
+    if not (raw or created):
+        listings.update_seller(instance, using)
+
+
+@receiver(post_save, sender=SubCounty)
+def update_subcounty_listings(sender, instance, raw=False, created=False, using='default', **kwargs):
+    """copies renamed sub counties, after touch_subcounty_sellers moved their sellers' modification time"""
+    if not (raw or created):
+        listings.update_sub_county(instance, using)
+
+
+@receiver(post_save, sender=County)
+def update_county_listings(sender, instance, raw=False, created=False, using='default', **kwargs):
+    if not (raw or created):
+        listings.update_county(instance, using)
+
+
+@receiver(pre_save, sender=Item)
+@receiver(pre_save, sender=Seller)
+def remember_uploaded_images(sender, instance, raw=False, update_fields=None, **kwargs):
+    """keeps the image fields holding a new upload, which is only written to the storage
+    as the instance is saved"""
+    fields = sender.derivative_image_fields if update_fields is None else set(sender.derivative_image_fields) & set(update_fields)
+    instance._uploaded_images = [] if raw else [field for field in fields if not getattr(instance, field)._committed]
+
+
+@receiver(post_save, sender=Item)
+@receiver(post_save, sender=Seller)
+def schedule_image_derivatives(sender, instance, raw=False, **kwargs):
+    """queues the rendering of the derivatives of newly uploaded images, the task is queued in
+    the transaction saving the upload so it only runs once the upload is committed. Saves
+    without a new upload do not touch the storage"""
+    uploaded = getattr(instance, '_uploaded_images', None)
+    if uploaded and not raw:
+        images.schedule_derivatives(getattr(instance, field).name for field in uploaded)
+
+
+@receiver(images.derivatives_rendered)
+def touch_image_owners(sender, name, **kwargs):
+    """moves the modification time of the items and sellers showing a newly rendered image
+    forward, their representation lists its derivatives from now on"""
+    showing = Q()
+    for field in Item.derivative_image_fields:
+        showing |= Q(**{field: name})
+    rows = list(Item.objects.filter(showing).values_list('id', 'item_seller_id', 'category'))
+    if rows:
+        item_ids = [item_id for item_id, seller_id, category in rows]
+        Item.objects.filter(pk__in=item_ids).update(updated_at=timezone.now())
+        listings.refresh_items(item_ids)
+        response_cache.bump([scope for row in rows for scope in item_scopes(row[0], row[1], [row[2]])])
+    for seller in Seller.objects.filter(profile_pic=name):
+        seller.save(update_fields=['updated_at'])
+
+
+@receiver(post_save, sender=Token)
+@receiver(post_delete, sender=Token)
+def invalidate_cached_token(sender, instance, **kwargs):
+    """drops refreshed (login) and deleted (logout) tokens from the authentication cache"""
+    ExpiringTokenAuthentication.cache.invalidate(instance.key)
+
+
+@receiver(post_save, sender=User)
+def invalidate_cached_user_tokens(sender, instance, **kwargs):
+    """drops the cached tokens of a user whose account was changed e.g deactivated"""
+    ExpiringTokenAuthentication.cache.invalidate_user(instance.pk)
+
+
+@receiver(post_save, sender=User)
+def revoke_signed_tokens_on_password_change(sender, instance, created=False, raw=False, **kwargs):
+    """a new password, e.g. after a password reset, revokes the signed tokens issued before.
+    set_password() keeps the new raw password on the user until it is saved"""
+    if not (created or raw) and getattr(instance, '_password', None) is not None:
+        signed_tokens.revoke_user_tokens(instance.pk)
+
+
+@receiver(post_save, sender=Seller)
+@receiver(post_delete, sender=Seller)
+@receiver(post_save, sender=Buyer)
+@receiver(post_delete, sender=Buyer)
+def invalidate_cached_account_tokens(sender, instance, **kwargs):
+    """the cached tokens carry the seller and buyer accounts of their user, see jengabay.roles"""
+    ExpiringTokenAuthentication.cache.invalidate_user(instance.profile_id)
+
+
+@receiver(post_password_reset)
+def invalidate_reset_user_tokens(sender, user, **kwargs):
+    ExpiringTokenAuthentication.cache.invalidate_user(user.pk)
+
+
+@receiver(reset_password_token_created)
+def send_password_reset_token(sender, instance, reset_password_token, **kwargs):
+    """emails a requested password reset token, queued for the background workers"""
+    mail.send_password_reset(reset_password_token, getattr(instance, 'request', None))
+
+
+@receiver(pre_save, sender=Item)
+def remember_item_category(sender, instance, raw=False, **kwargs):
+    """keeps the stored category, seller and facet cell of an item, the cached pages of a category
+    the item moves out of are invalidated as well"""
+    instance._stored_category = None
+    instance._stored_facet = None
+    if instance.pk is not None and not raw:
+        stored = sender.objects.filter(pk=instance.pk).values_list(
+            'category', 'item_seller_id', 'item_seller__sub_county_id').first()
+        if stored is not None:
+            category, seller_id, sub_county_id = stored
+            instance._stored_category = category
+            instance._stored_facet = (category, seller_id, sub_county_id)
+
+
+@receiver(post_save, sender=Item)
+@receiver(post_delete, sender=Item)
+def invalidate_item_responses(sender, instance, **kwargs):
+    categories = [instance.category, getattr(instance, '_stored_category', None) or instance.category]
+    response_cache.bump(item_scopes(instance.pk, instance.item_seller_id, categories))
+
+
+@receiver(items_bulk_saved)
+def invalidate_bulk_saved_item_responses(sender, seller, item_ids, **kwargs):
+    """bulk updates may move items out of any category"""
+    scopes = ['seller-items:{}'.format(seller.pk)] + ['item:{}'.format(item_id) for item_id in item_ids]
+    response_cache.bump(scopes + category_scopes(category for category, label in Item.options))
+
+
+@receiver(post_save, sender=Seller)
+@receiver(post_delete, sender=Seller)
+def invalidate_seller_responses(sender, instance, **kwargs):
+    """item representations nest their seller, so the items of the seller and the catalog
+    pages of their categories are invalidated too"""
+    rows = Item.objects.filter(item_seller_id=instance.pk).values_list('id', 'item_seller_id', 'category')
+    response_cache.bump(seller_items_scopes([instance.pk], rows))
+
+
+@receiver(post_save, sender=SubCounty)
+@receiver(post_save, sender=County)
+def invalidate_location_responses(sender, instance, raw=False, created=False, **kwargs):
+    """renaming a location changes the representation of the sellers there and of their items"""
+    if raw or created:
+        return
+    located = {'sub_county': instance} if sender is SubCounty else {'sub_county__county': instance}
+    seller_ids = list(Seller.objects.filter(**located).values_list('id', flat=True))
+    rows = Item.objects.filter(item_seller_id__in=seller_ids).values_list('id', 'item_seller_id', 'category')
+    response_cache.bump(seller_items_scopes(seller_ids, rows))
+
+
+@receiver(pre_save, sender=Order)
+def remember_order_sales(sender, instance, raw=False, **kwargs):
+    """keeps the stored contribution of an order to the sales summaries, see jengabay.analytics"""
+    instance._stored_sales = None
+    if not (raw or instance._state.adding):
+        instance._stored_sales = analytics.stored_order_sales(sender.objects.filter(pk=instance.pk)).get(instance.pk)
+
+
+@receiver(post_save, sender=Order)
+def update_order_sales(sender, instance, raw=False, **kwargs):
+    if not raw:
+        analytics.update_order_sales(getattr(instance, '_stored_sales', None), analytics.order_sales(instance))
+
+
+@receiver(pre_delete, sender=Order)
+def remove_order_sales(sender, instance, **kwargs):
+    analytics.update_order_sales(analytics.stored_order_sales(sender.objects.filter(pk=instance.pk)).get(instance.pk), None)
+    analytics.count_item_orders(instance.ordered_items.values_list('id', flat=True), -1)
+
+
+@receiver(m2m_changed, sender=Order.ordered_items.through)
+def count_ordered_items(sender, instance, action, reverse, pk_set, **kwargs):
+    """counts the orders of items added to or removed from orders, from either side of the relation"""
+    if action == 'pre_clear':
+        instance._cleared_items = (
+            ([instance.pk], instance.order_set.count()) if reverse
+            else (list(instance.ordered_items.values_list('id', flat=True)), 1)
+        )
+    elif action == 'post_clear':
+        item_ids, count = instance._cleared_items
+        analytics.count_item_orders(item_ids, -count)
+    elif action in ('post_add', 'post_remove'):
+        sign = 1 if action == 'post_add' else -1
+        if reverse:
+            analytics.count_item_orders([instance.pk], sign * len(pk_set))
+        else:
+            analytics.count_item_orders(pk_set, sign)
+
+
+@receiver(pre_save, sender=Transaction)
+def remember_transaction_order_sales(sender, instance, raw=False, **kwargs):
+    """the orders paid by a transaction count its amount and recipient"""
+    instance._stored_order_sales = {}
+    if not (raw or instance._state.adding):
+        instance._stored_order_sales = analytics.stored_order_sales(Order.objects.filter(payment_transaction=instance.pk))
+
+
+@receiver(post_save, sender=Transaction)
+def update_transaction_order_sales(sender, instance, raw=False, **kwargs):
+    stored = getattr(instance, '_stored_order_sales', None)
+    if stored and not raw:
+        current = analytics.stored_order_sales(Order.objects.filter(pk__in=list(stored)))
+        for order_id, sales in stored.items():
+            analytics.update_order_sales(sales, current.get(order_id))
+
+
+@receiver(pre_delete, sender=Transaction)
+def remove_transaction_order_sales(sender, instance, **kwargs):
+    """the orders of a deleted transaction lose their payment and stop counting"""
+    for sales in analytics.stored_order_sales(Order.objects.filter(payment_transaction=instance.pk)).values():
+        analytics.update_order_sales(sales, None)
+
+
+@receiver(post_save, sender=Item)
+def count_item_facets(sender, instance, raw=False, **kwargs):
+    """moves an item created or moved to another category or seller into its facet cell, see jengabay.facets"""
+    if raw:
+        return
+    stored = getattr(instance, '_stored_facet', None)
+    if stored is not None and stored[:2] == (instance.category, instance.item_seller_id):
+        return
+    cell = facets.item_cell(instance)
+    facets.move_items([(stored[0], stored[2])] if stored is not None else [], [cell] if cell is not None else [])
+
+
+@receiver(post_delete, sender=Item)
+def uncount_item_facets(sender, instance, **kwargs):
+    cell = facets.item_cell(instance)
+    if cell is not None:
+        facets.add_items([cell], -1)
+
+
+@receiver(items_bulk_saved)
+def recount_bulk_saved_item_facets(sender, seller, item_ids, **kwargs):
+    facets.rebuild_sub_county_counts(seller.sub_county_id)
+
+
+@receiver(pre_save, sender=Seller)
+def remember_seller_sub_county(sender, instance, raw=False, **kwargs):
+    instance._stored_sub_county = None
+    if not (raw or instance._state.adding):
+        instance._stored_sub_county = facets.seller_sub_county(instance.pk)
+
+
+@receiver(post_save, sender=Seller)
+def move_seller_item_facets(sender, instance, raw=False, **kwargs):
+    """the items of a seller are counted in the sub county of the seller"""
+    stored = getattr(instance, '_stored_sub_county', None)
+    if not raw and stored is not None and stored != instance.sub_county_id:
+        facets.move_seller_items(instance.pk, stored, instance.sub_county_id)
@@ -0,0 +1,126 @@
+"""Stateless access tokens signed with the SECRET_KEY.
+
+With SIGNED_TOKENS enabled the login issues tokens carrying the user id, the role and
+account id of the user (see jengabay.roles), the token version of the user, an expiry and
+a token id, signed with HMAC-SHA256 by django.core.signing. They are verified in-process
+without a database query, the user and account of a request are model instances holding
+only their ids, their other fields are read from the database on first use.
+
+Reads trust a valid token until it expires. Writes (unsafe methods) also check in one query
+that the user is still active, that the token id is not in the RevokedToken denylist (a
+logout) and that the version of the token is still the one of its user, raised to revoke
+all the tokens of a user, e.g. when their password changes. The denylist only keeps tokens
+until they expire.
+
+The database tokens of jengabay.token_authentication keep working alongside, clients move
+to signed tokens on their next login.
+"""
+import secrets
+import time
+from datetime import datetime, timezone
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core import signing
+from django.db.models import Exists, F, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+from rest_framework.exceptions import AuthenticationFailed
+from .models import Buyer, RevokedToken, Seller, TokenVersion
+
+SALT = 'jengabay.signed_tokens'
+
+# role names as carried by the tokens
+ROLES = {'seller': 's', 'buyer': 'b'}
+ROLE_NAMES = {code: role for role, code in ROLES.items()}
+
+
+class SignedToken:
+    """the verified content of a signed token, the `request.auth` of the requests using it"""
+
+    def __init__(self, key, payload):
+        self.key = key
+        self.user_id = payload['u']
+        self.role = ROLE_NAMES.get(payload.get('r'))
+        self.account_id = payload.get('a')
+        self.version = payload['v']
+        self.jti = payload['j']
+        self.expires_at = datetime.fromtimestamp(payload['e'], timezone.utc)
+
+    def get_user(self):
+        """returns the user of the token with the seller or buyer account it carries,
+        so the role of the request is resolved without a query"""
+        user = User.from_db('default', ['id', 'is_active'], [self.user_id, True])
+        accounts = {'seller': None, 'buyer': None}
+        if self.role is not None:
+            model = Seller if self.role == 'seller' else Buyer
+            account = model.from_db('default', ['id', 'profile_id'], [self.account_id, self.user_id])
+            model.profile.field.set_cached_value(account, user)
+            accounts[self.role] = account
+        # a cached None tells the reverse accessors the user has no such account
+        User.seller.related.set_cached_value(user, accounts['seller'])
+        User.buyer.related.set_cached_value(user, accounts['buyer'])
+        return user
+
+
+def is_signed(key):
+    """tells signed tokens from database token keys, which are hexadecimal"""
+    return ':' in key
+
+
+def current_version(user):
+    try:
+        return user.token_version.version
+    except TokenVersion.DoesNotExist:
+        return 0
+
+
+def issue(user_id, role, account_id, version):
+    """returns a signed token valid for SIGNED_TOKEN_LIFETIME seconds"""
+    payload = {
+        'u': user_id,
+        'r': ROLES.get(role),
+        'a': account_id,
+        'v': version,
+        'e': int(time.time()) + settings.SIGNED_TOKEN_LIFETIME,
+        'j': secrets.token_urlsafe(12),
+    }
+    return signing.Signer(salt=SALT).sign_object(payload)
+
+
+def verify(key):
+    """returns the SignedToken of a key, raising AuthenticationFailed if the signature is
+    invalid or the token expired"""
+    try:
+        payload = signing.Signer(salt=SALT).unsign_object(key)
+    except (signing.BadSignature, ValueError):
+        raise AuthenticationFailed('Invalid token')
+    if payload['e'] < time.time():
+        raise AuthenticationFailed('Token has expired')
+    return SignedToken(key, payload)
+
+
+def check_revocation(token):
+    """raises AuthenticationFailed if the token was revoked or its user deactivated"""
+    versions = TokenVersion.objects.filter(user=OuterRef('pk')).values('version')
+    row = (User.objects.filter(pk=token.user_id, is_active=True)
+           .annotate(version=Coalesce(Subquery(versions), 0),
+                     revoked=Exists(RevokedToken.objects.filter(jti=token.jti)))
+           .values_list('version', 'revoked').first())
+    if row is None:
+        raise AuthenticationFailed('User inactive or deleted')
+    version, revoked = row
+    if revoked or version != token.version:
+        raise AuthenticationFailed('Token has been revoked')
+
+
+def revoke(token):
+    """denies a token until it expires, dropping the denied tokens that expired since"""
+    RevokedToken.objects.filter(expires_at__lt=datetime.now(timezone.utc)).delete()
+    RevokedToken.objects.get_or_create(jti=token.jti, defaults={'expires_at': token.expires_at})
+
+
+def revoke_user_tokens(user_id):
+    """revokes every signed token issued to the user so far"""
+    version, created = TokenVersion.objects.get_or_create(user_id=user_id, defaults={'version': 1})
+    if not created:
+        TokenVersion.objects.filter(user_id=user_id).update(version=F('version') + 1)
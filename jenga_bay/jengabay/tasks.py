@@ -0,0 +1,171 @@
+"""Background tasks queued in the database.
+
+Slow work that does not need to finish before a response, such as sending email or
+rendering image derivatives, is queued as a Task row and run by the workers of the
+run_workers command. Queuing is a single INSERT in the transaction of the caller, so a
+task is only run if the changes it follows are committed.
+
+Functions decorated with `@task()` are queued with `function.delay(*args, **kwargs)`, the
+arguments being stored as JSON. Workers claim the due tasks, highest priority first, with a
+single UPDATE, so workers in several threads or processes never run the same task, even on
+SQLite. A failed task is retried `max_attempts` times, TASK_RETRY_DELAY seconds after its
+first failure and twice as long after every following one, then left dead with its last
+error until it is requeued. Tasks left running by a worker that died are requeued after
+TASK_LEASE_SECONDS.
+"""
+import logging
+import os
+import socket
+import threading
+import traceback
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import close_old_connections, connections
+from django.db.models import F, Subquery
+from django.utils import timezone
+from django.utils.module_loading import import_string
+from .models import Task
+
+BATCH_SIZE = 10
+
+# longest wait before a retry, in seconds
+MAX_RETRY_DELAY = 3600
+
+logger = logging.getLogger(__name__)
+
+
+def task(priority=0, max_attempts=None):
+    """registers a function as a task and adds `delay()` queuing a call of it,
+    `max_attempts` defaults to TASK_MAX_ATTEMPTS"""
+    def register(function):
+        function.task_name = '{}.{}'.format(function.__module__, function.__qualname__)
+        function.task_options = {'priority': priority, 'max_attempts': max_attempts}
+
+        def delay(*args, **kwargs):
+            return enqueue(function, args, kwargs)
+        function.delay = delay
+        return function
+    return register
+
+
+def enqueue(function, args=(), kwargs=None, priority=None, max_attempts=None, run_after=None):
+    """queues a call of a task function and returns its Task, the options default to the ones
+    the function was registered with"""
+    options = function.task_options
+    return Task.objects.create(
+        name=function.task_name, args=list(args), kwargs=kwargs or {},
+        priority=options['priority'] if priority is None else priority,
+        max_attempts=max_attempts or options['max_attempts'] or settings.TASK_MAX_ATTEMPTS,
+        run_after=run_after or timezone.now())
+
+
+def claim(worker, count=BATCH_SIZE):
+    """marks up to `count` due tasks as run by `worker` and returns them"""
+    now = timezone.now()
+    due = (Task.objects.filter(status=Task.QUEUED, run_after__lte=now)
+           .order_by('-priority', 'run_after', 'pk').values('pk')[:count])
+    # the status is tested again by the UPDATE, a task claimed by another worker in the meantime is skipped
+    claimed = Task.objects.filter(pk__in=Subquery(due), status=Task.QUEUED).update(
+        status=Task.RUNNING, locked_by=worker, locked_at=now, attempts=F('attempts') + 1)
+    if not claimed:
+        return []
+    return list(Task.objects.filter(status=Task.RUNNING, locked_by=worker, locked_at=now)
+                .order_by('-priority', 'run_after', 'pk'))
+
+
+def retry_delay(attempts):
+    """returns the wait before the next attempt of a task that failed `attempts` times"""
+    return timedelta(seconds=min(settings.TASK_RETRY_DELAY * 2 ** (attempts - 1), MAX_RETRY_DELAY))
+
+
+def run(task):
+    """runs a claimed task, deleting it once it succeeds, and returns True if it did"""
+    try:
+        function = import_string(task.name)
+        if not hasattr(function, 'task_options'):
+            raise ImportError('{} is not a task'.format(task.name))
+        function(*task.args, **task.kwargs)
+    except Exception:
+        fail(task, traceback.format_exc())
+        return False
+    Task.objects.filter(pk=task.pk).delete()
+    return True
+
+
+def fail(task, error):
+    if task.attempts < task.max_attempts:
+        task.status = Task.QUEUED
+        task.run_after = timezone.now() + retry_delay(task.attempts)
+        logger.warning('Task %s %s failed, attempt %s of %s', task.pk, task.name, task.attempts, task.max_attempts)
+    else:
+        task.status = Task.DEAD
+        logger.error('Task %s %s failed %s times and is dead:\n%s', task.pk, task.name, task.attempts, error)
+    task.last_error = error
+    task.locked_by = task.locked_at = None
+    task.save(update_fields=['status', 'run_after', 'last_error', 'locked_by', 'locked_at'])
+
+
+def requeue_stale(lease=None):
+    """requeues the tasks running longer than the lease, left by workers that died,
+    the ones out of attempts are dead. Returns the number of requeued tasks"""
+    before = timezone.now() - timedelta(seconds=lease or settings.TASK_LEASE_SECONDS)
+    stale = Task.objects.filter(status=Task.RUNNING, locked_at__lt=before)
+    stale.filter(attempts__gte=F('max_attempts')).update(
+        status=Task.DEAD, locked_by=None, locked_at=None, last_error='The worker running the task stopped.')
+    return stale.update(status=Task.QUEUED, locked_by=None, locked_at=None)
+
+
+def requeue_dead():
+    """queues the dead tasks again for a full set of attempts, returns their number"""
+    return Task.objects.filter(status=Task.DEAD).update(
+        status=Task.QUEUED, attempts=0, run_after=timezone.now())
+
+
+def run_pending(worker='inline'):
+    """runs the due tasks in the calling thread until none is left, returns the number run"""
+    count = 0
+    while True:
+        tasks = claim(worker)
+        if not tasks:
+            return count
+        for task in tasks:
+            run(task)
+        count += len(tasks)
+
+
+class Worker:
+    """Runs the due tasks until `stop`, a threading or multiprocessing Event, is set.
+    Every worker has its own database connection, in its thread or process"""
+
+    def __init__(self, index=0, batch_size=BATCH_SIZE, poll_interval=1.0):
+        self.index = index
+        self.batch_size = batch_size
+        self.poll_interval = poll_interval
+
+    @property
+    def name(self):
+        return '{}:{}:{}:{}'.format(socket.gethostname(), os.getpid(), threading.get_ident(), self.index)
+
+    def run(self, stop):
+        name = self.name
+        try:
+            while not stop.is_set():
+                try:
+                    if not self.run_batch(name):
+                        requeue_stale()
+                        stop.wait(self.poll_interval)
+                except Exception:
+                    # e.g. the database is locked, the claimed tasks are requeued after their lease
+                    logger.exception('Worker %s failed to run its tasks', name)
+                    stop.wait(self.poll_interval)
+                finally:
+                    close_old_connections()
+        finally:
+            connections.close_all()
+
+    def run_batch(self, name):
+        tasks = claim(name, self.batch_size)
+        for task in tasks:
+            run(task)
+        return len(tasks)
@@ -1,3 +1,1421 @@
-from django.test import TestCase
+import io
+import json
+import os
+import shutil
+import tempfile
+import threading
+import uuid
+from decimal import Decimal
+from unittest import mock
+import PIL.Image
+from django.conf import settings
+from django.contrib.auth.hashers import verify_password
+from django.contrib.auth.models import User
+from django.core import mail
+from django.core.files.storage import default_storage
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.db import connection, router
+from django.db.models import F
+from django.http import HttpResponse
+from django.test import AsyncRequestFactory, RequestFactory, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import resolve, reverse
+from django.utils.timezone import localdate, now
+from django.utils.translation import gettext_lazy
+from datetime import timedelta
+from rest_framework.authtoken.models import Token
+from rest_framework.exceptions import ParseError
+from rest_framework.parsers import JSONParser
+from rest_framework.renderers import JSONRenderer
+from rest_framework.response import Response
+from rest_framework.test import APITestCase
+from rest_framework.views import APIView
+from . import analytics, benchmarks, exports, images, listings, roles, tasks, urls
+from .seeding import MarketplaceSeeder
+from .serializers import ItemViewSerializer
+from .models import *
+from .mixins import CachedResponseMixin
+from .views import AllItemsListView, CustomAuthToken
+from .cache import response_cache
+from .instrumentation import InstrumentationMiddleware
+from .renderers import FastJSONParser, FastJSONRenderer
+from .routers import PIN_COOKIE, ReplicaRoutingMiddleware
+from .token_authentication import ExpiringTokenAuthentication, TokenCache
 
-# Create your tests here.
+
+@tasks.task(max_attempts=2)
+def failing_task(message):
+    raise ValueError(message)
+
+
+@tasks.task()
+def recording_task(name):
+    TaskQueueTests.ran.append(name)
+
+
+class CatalogFixtureMixin:
+    """creates a small catalog of counties, sellers and items to test against"""
+
+    def create_seller(self, username, business_name, subcounty_name='Westlands', county_name='Nairobi', **kwargs):
+        county, _ = County.objects.get_or_create(county_name=county_name, defaults={'code': 47})
+        sub_county, _ = SubCounty.objects.get_or_create(subcounty_name=subcounty_name, county=county)
+        user = User.objects.create_user(username=username, email=username, password='Password@123')
+        details = {
+            'business_reg_no': 'BN-001', 'phone_number': '0700000000', 'town': 'Nairobi',
+            'local_area_name': 'Parklands', 'street': 'Limuru Road', 'building': 'Jenga House',
+        }
+        details.update(kwargs)
+        return Seller.objects.create(profile=user, business_name=business_name, sub_county=sub_county, **details)
+
+    def create_item(self, seller, item_name, category='others', item_price=100.0, **kwargs):
+        return Item.objects.create(
+            item_seller=seller, item_name=item_name, category=category, item_price=item_price,
+            item_measurement_unit=kwargs.pop('item_measurement_unit', 'piece'), **kwargs)
+
+
+class ItemSearchTests(CatalogFixtureMixin, APITestCase):
+
+    def setUp(self):
+        self.seller = self.create_seller('hardware@jengabay.com', 'Mombasa Hardware', 'Mvita', 'Mombasa')
+        self.other_seller = self.create_seller('supplies@jengabay.com', 'Nairobi Supplies')
+        self.cement = self.create_item(self.seller, 'Portland cement', 'cement', item_description='50kg bag')
+        self.paint = self.create_item(self.other_seller, 'Crown paint', 'paints', item_description='Mixes well with cement')
+
+    def search(self, term, url=None):
+        response = self.client.get(url or reverse('items'), {'search': term})
+        self.assertEqual(response.status_code, 200)
+        return [item['id'] for item in response.data['results']]
+
+    def test_results_are_ranked_by_relevance(self):
+        self.assertEqual(self.search('cement'), [self.cement.id, self.paint.id])
+
+    def test_terms_match_as_prefixes_across_seller_and_location(self):
+        self.assertEqual(self.search('mombasa cem'), [self.cement.id])
+
+    def test_index_follows_item_seller_and_county_changes(self):
+        self.paint.item_name = 'Crown emulsion'
+        self.paint.save()
+        self.assertEqual(self.search('emulsion'), [self.paint.id])
+
+        self.other_seller.business_name = 'Kisumu Depot'
+        self.other_seller.save()
+        self.assertEqual(self.search('kisumu'), [self.paint.id])
+
+        county = self.seller.sub_county.county
+        county.county_name = 'Kilifi'
+        county.save()
+        self.assertEqual(self.search('kilifi'), [self.cement.id])
+
+        self.cement.delete()
+        self.assertEqual(self.search('cement'), [self.paint.id])
+
+    def test_seller_items_search_skips_seller_and_location_text(self):
+        url = reverse('seller_items', kwargs={'pk': self.seller.id})
+        self.assertEqual(self.search('cement', url), [self.cement.id])
+        self.assertEqual(self.search('mombasa', url), [])
+
+
+class QueryBudgetTests(CatalogFixtureMixin, APITestCase):
+    """every endpoint must run a fixed number of queries no matter how many rows it serializes,
+    raise a budget only together with the change that needs the extra query"""
+
+    def setUp(self):
+        self.seller = self.create_seller('hardware@jengabay.com', 'Mombasa Hardware', 'Mvita', 'Mombasa')
+        other_seller = self.create_seller('supplies@jengabay.com', 'Nairobi Supplies')
+        items = [self.create_item(seller, 'Item {}'.format(number), 'cement')
+                 for seller in (self.seller, other_seller) for number in range(5)]
+        user = User.objects.create_user(username='buyer@jengabay.com', password='Password@123')
+        self.buyer = Buyer.objects.create(profile=user, phone_number='0711111111')
+        for number in range(4):
+            transaction = Transaction.objects.create(
+                transaction_mode='m-pesa', amount=300.0, transaction_code='QX{}'.format(number),
+                recipient=self.seller, payer=self.buyer)
+            self.order = Order.objects.create(total_amount_payable=300.0, payment_transaction=transaction)
+            self.order.ordered_items.set(items[:3])
+        self.item = items[0]
+
+    def assertQueryBudget(self, budget, url, user=None, **params):
+        self.client.force_authenticate(user)
+        with self.assertNumQueries(budget):
+            response = self.client.get(url, params)
+        self.assertEqual(response.status_code, 200)
+
+    def test_catalog_endpoints(self):
+        # the page and its ETag validator
+        self.assertQueryBudget(2, reverse('items'))
+        self.assertQueryBudget(2, reverse('items'), search='item')
+        self.assertQueryBudget(2, reverse('items'), category='cement')
+        self.assertQueryBudget(2, reverse('item_view', kwargs={'pk': self.item.id}))
+        self.assertQueryBudget(2, reverse('sellers'))
+        self.assertQueryBudget(2, reverse('seller', kwargs={'pk': self.seller.id}))
+        self.assertQueryBudget(2, reverse('seller_items', kwargs={'pk': self.seller.id}))
+
+    def test_buyer_endpoints(self):
+        self.assertQueryBudget(1, '/buyers/{}'.format(self.buyer.id))
+        self.assertQueryBudget(3, reverse('buyer_orders', kwargs={'pk': self.buyer.id}), self.buyer.profile)
+
+    def test_seller_order_endpoints(self):
+        user = self.seller.profile
+        self.assertQueryBudget(3, reverse('orders', kwargs={'pk': self.seller.id}), user)
+        self.assertQueryBudget(3, '/sellers/{}/orders/{}'.format(self.seller.id, self.order.id), user)
+        self.assertQueryBudget(2, '/sellers/{}/orders/{}/edit'.format(self.seller.id, self.order.id), user)
+
+
+class CursorPaginationTests(CatalogFixtureMixin, APITestCase):
+
+    def setUp(self):
+        self.seller = self.create_seller('hardware@jengabay.com', 'Mombasa Hardware')
+        self.items = [self.create_item(self.seller, 'Cement {}'.format(number), 'cement') for number in range(5)]
+
+    def walk(self, url, **params):
+        """follows the next links from the first page and returns the ids of every page"""
+        pages = []
+        response = self.client.get(url, params)
+        while True:
+            self.assertNotIn('count', response.data)
+            pages.append([row['id'] for row in response.data['results']])
+            if response.data['next'] is None:
+                return pages
+            response = self.client.get(response.data['next'])
+
+    def test_pages_follow_the_id_keyset(self):
+        ids = [item.id for item in self.items]
+        self.assertEqual(self.walk(reverse('items'), page_size=2), [ids[:2], ids[2:4], ids[4:]])
+
+    def test_cursor_survives_inserts(self):
+        first = self.client.get(reverse('items'), {'page_size': 2})
+        self.create_item(self.seller, 'Cement late', 'cement')
+        second = self.client.get(first.data['next'])
+        self.assertEqual([row['id'] for row in second.data['results']], [self.items[2].id, self.items[3].id])
+
+    def test_page_size_is_capped_per_view(self):
+        AllItemsListView.max_page_size = 3
+        try:
+            response = self.client.get(reverse('items'), {'page_size': 100})
+        finally:
+            del AllItemsListView.max_page_size
+        self.assertEqual(len(response.data['results']), 3)
+
+    def test_search_pages_keep_relevance_order(self):
+        self.create_item(self.seller, 'Cement cement special', 'cement')
+        pages = self.walk(reverse('items'), search='cement', page_size=4)
+        self.assertEqual(len(sum(pages, [])), 6)
+        self.assertEqual(len(set(sum(pages, []))), 6)
+
+
+class IndexedListTests(CatalogFixtureMixin, APITestCase):
+
+    def setUp(self):
+        response_cache.clear()
+        self.seller = self.create_seller('hardware@jengabay.com', 'Mombasa Hardware')
+        self.items = [self.create_item(self.seller, 'Cement {}'.format(number), 'cement', item_price=price)
+                      for number, price in enumerate([300.0, 100.0, 200.0, 100.0, 100.0])]
+        self.client.force_authenticate(self.seller.profile)
+
+    def create_order(self, days_ago, amount):
+        payment = Transaction.objects.create(transaction_mode='m-pesa', amount=amount, transaction_code='QX1',
+                                             recipient=self.seller)
+        return Order.objects.create(total_amount_payable=amount, payment_transaction=payment,
+                                    date_placed=now() - timedelta(days=days_ago))
+
+    def walk(self, url, **params):
+        return CursorPaginationTests.walk(self, url, **params)
+
+    def query_plan(self, url, params, table):
+        """returns the query plan of the page query of the request, the statement selecting a page of the table"""
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(self.client.get(url, params).status_code, 200)
+        sql = next(query['sql'] for query in queries if query['sql'].startswith('SELECT')
+                   and 'FROM "{}"'.format(table) in query['sql'] and ' LIMIT ' in query['sql'])
+        with connection.cursor() as cursor:
+            cursor.execute('EXPLAIN QUERY PLAN ' + sql)
+            return '\n'.join(row[-1] for row in cursor.fetchall())
+
+    def test_price_ordering_pages_through_ties(self):
+        by_price = sorted(self.items, key=lambda item: (item.item_price, item.id))
+        pages = self.walk(reverse('items'), ordering='item_price', page_size=2)
+        self.assertEqual(sum(pages, []), [item.id for item in by_price])
+        pages = self.walk(reverse('seller_items', kwargs={'pk': self.seller.id}), ordering='-item_price', page_size=2)
+        self.assertEqual(sum(pages, []), [item.id for item in reversed(by_price)])
+
+    def test_previous_pages_mirror_next_pages(self):
+        first = self.client.get(reverse('items'), {'ordering': 'item_price', 'page_size': 2})
+        second = self.client.get(first.data['next'])
+        previous = self.client.get(second.data['previous'])
+        self.assertEqual(previous.data['results'], first.data['results'])
+
+    def test_price_range(self):
+        response = self.client.get(reverse('items'), {'min_price': 150, 'max_price': 300, 'facets': 'true'})
+        self.assertEqual([row['id'] for row in response.data['results']], [self.items[0].id, self.items[2].id])
+        self.assertEqual(response.data['facets']['category'], [{'value': 'cement', 'label': 'Cement', 'count': 2}])
+
+    def test_unknown_ordering_and_invalid_cursor(self):
+        response = self.client.get(reverse('items'), {'ordering': 'item_seller__business_name'})
+        self.assertEqual([row['id'] for row in response.data['results']], [item.id for item in self.items])
+        self.assertEqual(self.client.get(reverse('items'), {'cursor': 'cD1bMSwy'}).status_code, 404)
+
+    def test_orders_by_date_range_and_amount(self):
+        old, recent, today = self.create_order(30, 500.0), self.create_order(5, 100.0), self.create_order(0, 300.0)
+        url = reverse('orders', kwargs={'pk': self.seller.id})
+        response = self.client.get(url, {'date_placed_after': localdate() - timedelta(days=7)})
+        self.assertEqual([row['id'] for row in response.data['results']], [today.id, recent.id])
+        pages = self.walk(url, ordering='total_amount_payable', page_size=1)
+        self.assertEqual(sum(pages, []), [recent.id, today.id, old.id])
+        pages = self.walk(url, ordering='-date_placed', page_size=2)
+        self.assertEqual(sum(pages, []), [today.id, recent.id, old.id])
+
+    def test_item_lists_read_the_indexes(self):
+        plan = self.query_plan(reverse('items'), {'category': 'cement', 'min_price': 150, 'ordering': 'item_price'},
+                               'jengabay_itemlisting')
+        self.assertIn('USING INDEX listing_category_price_idx (category=? AND item_price>?)', plan)
+        self.assertNotIn('TEMP B-TREE', plan)
+        plan = self.query_plan(reverse('items'), {'category': 'cement'}, 'jengabay_itemlisting')
+        self.assertIn('USING INDEX listing_category_idx (category=?)', plan)
+        self.assertNotIn('TEMP B-TREE', plan)
+        plan = self.query_plan(reverse('items'), {'ordering': '-item_price'}, 'jengabay_itemlisting')
+        self.assertIn('listing_price_idx', plan)
+        self.assertNotIn('TEMP B-TREE', plan)
+        plan = self.query_plan(reverse('seller_items', kwargs={'pk': self.seller.id}), {'category': 'cement'},
+                               'jengabay_item')
+        self.assertIn('USING INDEX item_seller_category_idx (item_seller_id=? AND category=?)', plan)
+        plan = self.query_plan(reverse('seller_items', kwargs={'pk': self.seller.id}), {'ordering': 'item_price'},
+                               'jengabay_item')
+        self.assertIn('USING INDEX item_seller_price_idx (item_seller_id=?)', plan)
+        self.assertNotIn('TEMP B-TREE', plan)
+
+    def test_order_lists_read_the_indexes(self):
+        self.create_order(0, 300.0)
+        plan = self.query_plan(reverse('orders', kwargs={'pk': self.seller.id}),
+                               {'date_placed_after': localdate()}, 'jengabay_order')
+        self.assertIn('jengabay_transaction_recipient_id', plan)
+        self.assertIn('USING INDEX order_transaction_date_idx (payment_transaction_id=? AND date_placed>?)', plan)
+
+
+class TokenCacheTests(CatalogFixtureMixin, APITestCase):
+
+    def setUp(self):
+        self.cache = ExpiringTokenAuthentication.cache
+        self.cache.clear()
+        self.seller = self.create_seller('hardware@jengabay.com', 'Mombasa Hardware')
+        self.token = Token.objects.create(user=self.seller.profile)
+        self.client.credentials(HTTP_AUTHORIZATION='Token ' + self.token.key)
+        self.url = reverse('orders', kwargs={'pk': self.seller.id})
+
+    def test_repeated_requests_skip_the_token_query(self):
+        self.assertEqual(self.client.get(self.url).status_code, 200)
+        with self.assertNumQueries(2):
+            self.assertEqual(self.client.get(self.url).status_code, 200)
+        self.assertEqual(self.cache.stats()['hits'], 1)
+        self.assertEqual(self.cache.stats()['misses'], 1)
+
+    def test_deactivated_user_is_rejected(self):
+        self.client.get(self.url)
+        user = self.seller.profile
+        user.is_active = False
+        user.save()
+        self.assertEqual(self.client.get(self.url).status_code, 401)
+
+    def test_deleted_token_is_rejected(self):
+        self.client.get(self.url)
+        self.token.delete()
+        self.assertEqual(self.client.get(self.url).status_code, 401)
+
+    def test_expiry_is_checked_on_cached_tokens(self):
+        self.client.get(self.url)
+        self.cache.get(self.token.key).created -= timedelta(hours=25)
+        self.assertEqual(self.client.get(self.url).status_code, 401)
+
+    def test_requests_get_their_own_copy_of_the_cached_accounts(self):
+        authentication = ExpiringTokenAuthentication()
+        first, _ = authentication.authenticate_credentials(self.token.key)
+        first.seller.business_name = 'Changed while handling a request'
+        with self.assertNumQueries(0):
+            second, _ = authentication.authenticate_credentials(self.token.key)
+            self.assertIsNot(second.seller, first.seller)
+            self.assertEqual(second.seller.business_name, 'Mombasa Hardware')
+            self.assertIs(second.seller.profile, second)
+            self.assertIsNone(roles.get_buyer(second))
+
+    def test_cache_is_bounded(self):
+        cache = TokenCache(max_size=2)
+        for key in 'abc':
+            cache.set(key, self.token)
+        self.assertIsNone(cache.get('a'))
+        self.assertEqual(cache.stats()['size'], 2)
+
+
+@override_settings(SIGNED_TOKENS=True)
+class SignedTokenTests(CatalogFixtureMixin, APITestCase):
+
+    def setUp(self):
+        ExpiringTokenAuthentication.cache.clear()
+        self.seller = self.create_seller('hardware@jengabay.com', 'Mombasa Hardware')
+        self.orders_url = reverse('orders', kwargs={'pk': self.seller.id})
+        self.add_item_url = reverse('add_item', kwargs={'pk': self.seller.id})
+        self.item = {'item_name': 'Cement', 'item_price': 750.0, 'item_measurement_unit': 'bag', 'category': 'cement'}
+
+    def login(self):
+        self.client.credentials()
+        response = self.client.post(reverse('login'), {'username': 'hardware@jengabay.com', 'password': 'Password@123'})
+        self.client.credentials(HTTP_AUTHORIZATION='Token ' + response.data['token'])
+        return response.data['token']
+
+    def test_reads_are_authenticated_without_a_query(self):
+        self.login()
+        self.assertFalse(Token.objects.exists())
+        # the orders and their prefetched items, on the first request already
+        with self.assertNumQueries(2):
+            self.assertEqual(self.client.get(self.orders_url).status_code, 200)
+
+    def test_writes_are_rejected_once_the_token_is_revoked(self):
+        self.login()
+        # the revocation check, item insert, its search index update, listing copy, the sub county of the
+        # seller (the token only carries the account id) and the facet count increment
+        with self.assertNumQueries(8):
+            self.assertEqual(self.client.post(self.add_item_url, self.item).status_code, 201)
+        self.assertEqual(self.client.post(reverse('logout')).status_code, 200)
+        self.assertEqual(self.client.post(self.add_item_url, self.item).status_code, 401)
+
+        self.login()
+        user = self.seller.profile
+        user.set_password('Password@456')
+        user.save()
+        self.assertEqual(self.client.post(self.add_item_url, self.item).status_code, 401)
+
+    def test_invalid_and_expired_tokens_are_rejected(self):
+        token = self.login()
+        self.client.credentials(HTTP_AUTHORIZATION='Token ' + token[:-1] + ('A' if token[-1] != 'A' else 'B'))
+        self.assertEqual(self.client.get(self.orders_url).status_code, 401)
+        with self.settings(SIGNED_TOKEN_LIFETIME=-1):
+            self.login()
+        self.assertEqual(self.client.get(self.orders_url).status_code, 401)
+
+    def test_database_tokens_keep_working(self):
+        token = Token.objects.create(user=self.seller.profile)
+        self.client.credentials(HTTP_AUTHORIZATION='Token ' + token.key)
+        self.assertEqual(self.client.post(self.add_item_url, self.item).status_code, 201)
+
+
+class RoleResolutionTests(CatalogFixtureMixin, APITestCase):
+
+    def setUp(self):
+        ExpiringTokenAuthentication.cache.clear()
+        self.seller = self.create_seller('hardware@jengabay.com', 'Mombasa Hardware')
+        user = User.objects.create_user(username='buyer@jengabay.com', password='Password@123')
+        self.buyer = Buyer.objects.create(profile=user, phone_number='0711111111')
+
+    def login(self, username):
+        response = self.client.post(reverse('login'), {'username': username, 'password': 'Password@123'})
+        self.assertEqual(response.status_code, 200)
+        return response.data
+
+    def test_login_reports_the_account_of_the_user(self):
+        data = self.login('buyer@jengabay.com')
+        self.assertEqual((data['session_status'], data['account_id']), ('buyer', self.buyer.id))
+        data = self.login('hardware@jengabay.com')
+        self.assertEqual((data['session_status'], data['account_id']), ('seller', self.seller.id))
+
+    def test_role_is_resolved_in_the_token_query(self):
+        token = self.login('hardware@jengabay.com')['token']
+        self.client.credentials(HTTP_AUTHORIZATION='Token ' + token)
+        url = reverse('add_item', kwargs={'pk': self.seller.id})
+        item = {'item_name': 'Cement', 'item_price': 750.0, 'item_measurement_unit': 'bag', 'category': 'cement'}
+        # token and role lookup, item insert, its search index update, listing copy and facet count increment
+        with self.assertNumQueries(7):
+            response = self.client.post(url, item)
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.data['item_seller'], self.seller.id)
+
+        self.client.credentials(HTTP_AUTHORIZATION='Token ' + self.login('buyer@jengabay.com')['token'])
+        self.assertEqual(self.client.post(url, item).status_code, 403)
+
+
+class ItemImportTests(CatalogFixtureMixin, APITestCase):
+
+    def setUp(self):
+        self.seller = self.create_seller('hardware@jengabay.com', 'Mombasa Hardware')
+        self.client.force_authenticate(self.seller.profile)
+        self.url = reverse('import_items', kwargs={'pk': self.seller.id})
+
+    def upload(self, name, content, **data):
+        upload = SimpleUploadedFile(name, content.encode())
+        return self.client.post(self.url, dict(data, file=upload), format='multipart')
+
+    def test_csv_rows_are_validated_and_created(self):
+        content = (
+            'item_name,item_price,item_measurement_unit,category,sku\n'
+            'Portland cement,750,bag,cement,C-1\n'
+            'Gloss paint,not a price,tin,paints,P-1\n'
+            'Nails,120,kg,nails,N-1\n'
+            'Roofing sheet,900,piece,roofing,\n'
+        )
+        response = self.upload('catalog.csv', content)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual((response.data['created'], response.data['rejected']), (2, 2))
+        self.assertEqual([error['row'] for error in response.data['errors']], [2, 3])
+        self.assertEqual(set(Item.objects.values_list('sku', flat=True)), {'C-1', None})
+        # bulk written items are searchable
+        self.assertEqual(len(self.client.get(reverse('items'), {'search': 'roofing'}).data['results']), 1)
+
+    def test_upsert_updates_items_by_sku(self):
+        item = self.create_item(self.seller, 'Portland cement', 'cement', 700.0, sku='C-1')
+        content = (
+            '{"item_name": "Portland cement", "item_price": 750, "item_measurement_unit": "bag", "sku": "C-1"}\n'
+            '{"item_name": "Gloss paint", "item_price": 400, "item_measurement_unit": "tin", "sku": "P-1"}\n'
+            '[1, 2]\n'
+        )
+        response = self.upload('catalog.jsonl', content)
+        self.assertEqual((response.data['created'], response.data['updated'], response.data['rejected']), (1, 0, 2))
+
+        response = self.upload('catalog.jsonl', content, mode='upsert')
+        self.assertEqual((response.data['created'], response.data['updated'], response.data['rejected']), (0, 2, 1))
+        item.refresh_from_db()
+        self.assertEqual(item.item_price, 750.0)
+        self.assertEqual(Item.objects.count(), 2)
+
+    def test_empty_cells_of_nullable_fields_are_null(self):
+        content = (
+            'item_name,item_description,item_price,item_measurement_unit,category\n'
+            'Portland cement,,750,bag,cement\n'
+        )
+        response = self.upload('catalog.csv', content)
+        self.assertEqual((response.data['created'], response.data['rejected']), (1, 0))
+        self.assertIsNone(Item.objects.get().item_description)
+
+    def test_lines_that_are_not_utf8_are_rejected(self):
+        header = 'item_name,item_price,item_measurement_unit,category\n'
+        content = (header + 'Portland cement,750,bag,cement\n').encode() + 'Caf\u00e9 tiles,90,piece,ceramics\n'.encode('latin-1')
+        response = self.client.post(self.url, {'file': SimpleUploadedFile('catalog.csv', content)}, format='multipart')
+        self.assertEqual((response.data['created'], response.data['rejected']), (1, 1))
+        self.assertEqual(response.data['errors'], [{'row': 2, 'errors': {'non_field_errors': ['Line 3 is not valid UTF-8.']}}])
+        content = header.replace('item_name', 'd\u00e9signation').encode('latin-1') + b'Paint,400,tin,paints\n'
+        response = self.client.post(self.url, {'file': SimpleUploadedFile('catalog.csv', content)}, format='multipart')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.data['file'], ['Line 1 is not valid UTF-8.'])
+        self.assertEqual(Item.objects.count(), 1)
+
+    def test_upserts_report_rows_superseded_by_a_later_row(self):
+        content = (
+            '{"item_name": "Portland cement", "item_price": 700, "item_measurement_unit": "bag", "sku": "C-1"}\n'
+            '{"item_name": "Gloss paint"}\n'
+            '{"item_name": "Portland cement", "item_price": 750, "item_measurement_unit": "bag", "sku": "C-1"}\n'
+        )
+        response = self.upload('catalog.jsonl', content, mode='upsert')
+        self.assertEqual((response.data['created'], response.data['rejected']), (1, 2))
+        self.assertEqual([error['row'] for error in response.data['errors']], [1, 2])
+        self.assertEqual(response.data['errors'][0], {'row': 1, 'errors': {'sku': ['Superseded by row 3 with the same sku.']}})
+        self.assertEqual(Item.objects.get().item_price, 750.0)
+
+    def test_skus_created_by_a_concurrent_import_are_rejected_rows(self):
+        self.create_item(self.seller, 'Portland cement', sku='C-1')
+        lookups = []
+        filter_items = Item.objects.filter
+
+        def filter_before_a_concurrent_import(*args, **kwargs):
+            if not lookups:
+                # the other import committed the sku after this one looked it up
+                lookups.append(kwargs)
+                return Item.objects.none()
+            return filter_items(*args, **kwargs)
+
+        content = 'item_name,item_price,item_measurement_unit,sku\nCement,750,bag,C-1\nPaint,400,tin,P-1\nNails,120,kg,\n'
+        with mock.patch.object(Item.objects, 'filter', side_effect=filter_before_a_concurrent_import):
+            response = self.upload('catalog.csv', content)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual((response.data['created'], response.data['rejected']), (2, 1))
+        self.assertEqual(response.data['errors'], [{'row': 1, 'errors': {'sku': ['An item with this sku already exists.']}}])
+        self.assertEqual(set(Item.objects.values_list('sku', flat=True)), {'C-1', 'P-1', None})
+
+    def test_sellers_can_only_import_into_their_own_shop(self):
+        other_seller = self.create_seller('supplies@jengabay.com', 'Nairobi Supplies')
+        self.url = reverse('import_items', kwargs={'pk': other_seller.id})
+        self.assertEqual(self.upload('catalog.csv', 'item_name\n').status_code, 403)
+
+
+class ImageDerivativeTests(CatalogFixtureMixin, APITestCase):
+
+    def setUp(self):
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root)
+        settings_override = self.settings(MEDIA_ROOT=media_root)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        # every test renders the same image to its own media root
+        self.addCleanup(images._rendered.clear)
+        self.addCleanup(images._missing.clear)
+        self.seller = self.create_seller('hardware@jengabay.com', 'Mombasa Hardware')
+        self.client.force_authenticate(self.seller.profile)
+
+    def upload_item(self, filename):
+        image = io.BytesIO()
+        PIL.Image.new('RGB', (2000, 1500), 'orange').save(image, 'JPEG')
+        data = {'item_name': 'Cement', 'item_price': 750.0, 'item_measurement_unit': 'bag',
+                'item_main_image': SimpleUploadedFile(filename, image.getvalue(), 'image/jpeg')}
+        response = self.client.post(reverse('add_item', kwargs={'pk': self.seller.id}), data, format='multipart')
+        self.assertEqual(response.status_code, 201)
+        tasks.run_pending()
+        return Item.objects.get(id=response.data['id'])
+
+    def test_identical_uploads_are_stored_once(self):
+        with mock.patch.object(tasks, 'run_pending'):
+            first, second = self.upload_item('a.jpg'), self.upload_item('b.JPG')
+        # the derivatives of the shared file are queued once
+        self.assertEqual(Task.objects.filter(name='jengabay.images.generate_derivatives').count(), 1)
+        self.assertEqual(first.item_main_image.name, second.item_main_image.name)
+        self.assertEqual(len(os.listdir(os.path.join(settings.MEDIA_ROOT, 'images/product'))), 1)
+
+    def test_derivatives_are_rendered_and_served(self):
+        item = self.upload_item('a.jpg')
+        self.assertFalse(Task.objects.exists())
+        response = self.client.get(reverse('item_view', kwargs={'pk': item.id}))
+        derivatives = response.data[0]['image_derivatives']['item_main_image']
+        name = images.derivative_name(item.item_main_image.name, 'thumbnail', 'webp')
+        self.assertTrue(derivatives['srcset'].startswith('http://testserver/media/{} 320w, '.format(name)))
+        self.assertTrue(derivatives['src'].endswith(images.derivative_name(item.item_main_image.name, 'medium', 'jpeg')))
+        with PIL.Image.open(default_storage.path(name)) as thumbnail:
+            self.assertEqual(thumbnail.size, (320, 240))
+
+    def test_derivatives_are_listed_once_rendered(self):
+        with mock.patch.object(tasks, 'run_pending'):
+            item = self.upload_item('a.jpg')
+        url = reverse('item_view', kwargs={'pk': item.id})
+        derivatives = self.client.get(url).data[0]['image_derivatives']
+        self.assertEqual(derivatives['item_main_image'], {'src': 'http://testserver' + item.item_main_image.url, 'srcset': None})
+        # the placeholder images are never rendered
+        self.assertEqual(derivatives['item_extra_image1']['srcset'], None)
+        tasks.run_pending()
+        self.assertIn('320w', self.client.get(url).data[0]['image_derivatives']['item_main_image']['srcset'])
+
+    def test_missing_derivatives_are_looked_up_again_once_touched(self):
+        with mock.patch.object(tasks, 'run_pending'):
+            item = self.upload_item('a.jpg')
+        url = reverse('item_view', kwargs={'pk': item.id})
+        self.client.get(url)
+        with mock.patch.object(default_storage, 'exists', wraps=default_storage.exists) as exists:
+            response_cache.clear()
+            self.assertIsNone(self.client.get(url).data[0]['image_derivatives']['item_main_image']['srcset'])
+        exists.assert_not_called()
+        # rendered by a worker process, which does not reach the lookups of this one
+        missing = dict(images._missing)
+        with mock.patch.object(images.derivatives_rendered, 'send'):
+            tasks.run_pending()
+        images._missing.update(missing)
+        response_cache.clear()
+        self.assertIsNone(self.client.get(url).data[0]['image_derivatives']['item_main_image']['srcset'])
+        # until the worker touches the item
+        images.derivatives_rendered.send(sender=images.generate_derivatives, name=item.item_main_image.name)
+        self.assertIn('320w', self.client.get(url).data[0]['image_derivatives']['item_main_image']['srcset'])
+
+    def test_saves_without_an_upload_do_not_look_up_the_storage(self):
+        item = self.upload_item('a.jpg')
+        with mock.patch.object(default_storage, 'exists') as exists:
+            item.item_name = 'Portland cement'
+            item.save()
+            self.seller.save()
+        exists.assert_not_called()
+
+
+class ConditionalResponseTests(CatalogFixtureMixin, APITestCase):
+
+    def setUp(self):
+        self.seller = self.create_seller('hardware@jengabay.com', 'Mombasa Hardware')
+        self.item = self.create_item(self.seller, 'Portland cement', 'cement')
+
+    def assertNotModified(self, url, expected=True, **headers):
+        response = self.client.get(url, **headers)
+        self.assertEqual(response.status_code, 304 if expected else 200)
+        return response
+
+    def test_lists_answer_matching_etags_without_serializing(self):
+        url = reverse('items')
+        etag = self.client.get(url)['ETag']
+        response_cache.clear()
+        with self.assertNumQueries(1):
+            self.assertNotModified(url, HTTP_IF_NONE_MATCH=etag)
+        # other query parameters select another representation
+        self.assertNotModified(url + '?category=cement', False, HTTP_IF_NONE_MATCH=etag)
+
+    def test_writes_move_the_validators_forward(self):
+        url = reverse('items')
+        etag = self.client.get(url)['ETag']
+        self.seller.town = 'Mombasa'
+        self.seller.save()
+        etag = self.assertNotModified(url, False, HTTP_IF_NONE_MATCH=etag)['ETag']
+        self.create_item(self.seller, 'Gloss paint', 'paints').delete()
+        self.assertNotModified(url, True, HTTP_IF_NONE_MATCH=etag)
+        self.item.delete()
+        self.assertNotModified(url, False, HTTP_IF_NONE_MATCH=etag)
+
+    def test_transaction_edits_move_the_order_validators_forward(self):
+        payment = Transaction.objects.create(transaction_mode='m-pesa', amount=100.0, transaction_code='QX1', recipient=self.seller)
+        Order.objects.create(total_amount_payable=100.0, payment_transaction=payment).ordered_items.set([self.item])
+        self.client.force_authenticate(self.seller.profile)
+        url = reverse('orders', kwargs={'pk': self.seller.id})
+        response = self.client.get(url)
+        self.assertNotModified(url, HTTP_IF_NONE_MATCH=response['ETag'])
+        payment.amount = 120.0
+        payment.save()
+        response = self.assertNotModified(url, False, HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(response.data['results'][0]['payment_transaction']['amount'], 120.0)
+
+    def test_retrieve_checks_permissions_before_answering(self):
+        url = reverse('seller_profile', kwargs={'pk': self.seller.id})
+        self.client.force_authenticate(self.seller.profile)
+        response = self.client.get(url)
+        self.assertNotModified(url, HTTP_IF_MODIFIED_SINCE=response['Last-Modified'])
+        self.client.force_authenticate(self.create_seller('supplies@jengabay.com', 'Nairobi Supplies').profile)
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=response['ETag']).status_code, 403)
+
+
+class ResponseCacheTests(CatalogFixtureMixin, APITestCase):
+
+    def setUp(self):
+        response_cache.clear()
+        self.seller = self.create_seller('hardware@jengabay.com', 'Mombasa Hardware')
+        self.other_seller = self.create_seller('supplies@jengabay.com', 'Nairobi Supplies', 'Kisumu Central', 'Kisumu')
+        self.item = self.create_item(self.seller, 'Portland cement', 'cement')
+        self.other_item = self.create_item(self.other_seller, 'Gloss paint', 'paints')
+        self.urls = {
+            'items': reverse('items'),
+            'cement': reverse('items') + '?category=cement',
+            'paints': reverse('items') + '?category=paints',
+            'item': reverse('item_view', kwargs={'pk': self.item.id}),
+            'other_item': reverse('item_view', kwargs={'pk': self.other_item.id}),
+            'seller_items': reverse('seller_items', kwargs={'pk': self.seller.id}),
+            'other_seller_items': reverse('seller_items', kwargs={'pk': self.other_seller.id}),
+            'sellers': reverse('sellers'),
+            'other_seller': reverse('seller', kwargs={'pk': self.other_seller.id}),
+        }
+        for url in self.urls.values():
+            self.assertEqual(self.client.get(url)['X-Cache'], 'MISS')
+
+    def cached(self):
+        return {name for name, url in self.urls.items() if self.client.get(url)['X-Cache'] == 'HIT'}
+
+    def test_repeated_requests_are_served_without_queries(self):
+        with self.assertNumQueries(0):
+            response = self.client.get(self.urls['items'])
+        self.assertEqual(response['X-Cache'], 'HIT')
+        self.assertEqual(response.json()['results'][0]['item_name'], 'Portland cement')
+        with self.assertNumQueries(0):
+            self.assertEqual(self.client.get(self.urls['items'], HTTP_IF_NONE_MATCH=response['ETag']).status_code, 304)
+        self.assertGreater(response_cache.stats()['hits'], 0)
+
+    def test_item_edits_only_evict_responses_showing_the_item(self):
+        self.item.category = 'paints'
+        self.item.save()
+        self.assertEqual(self.cached(), {'other_item', 'other_seller_items', 'sellers', 'other_seller'})
+
+    def test_item_edits_keep_the_pages_of_other_categories(self):
+        self.item.item_price = 650.0
+        self.item.save()
+        self.assertEqual(self.cached(), {'paints', 'other_item', 'other_seller_items', 'sellers', 'other_seller'})
+
+    def test_seller_edits_evict_their_items(self):
+        self.other_seller.business_name = 'Kisumu Depot'
+        self.other_seller.save()
+        self.assertEqual(self.cached(), {'cement', 'item', 'seller_items'})
+
+    def test_location_edits_evict_the_sellers_there(self):
+        sub_county = self.other_seller.sub_county
+        sub_county.subcounty_name = 'Kisumu East'
+        sub_county.save()
+        self.assertEqual(self.cached(), {'cement', 'item', 'seller_items'})
+        self.assertEqual(self.client.get(self.urls['other_seller']).json()[0]['sub_county']['subcounty_name'], 'Kisumu East')
+
+
+class OrderPlacementTests(CatalogFixtureMixin, APITestCase):
+
+    def setUp(self):
+        self.seller = self.create_seller('hardware@jengabay.com', 'Mombasa Hardware')
+        self.items = [self.create_item(self.seller, 'Item {}'.format(number)) for number in range(3)]
+        user = User.objects.create_user(username='buyer@jengabay.com', password='Password@123')
+        self.buyer = Buyer.objects.create(profile=user, phone_number='0711111111')
+        self.client.force_authenticate(user)
+
+    def submit(self, items, **headers):
+        order = {
+            'ordered_items': [item.id for item in items],
+            'total_amount_payable': 300.0,
+            'payment_transaction': {'transaction_mode': 'm-pesa', 'amount': 300.0,
+                                    'transaction_code': 'QX1', 'recipient': self.seller.id},
+        }
+        return self.client.post(reverse('create_order'), order, format='json', **headers)
+
+    def test_order_is_written_in_twelve_queries(self):
+        # item and recipient validation, then the transaction, order and ordered items inserts
+        # inside a savepoint, each of the last two followed by an insert and increment of the
+        # sales summaries, then the ordered items of the response
+        with self.assertNumQueries(12):
+            response = self.submit(self.items)
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(sorted(response.data['ordered_items']), [item.id for item in self.items])
+
+    def test_retries_return_the_submitted_order(self):
+        first = self.submit(self.items, HTTP_IDEMPOTENCY_KEY='checkout-1')
+        retry = self.submit(self.items, HTTP_IDEMPOTENCY_KEY='checkout-1')
+        self.assertEqual((first.status_code, retry.status_code), (201, 200))
+        self.assertEqual(retry.data['id'], first.data['id'])
+        self.assertEqual(retry['Idempotent-Replayed'], 'true')
+        self.assertEqual(self.submit(self.items, HTTP_IDEMPOTENCY_KEY='checkout-2').status_code, 201)
+        self.assertEqual((Order.objects.count(), Transaction.objects.count()), (2, 2))
+
+    def test_keys_reused_for_another_order_are_refused(self):
+        first = self.submit(self.items, HTTP_IDEMPOTENCY_KEY='checkout-1')
+        reused = self.submit(self.items[:1], HTTP_IDEMPOTENCY_KEY='checkout-1')
+        self.assertEqual((first.status_code, reused.status_code), (201, 422))
+        self.assertIn('Idempotency-Key', reused.data)
+        self.assertEqual(Order.objects.count(), 1)
+
+    def test_invalid_orders_write_nothing(self):
+        missing = Item(id=9999)
+        response = self.submit(self.items + [missing])
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(Transaction.objects.count(), 0)
+
+    def test_orders_without_items_are_rejected(self):
+        response = self.submit([])
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('ordered_items', response.data)
+        self.assertEqual((Order.objects.count(), Transaction.objects.count()), (0, 0))
+
+
+class OrderFulfilmentTests(CatalogFixtureMixin, APITestCase):
+
+    def setUp(self):
+        self.seller = self.create_seller('hardware@jengabay.com', 'Mombasa Hardware')
+        self.other_seller = self.create_seller('supplies@jengabay.com', 'Nairobi Supplies')
+        self.orders = [self.create_order(self.seller, days_ago) for days_ago in (0, 0, 3, 10)]
+        self.other_order = self.create_order(self.other_seller, 0)
+        self.client.force_authenticate(self.seller.profile)
+        self.url = reverse('fulfil_orders', kwargs={'pk': self.seller.id})
+
+    def create_order(self, seller, days_ago):
+        payment = Transaction.objects.create(transaction_mode='m-pesa', amount=100.0, transaction_code='QX1', recipient=seller)
+        return Order.objects.create(total_amount_payable=100.0, payment_transaction=payment,
+                                    date_placed=now() - timedelta(days=days_ago))
+
+    def fulfil(self, **data):
+        return self.client.post(self.url, data, format='json')
+
+    def assertSummariesMatchARebuild(self):
+        incremental = sorted(SellerDailySales.objects.values_list('seller', 'date', 'order_count', 'delivered_count'))
+        analytics.rebuild_summaries()
+        self.assertEqual(incremental, sorted(SellerDailySales.objects.values_list('seller', 'date', 'order_count', 'delivered_count')))
+
+    def test_listed_orders_are_updated_at_once(self):
+        self.orders[0].is_delivered = True
+        self.orders[0].save()
+        order_ids = [order.id for order in self.orders[:3]] + [self.other_order.id, 9999]
+        # the owned ids, then inside a savepoint the matched count, the days of the changed orders,
+        # the single order update and the increments of the two daily sales rows
+        with self.assertNumQueries(8):
+            response = self.fulfil(order_ids=order_ids)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data, {'updated': 2, 'unchanged': 1, 'rejected': 2,
+                                         'rejected_ids': sorted([self.other_order.id, 9999])})
+        delivered = Order.objects.filter(is_delivered=True)
+        self.assertEqual(set(delivered.values_list('id', flat=True)), {order.id for order in self.orders[:3]})
+        self.assertEqual(delivered.filter(date_delivered__isnull=False).count(), 2)
+        self.assertGreater(Order.objects.get(pk=self.orders[1].pk).updated_at, self.orders[1].updated_at)
+        self.assertSummariesMatchARebuild()
+
+    def test_filtered_orders_are_updated_and_reverted(self):
+        response = self.fulfil(filter={'date_placed_before': str(localdate() - timedelta(days=1))})
+        self.assertEqual((response.data['updated'], response.data['rejected']), (2, 0))
+        self.assertEqual(Order.objects.filter(is_delivered=True).count(), 2)
+        self.assertSummariesMatchARebuild()
+        response = self.fulfil(filter={'date_placed_after': str(localdate() - timedelta(days=30))}, is_delivered=False)
+        self.assertEqual((response.data['updated'], response.data['unchanged']), (2, 2))
+        self.assertFalse(Order.objects.filter(date_delivered__isnull=False).exists())
+        self.assertSummariesMatchARebuild()
+
+    def test_invalid_requests_change_nothing(self):
+        self.assertEqual(self.fulfil(filter={'placed_before': '2026-01-01'}).status_code, 400)
+        self.assertEqual(self.fulfil(filter={'date_placed_before': 'yesterday'}).status_code, 400)
+        self.assertEqual(self.fulfil().status_code, 400)
+        self.assertEqual(self.fulfil(order_ids=[self.orders[0].id], filter={'date_placed_before': '2026-01-01'}).status_code, 400)
+        url = reverse('fulfil_orders', kwargs={'pk': self.other_seller.id})
+        self.assertEqual(self.client.post(url, {'order_ids': [self.other_order.id]}, format='json').status_code, 403)
+        self.assertFalse(Order.objects.filter(is_delivered=True).exists())
+
+
+class ExportTests(CatalogFixtureMixin, APITestCase):
+
+    def setUp(self):
+        self.seller = self.create_seller('hardware@jengabay.com', 'Mombasa Hardware')
+        self.other_seller = self.create_seller('supplies@jengabay.com', 'Nairobi Supplies')
+        self.cement = self.create_item(self.seller, 'Cement', 'cement')
+        self.nails = self.create_item(self.seller, 'Nails')
+        self.orders = [self.create_order(self.seller, days_ago, [self.cement, self.nails][:count])
+                       for days_ago, count in ((0, 1), (2, 2), (10, 2))]
+        self.create_order(self.other_seller, 0, [])
+        self.client.force_authenticate(self.seller.profile)
+
+    def create_order(self, seller, days_ago, items):
+        payment = Transaction.objects.create(transaction_mode='m-pesa', amount=100.0, transaction_code='QX1', recipient=seller)
+        order = Order.objects.create(total_amount_payable=100.0, payment_transaction=payment,
+                                     date_placed=now() - timedelta(days=days_ago))
+        order.ordered_items.set(items)
+        return order
+
+    def export(self, name, **params):
+        response = self.client.get(reverse(name, kwargs={'pk': self.seller.id}), params)
+        content = b''.join(response.streaming_content).decode() if response.streaming else None
+        return response, content
+
+    @mock.patch.object(exports, 'BATCH_SIZE', 2)
+    def test_orders_stream_as_csv_in_batches(self):
+        # the orders are read from one cursor in two batches, the items of each batch are prefetched
+        with self.assertNumQueries(3):
+            response, content = self.export('export_orders')
+        self.assertEqual(response['Content-Type'], 'text/csv; charset=utf-8')
+        self.assertIn('filename="orders.csv"', response['Content-Disposition'])
+        lines = content.splitlines()
+        self.assertEqual(lines[0].split(','), exports.ORDER_FIELDS)
+        self.assertEqual([line.split(',')[0] for line in lines[1:]], [str(order.id) for order in self.orders])
+        self.assertEqual(lines[2].split(',')[-1], '{} {}'.format(self.cement.id, self.nails.id))
+
+    def test_transactions_stream_as_json_lines_within_a_date_range(self):
+        response, content = self.export('export_transactions', format='jsonl',
+                                        date_placed_after=str(localdate() - timedelta(days=5)))
+        self.assertEqual(response['Content-Type'], 'application/jsonl; charset=utf-8')
+        rows = [json.loads(line) for line in content.splitlines()]
+        self.assertEqual([row['orders'] for row in rows], [[self.orders[0].id], [self.orders[1].id]])
+        self.assertEqual(rows[1]['ordered_items'], [self.cement.id, self.nails.id])
+        self.assertEqual(rows[1]['recipient'], self.seller.id)
+
+    def test_invalid_exports_are_rejected(self):
+        response, content = self.export('export_orders', date_placed_before='yesterday')
+        self.assertEqual(response.status_code, 400)
+        url = reverse('export_orders', kwargs={'pk': self.other_seller.id})
+        self.assertEqual(self.client.get(url).status_code, 403)
+
+
+class FastJSONTests(CatalogFixtureMixin, APITestCase):
+
+    def test_catalog_pages_render_as_drf_renders_them(self):
+        seller = self.create_seller('hardware@jengabay.com', 'Mombasa Hardware \u2028 Ltd')
+        self.create_item(seller, 'Cement', 'cement', item_price=650.5)
+        self.create_item(seller, 'Gold leaf', item_price=0.00001)
+        response = self.client.get(reverse('items'))
+        self.assertEqual(response.content, JSONRenderer().render(response.data))
+        results = benchmarks.run_render_benchmarks(sizes=(2,), repeat=1)
+        self.assertTrue(all(result['identical'] for result in results[2].values()))
+
+    def test_values_orjson_writes_differently_are_written_as_drf_writes_them(self):
+        samples = [
+            {'placed': now(), 'day': localdate(), 'price': Decimal('1.10'), 'label': gettext_lazy('Cement'),
+             'id': uuid.uuid4(), 'ids': (1, 2), 'note': 'line\u2028break'},
+            [0.1, -0.0, 650.5, 1e15], {'big': 2 ** 70}, {1: 'non string key'},
+        ]
+        for data in samples:
+            self.assertEqual(FastJSONRenderer().render(data), JSONRenderer().render(data))
+
+    def test_floats_json_writes_in_exponent_notation_are_written_as_drf_writes_them(self):
+        samples = [[1e16, 0.00001, Decimal('1E-7')], {'price': -1.5e300, 'note': 'ae12,'}, 1e-7,
+                   {'price': 2.5e-6, 'sku': None}]
+        for data in samples:
+            self.assertEqual(FastJSONRenderer().render(data), JSONRenderer().render(data))
+        for data in ({'price': float('nan'), 'sku': None}, [None, Decimal('Infinity')]):
+            with self.assertRaises(ValueError):
+                FastJSONRenderer().render(data)
+
+    def test_renders_item_pages_as_drf_renders_them(self):
+        # their timings are left to the benchmark_renderers command
+        MarketplaceSeeder(seed=1, sellers=5, items=100, buyers=1, orders=1).run()
+        codecs = benchmarks.run_render_benchmarks(sizes=(100,), repeat=1)[100]
+        self.assertTrue(codecs['fast']['identical'])
+
+    def test_parsed_as_drf_parses_it(self):
+        for content in ('{"items":[1,2.5,"caf\u00e9"],"big":123456789012345678901234,"none":null}'.encode(),
+                        b'{"small":-9223372036854775808,"large":18446744073709551615}'):
+            self.assertEqual(FastJSONParser().parse(io.BytesIO(content)), JSONParser().parse(io.BytesIO(content)))
+        for invalid in (b'{"items": [1,', b'{"price": NaN}'):
+            with self.assertRaises(ParseError) as raised:
+                FastJSONParser().parse(io.BytesIO(invalid))
+            with self.assertRaises(ParseError) as expected:
+                JSONParser().parse(io.BytesIO(invalid))
+            self.assertEqual(str(raised.exception), str(expected.exception))
+
+
+class FieldsetTests(CatalogFixtureMixin, APITestCase):
+
+    def setUp(self):
+        self.seller = self.create_seller('hardware@jengabay.com', 'Mombasa Hardware')
+        self.items = [self.create_item(self.seller, 'Item {}'.format(number)) for number in range(2)]
+        payment = Transaction.objects.create(transaction_mode='m-pesa', amount=200.0, transaction_code='QX1', recipient=self.seller)
+        self.order = Order.objects.create(total_amount_payable=200.0, payment_transaction=payment)
+        self.order.ordered_items.set(self.items)
+
+    def get(self, url, **params):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url, params)
+        return response, ' '.join(query['sql'] for query in queries.captured_queries)
+
+    def test_items_load_only_the_listing_columns_returned(self):
+        response, sql = self.get(reverse('items'), fields='id,item_name,item_seller.business_name')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['results'][0], {
+            'id': self.items[0].id, 'item_name': 'Item 0', 'item_seller': {'business_name': 'Mombasa Hardware'}})
+        self.assertNotIn('item_description', sql)
+        self.assertNotIn('"street"', sql)
+        response = self.client.get(reverse('item_view', kwargs={'pk': self.items[1].id}), {'fields': 'item_price'})
+        self.assertEqual(response.data, [{'item_price': 100.0}])
+
+    def test_sellers_without_their_location_are_not_joined(self):
+        response, sql = self.get(reverse('sellers'), fields='id,business_name')
+        self.assertEqual(response.data['results'], [{'id': self.seller.id, 'business_name': 'Mombasa Hardware'}])
+        self.assertNotIn('jengabay_subcounty', sql)
+        self.assertEqual(self.client.get(reverse('sellers')).data['results'][0]['sub_county']['subcounty_name'], 'Westlands')
+
+    def test_orders_fetch_only_the_relations_returned(self):
+        self.client.force_authenticate(self.seller.profile)
+        url = reverse('orders', kwargs={'pk': self.seller.id})
+        response, sql = self.get(url, fields='id,total_amount_payable')
+        self.assertEqual(response.data['results'], [{'id': self.order.id, 'total_amount_payable': 200.0}])
+        self.assertNotIn('jengabay_order_ordered_items', sql)
+        self.assertNotIn('transaction_code', sql)
+
+        response = self.client.get(url, {'fields': 'id,ordered_items.item_name', 'expand': 'payment_transaction.recipient'})
+        order = response.data['results'][0]
+        self.assertEqual(sorted(item['item_name'] for item in order['ordered_items']), ['Item 0', 'Item 1'])
+        self.assertNotIn('payment_transaction', order)
+        response = self.client.get(url, {'expand': 'payment_transaction.recipient'})
+        self.assertEqual(response.data['results'][0]['payment_transaction']['recipient']['business_name'], 'Mombasa Hardware')
+        self.assertEqual(self.client.get(url).data['results'][0]['payment_transaction']['recipient'], self.seller.id)
+
+    def test_retrieved_orders_keep_the_relations_their_permissions_read(self):
+        self.client.force_authenticate(self.seller.profile)
+        url = '/sellers/{}/orders/{}/edit'.format(self.seller.id, self.order.id)
+        response, sql = self.get(url, fields='id,total_amount_payable')
+        self.assertEqual(response.data, {'id': self.order.id, 'total_amount_payable': 200.0})
+        # HasSellerPermission reads the payment transaction joined to the order, not a query of its own
+        self.assertIn('JOIN "jengabay_transaction"', sql)
+        self.assertNotIn('FROM "jengabay_transaction"', sql)
+
+    def test_unknown_fields_and_expansions_are_rejected(self):
+        response = self.client.get(reverse('items'), {'fields': 'id,secret,item_price.value'})
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.data['fields'], ['Unknown fields item_price, secret.'])
+        response = self.client.get(reverse('items'), {'fields': 'id,item_seller.nothing'})
+        self.assertEqual(response.data['fields'], ['Unknown fields item_seller.nothing.'])
+        response = self.client.get(reverse('sellers'), {'expand': 'profile'})
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.data['expand'], ['Cannot expand profile.'])
+
+
+class TaskQueueTests(CatalogFixtureMixin, APITestCase):
+    ran = []
+
+    def setUp(self):
+        TaskQueueTests.ran = []
+
+    def test_due_tasks_run_highest_priority_first(self):
+        recording_task.delay('low')
+        tasks.enqueue(recording_task, ['high'], priority=5)
+        tasks.enqueue(recording_task, ['later'], run_after=now() + timedelta(hours=1))
+        call_command('run_workers', once=True, stdout=io.StringIO())
+        self.assertEqual(self.ran, ['high', 'low'])
+        self.assertEqual(list(Task.objects.values_list('args', 'status')), [(['later'], Task.QUEUED)])
+
+    @override_settings(TASK_RETRY_DELAY=10)
+    def test_failed_tasks_are_retried_later_then_dead(self):
+        queued = failing_task.delay('boom')
+        with self.assertLogs('jengabay.tasks', 'WARNING'):
+            self.assertEqual(tasks.run_pending(), 1)
+        task = Task.objects.get(pk=queued.pk)
+        self.assertEqual((task.status, task.attempts), (Task.QUEUED, 1))
+        self.assertGreater(task.run_after, now() + timedelta(seconds=9))
+        self.assertIn('ValueError: boom', task.last_error)
+        self.assertEqual(tasks.run_pending(), 0)
+
+        Task.objects.update(run_after=now())
+        with self.assertLogs('jengabay.tasks', 'ERROR'):
+            tasks.run_pending()
+        self.assertEqual(Task.objects.get(pk=queued.pk).status, Task.DEAD)
+        self.assertEqual(tasks.requeue_dead(), 1)
+        self.assertEqual(Task.objects.get(pk=queued.pk).attempts, 0)
+
+    def test_claimed_tasks_are_left_to_their_worker_until_the_lease_ends(self):
+        queued = recording_task.delay('once')
+        self.assertEqual(tasks.claim('first'), [queued])
+        self.assertEqual(tasks.claim('second'), [])
+        self.assertEqual(tasks.requeue_stale(lease=60), 0)
+        Task.objects.update(locked_at=now() - timedelta(seconds=61))
+        self.assertEqual(tasks.requeue_stale(lease=60), 1)
+        self.assertEqual([task.locked_by for task in tasks.claim('second')], ['second'])
+
+    @override_settings(EMAIL_BACKEND='jengabay.mail.QueuedEmailBackend',
+                       QUEUED_EMAIL_BACKEND='django.core.mail.backends.locmem.EmailBackend')
+    def test_password_reset_emails_are_sent_by_the_workers(self):
+        seller = self.create_seller('hardware@jengabay.com', 'Mombasa Hardware')
+        response = self.client.post(reverse('password_reset:reset-password-request'), {'email': seller.profile.email})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual((len(mail.outbox), Task.objects.count()), (0, 1))
+        tasks.run_pending()
+        self.assertEqual(mail.outbox[0].to, [seller.profile.email])
+        self.assertIn(seller.profile.password_reset_tokens.get().key, mail.outbox[0].body)
+        self.assertFalse(Task.objects.exists())
+
+
+class ReplicaRoutingTests(CatalogFixtureMixin, APITestCase):
+
+    class CatalogView(APIView):
+        read_from_replica = True
+
+        def get(self, request):
+            return Response({'db': router.db_for_read(Item), 'user_db': router.db_for_read(User)})
+
+        def post(self, request):
+            router.db_for_write(Item)
+            return Response({'db': router.db_for_read(Item)})
+
+    class CachedCatalogView(CachedResponseMixin, CatalogView):
+
+        def get_cache_scopes(self):
+            return ['items']
+
+    def request(self, method, view_class=CatalogView, **cookies):
+        request = getattr(RequestFactory(), method)('/items')
+        request.COOKIES.update(cookies)
+        view = view_class.as_view()
+        middleware = ReplicaRoutingMiddleware(lambda request: middleware.process_view(request, view, (), {}) or view(request))
+        response = middleware(request)
+        if isinstance(response, Response):
+            # cache hits are rendered already
+            response.render()
+        return response
+
+    @override_settings(DATABASE_REPLICAS=['replica'])
+    def test_catalog_reads_go_to_the_replica(self):
+        self.assertEqual(self.request('get').data, {'db': 'replica', 'user_db': 'default'})
+        self.assertEqual(router.db_for_read(Item), 'default')
+
+    @override_settings(DATABASE_REPLICAS=['replica'])
+    def test_writers_are_pinned_to_the_primary(self):
+        response = self.request('post')
+        self.assertEqual(response.data, {'db': 'default'})
+        self.assertIn(PIN_COOKIE, response.cookies)
+        self.assertEqual(self.request('get', **{PIN_COOKIE: '1'}).data['db'], 'default')
+
+    @override_settings(DATABASE_REPLICAS=['replica'])
+    def test_cached_responses_are_built_from_the_primary(self):
+        # a replica missing the write that bumped the versions would be cached under the new ones
+        response_cache.clear()
+        self.addCleanup(response_cache.clear)
+        response = self.request('get', self.CachedCatalogView)
+        self.assertEqual((response['X-Cache'], response.data['db']), ('MISS', 'default'))
+        response = self.request('get', self.CachedCatalogView)
+        self.assertEqual((response['X-Cache'], json.loads(response.content)['db']), ('HIT', 'default'))
+
+    def test_everything_reads_the_primary_without_replicas(self):
+        response = self.request('get')
+        self.assertEqual(response.data['db'], 'default')
+        self.assertEqual(self.request('post').cookies, {})
+
+
+class SalesSummaryTests(CatalogFixtureMixin, APITestCase):
+
+    def setUp(self):
+        self.seller = self.create_seller('hardware@jengabay.com', 'Mombasa Hardware')
+        self.cement, self.paint = self.create_item(self.seller, 'Cement'), self.create_item(self.seller, 'Paint')
+        user = User.objects.create_user(username='buyer@jengabay.com', password='Password@123')
+        self.buyer = Buyer.objects.create(profile=user, phone_number='0711111111')
+
+    def place_order(self, items, amount):
+        self.client.force_authenticate(self.buyer.profile)
+        order = {
+            'ordered_items': [item.id for item in items], 'total_amount_payable': amount,
+            'payment_transaction': {'transaction_mode': 'm-pesa', 'amount': amount,
+                                    'transaction_code': 'QX1', 'recipient': self.seller.id},
+        }
+        response = self.client.post(reverse('create_order'), order, format='json')
+        self.assertEqual(response.status_code, 201)
+        return Order.objects.get(pk=response.data['id'])
+
+    def summaries(self):
+        return (sorted(SellerDailySales.objects.values_list('seller', 'date', 'revenue', 'order_count', 'delivered_count')),
+                sorted(ItemSales.objects.values_list('item', 'order_count')))
+
+    def dashboard(self, **params):
+        self.client.force_authenticate(self.seller.profile)
+        return self.client.get(reverse('seller_sales', args=[self.seller.id]), params)
+
+    def test_orders_and_deliveries_update_the_dashboard(self):
+        first = self.place_order([self.cement, self.paint], 300.0)
+        self.place_order([self.cement], 100.0)
+        first.is_delivered = True
+        first.save()
+
+        response = self.dashboard(days=7)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['totals'], {'revenue': 400.0, 'order_count': 2, 'delivered_count': 1, 'pending_count': 1})
+        self.assertEqual(len(response.data['daily']), 7)
+        self.assertEqual(response.data['daily'][-1]['order_count'], 2)
+        self.assertEqual([(item['item'], item['order_count']) for item in response.data['top_items']],
+                         [(self.cement.id, 2), (self.paint.id, 1)])
+
+    def test_incremental_summaries_match_a_rebuild(self):
+        first = self.place_order([self.cement, self.paint], 300.0)
+        second = self.place_order([self.paint], 100.0)
+        first.ordered_items.remove(self.paint)
+        second.date_placed -= timedelta(days=3)
+        second.is_delivered = True
+        second.save()
+        transaction = first.payment_transaction
+        transaction.amount = 250.0
+        transaction.save()
+        self.place_order([self.cement], 50.0).delete()
+
+        incremental = self.summaries()
+        analytics.rebuild_summaries()
+        self.assertEqual(self.summaries(), incremental)
+        self.assertEqual(incremental[1], [(self.cement.id, 1), (self.paint.id, 1)])
+
+    def test_sellers_only_see_their_own_dashboard(self):
+        other_seller = self.create_seller('supplies@jengabay.com', 'Nairobi Supplies')
+        self.client.force_authenticate(other_seller.profile)
+        self.assertEqual(self.client.get(reverse('seller_sales', args=[self.seller.id])).status_code, 403)
+        self.assertEqual(self.dashboard(days=0).status_code, 400)
+
+
+class ItemListingTests(CatalogFixtureMixin, APITestCase):
+
+    def setUp(self):
+        response_cache.clear()
+        self.seller = self.create_seller('hardware@jengabay.com', 'Mombasa Hardware', 'Mvita', 'Mombasa')
+        self.item = self.create_item(self.seller, 'Portland cement', 'cement', item_description='50kg bag')
+        self.other = self.create_item(self.seller, 'Crown paint', 'paints')
+
+    def listing(self, item=None):
+        return ItemListing.objects.get(pk=(item or self.item).pk)
+
+    def test_catalog_representation_matches_the_items(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse('items'))
+        # the validators aggregate and the page, both from the listings alone
+        self.assertEqual(len(queries), 2)
+        self.assertTrue(all('JOIN' not in query['sql'] for query in queries))
+        items = Item.objects.select_related('item_seller__sub_county__county').order_by('pk')
+        expected = ItemViewSerializer(items, many=True, context={'request': response.wsgi_request}).data
+        self.assertEqual(response.data['results'], expected)
+        response = self.client.get(reverse('item_view', kwargs={'pk': self.item.pk}))
+        self.assertEqual(response.data, expected[:1])
+
+    def test_listings_follow_their_sources(self):
+        self.item.item_price = 800.0
+        self.item.save()
+        self.seller.business_name = 'Mvita Hardware'
+        self.seller.save()
+        sub_county = self.seller.sub_county
+        sub_county.subcounty_name = 'Old Town'
+        sub_county.save()
+        county = sub_county.county
+        county.county_name = 'Mombasa Island'
+        county.save()
+        self.seller.refresh_from_db()
+        listing = self.listing()
+        self.assertEqual((listing.item_price, listing.business_name, listing.subcounty_name, listing.county_name),
+                         (800.0, 'Mvita Hardware', 'Old Town', 'Mombasa Island'))
+        # renames move the modification time of the sellers forward, see touch_subcounty_sellers
+        self.assertEqual(listing.seller_updated_at, self.seller.updated_at)
+        response = self.client.get(reverse('items'), {'search': 'island'})
+        self.assertEqual(len(response.data['results']), 2)
+
+    def test_moved_sellers_and_deleted_items(self):
+        nairobi = self.create_seller('supplies@jengabay.com', 'Nairobi Supplies').sub_county
+        self.seller.sub_county = nairobi
+        self.seller.save()
+        self.assertEqual((self.listing().sub_county_id, self.listing().county_name), (nairobi.id, 'Nairobi'))
+        self.other.delete()
+        self.assertFalse(ItemListing.objects.filter(pk=self.other.pk).exists())
+
+    def test_rebuild_copies_bulk_written_items(self):
+        Item.objects.bulk_create([Item(item_seller=self.seller, item_name='Rebar', item_price=90.0,
+                                       item_measurement_unit='piece')])
+        self.assertEqual(ItemListing.objects.count(), 2)
+        self.assertEqual(listings.rebuild(), 3)
+
+
+class FacetCountTests(CatalogFixtureMixin, APITestCase):
+
+    def setUp(self):
+        self.seller = self.create_seller('hardware@jengabay.com', 'Mombasa Hardware', 'Mvita', 'Mombasa')
+        self.other_seller = self.create_seller('supplies@jengabay.com', 'Nairobi Supplies')
+        self.create_item(self.seller, 'Portland cement', 'cement')
+        self.create_item(self.seller, 'Crown paint', 'paints')
+        self.create_item(self.other_seller, 'Rapid set cement', 'cement')
+        response_cache.clear()
+
+    def get_facets(self, **params):
+        response = self.client.get(reverse('items'), dict(params, facets='true'))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.data['results']), sum(entry['count'] for entry in response.data['facets']['category']))
+        return {name: {entry.get('value') or entry['name']: entry['count'] for entry in entries}
+                for name, entries in response.data['facets'].items()}
+
+    def test_catalog_counts_are_read_from_the_precomputed_cells(self):
+        with self.assertNumQueries(4):
+            counts = self.get_facets()
+        self.assertEqual(counts, {
+            'category': {'cement': 2, 'paints': 1},
+            'county': {'Mombasa': 2, 'Nairobi': 1},
+            'sub_county': {'Mvita': 2, 'Westlands': 1},
+        })
+        self.assertEqual(self.get_facets(category='cement')['county'], {'Mombasa': 1, 'Nairobi': 1})
+
+    def test_counts_follow_item_and_seller_changes(self):
+        item = Item.objects.get(item_name='Crown paint')
+        item.category = 'cement'
+        item.save()
+        Item.objects.get(item_name='Rapid set cement').delete()
+        self.seller.sub_county = SubCounty.objects.get(subcounty_name='Westlands')
+        self.seller.save()
+        self.create_item(self.other_seller, 'Gloss paint', 'paints')
+
+        counts = self.get_facets()
+        self.assertEqual(counts['category'], {'cement': 2, 'paints': 1})
+        self.assertEqual(counts['sub_county'], {'Westlands': 3})
+        self.assertEqual(counts['county'], {'Nairobi': 3})
+
+    def test_searches_are_counted_over_the_matching_items(self):
+        self.assertEqual(self.get_facets(search='cement')['sub_county'], {'Mvita': 1, 'Westlands': 1})
+
+
+class AsyncViewTests(CatalogFixtureMixin, APITestCase):
+
+    def setUp(self):
+        self.seller = self.create_seller('hardware@jengabay.com', 'Mombasa Hardware')
+        self.create_item(self.seller, 'Portland cement', 'cement')
+        self.create_item(self.seller, 'Crown paint', 'paints')
+        response_cache.clear()
+
+    async def call(self, view_class, request, **kwargs):
+        response = await view_class.as_async_view()(request, **kwargs)
+        return response.render() if hasattr(response, 'render') else response
+
+    async def test_catalog_lists_are_served_natively(self):
+        request = AsyncRequestFactory().get('/items', {'page_size': 1, 'facets': 'true'})
+        response = await self.call(AllItemsListView, request)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['X-Cache'], 'MISS')
+        data = json.loads(response.content)
+        self.assertEqual(len(data['results']), 1)
+        self.assertIsNotNone(data['next'])
+        self.assertEqual({entry['value'] for entry in data['facets']['category']}, {'cement', 'paints'})
+
+        cached = await self.call(AllItemsListView, AsyncRequestFactory().get('/items', {'page_size': 1, 'facets': 'true'},
+                                                                             headers={'If-None-Match': response['ETag']}))
+        self.assertEqual((cached.status_code, cached['X-Cache']), (304, 'HIT'))
+
+    async def test_login_hashes_the_password_off_the_event_loop(self):
+        threads = []
+
+        def verify(*args, **kwargs):
+            threads.append(threading.current_thread().name)
+            return verify_password(*args, **kwargs)
+
+        with mock.patch('jengabay.passwords.verify_password', verify):
+            response = await self.call(CustomAuthToken, AsyncRequestFactory().post(
+                '/login', {'username': 'hardware@jengabay.com', 'password': 'Password@123'}))
+            rejected = await self.call(CustomAuthToken, AsyncRequestFactory().post(
+                '/login', {'username': 'hardware@jengabay.com', 'password': 'wrong'}))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual((response.data['session_status'], response.data['account_id']), ('seller', self.seller.id))
+        self.assertEqual(rejected.status_code, 400)
+        self.assertTrue(all(name.startswith('password-hashing') for name in threads))
+
+
+@override_settings(REQUEST_TIMING_SAMPLE_RATE=1, SLOW_REQUEST_MS=10000)
+class InstrumentationTests(CatalogFixtureMixin, APITestCase):
+
+    def setUp(self):
+        ExpiringTokenAuthentication.cache.clear()
+        self.seller = self.create_seller('hardware@jengabay.com', 'Mombasa Hardware')
+        self.client.credentials(HTTP_AUTHORIZATION='Token ' + Token.objects.create(user=self.seller.profile).key)
+
+    def metrics(self, response):
+        return {metric.split(';')[0]: metric for metric in response['Server-Timing'].split(', ')}
+
+    def test_view_phases_are_reported_in_server_timing(self):
+        response = self.client.get(reverse('orders', kwargs={'pk': self.seller.id}))
+        self.assertEqual(response.status_code, 200)
+        metrics = self.metrics(response)
+        self.assertEqual(set(metrics), {'db', 'auth', 'perm', 'ser', 'render', 'total'})
+        # token and role lookup, validators and the page
+        self.assertIn('desc="3 queries (0 repeated)"', metrics['db'])
+
+    @override_settings(REQUEST_TIMING_SAMPLE_RATE=0)
+    def test_requests_that_are_not_sampled_are_not_timed(self):
+        response = self.client.get(reverse('orders', kwargs={'pk': self.seller.id}))
+        self.assertFalse(response.has_header('Server-Timing'))
+
+    @override_settings(REQUEST_TIMING_SAMPLE_RATE=0, SLOW_REQUEST_MS=0)
+    def test_slow_requests_are_logged_when_not_sampled(self):
+        with self.assertLogs('jengabay.slow_requests', 'WARNING') as logs:
+            response = InstrumentationMiddleware(lambda request: HttpResponse(status=204))(RequestFactory().get('/items'))
+        self.assertFalse(response.has_header('Server-Timing'))
+        record = json.loads(logs.records[0].getMessage())
+        self.assertEqual((record['path'], record['status'], record['sampled']), ('/items', 204, False))
+        self.assertNotIn('queries', record)
+
+    @override_settings(SLOW_REQUEST_MS=0)
+    def test_slow_requests_are_logged_with_their_repeated_queries(self):
+        def view(request):
+            for item_id in (1, 2, 3):
+                list(Item.objects.filter(id=item_id))
+            return HttpResponse()
+
+        with self.assertLogs('jengabay.slow_requests', 'WARNING') as logs:
+            response = InstrumentationMiddleware(view)(RequestFactory().get('/items'))
+        self.assertIn('desc="3 queries (3 repeated)"', self.metrics(response)['db'])
+        record = json.loads(logs.records[0].getMessage())
+        self.assertEqual((record['path'], record['status'], record['sampled'], record['queries']), ('/items', 200, True, 3))
+        self.assertEqual(record['repeated_queries'][0]['count'], 3)
+
+    async def test_queries_of_async_requests_run_in_threads_are_recorded(self):
+        async def view(request):
+            await Item.objects.acount()
+            await Item.objects.filter(category='cement').aexists()
+            return HttpResponse()
+
+        response = await InstrumentationMiddleware(view)(AsyncRequestFactory().get('/items'))
+        self.assertIn('desc="2 queries (0 repeated)"', self.metrics(response)['db'])
+
+
+class MarketplaceSeederTests(APITestCase):
+
+    def test_generated_rows_are_linked_and_counted(self):
+        MarketplaceSeeder(seed=1, sellers=5, items=60, buyers=4, orders=30, batch_size=7).run()
+        self.assertEqual((County.objects.count(), Seller.objects.count(), Item.objects.count(), Order.objects.count()),
+                         (47, 5, 60, 30))
+        self.assertEqual(User.objects.values('password').distinct().count(), 1)
+        self.assertEqual(Item.objects.values('item_seller').distinct().count(), 5)
+        # every order buys items of the seller it pays
+        self.assertFalse(Order.objects.exclude(ordered_items__item_seller=F('payment_transaction__recipient')).exists())
+        self.assertEqual(sum(row.order_count for row in SellerDailySales.objects.all()), 30)
+        self.assertEqual(sum(row.item_count for row in ItemFacetCount.objects.all()), 60)
+        # the grades only appear in item names
+        self.assertEqual(len(self.client.get(reverse('items'), {'search': 'premium', 'page_size': 200}).data['results']),
+                         Item.objects.filter(item_name__contains='premium').count())
+
+
+class BenchmarkHarnessTests(APITestCase):
+
+    def test_every_route_is_measured_without_errors(self):
+        dataset = benchmarks.seed_dataset(scale=0.1)
+        endpoints = benchmarks.build_endpoints(dataset)
+        routes = {str(resolve(endpoint.get_path(0).split('?')[0]).route) for endpoint in endpoints}
+        self.assertEqual(routes, {str(pattern.pattern) for pattern in urls.urlpatterns})
+
+        results = benchmarks.run_benchmarks(dataset, requests=2, warmup=0)
+        self.assertEqual({name: result['errors'] for name, result in results.items() if result['errors']}, {})
+
+    def test_regressions_are_flagged_against_the_baseline(self):
+        baseline = {'items': {'p95_ms': 10.0, 'throughput': 100.0, 'queries': 2.0}}
+        current = {'items': {'p95_ms': 11.0, 'throughput': 70.0, 'queries': 3.0}}
+        rows = benchmarks.compare(current, baseline, threshold=20)
+        self.assertEqual([(metric, regressed) for name, metric, *values, regressed in rows],
+                         [('p95_ms', False), ('throughput', True), ('queries', True)])
@@ -1,25 +1,141 @@
+from rest_framework import permissions
 from rest_framework.authentication import TokenAuthentication, get_authorization_header
 from rest_framework.authtoken.models import Token
 from rest_framework.exceptions import AuthenticationFailed
+from django.conf import settings
+from collections import OrderedDict
 from datetime import datetime, timedelta
+import copy
+import threading
+import time
 import pytz
+from . import signed_tokens
+
+
+class TokenCache:
+    """A thread safe, bounded LRU cache of token key -> token (with its user) whose entries
+    expire after a time to live.
+    Entries are invalidated through model signals, the time to live bounds how long another
+    process may keep serving a token that was refreshed, revoked or deactivated elsewhere"""
+
+    def __init__(self, max_size=1024, ttl=60):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[1] < time.monotonic():
+                if entry is not None:
+                    del self._entries[key]
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def set(self, key, token):
+        with self._lock:
+            self._entries[key] = (token, time.monotonic() + self.ttl)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def invalidate_user(self, user_id):
+        """drops every cached token belonging to the given user"""
+        with self._lock:
+            for key in [key for key, (token, _) in self._entries.items() if token.user_id == user_id]:
+                del self._entries[key]
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.hits = self.misses = 0
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'size': len(self._entries),
+                'hit_ratio': self.hits / lookups if lookups else 0.0,
+            }
+
+
+def copy_user(user):
+    """Copies the user along with its loaded seller and buyer accounts, which point back to the copy"""
+    user = copy.copy(user)
+    for name in ('seller', 'buyer'):
+        field = user._meta.get_field(name)
+        profile = field.get_cached_value(user, default=None)
+        if profile is not None:
+            profile = copy.copy(profile)
+            setattr(profile, field.field.name, user)
+            field.set_cached_value(user, profile)
+    return user
+
 
 class ExpiringTokenAuthentication(TokenAuthentication):
-    
+    """Token authentication whose tokens expire 24 hours after they were created or refreshed,
+    looked up tokens are kept in an in-process cache shared by all requests"""
+
+    cache = TokenCache(
+        max_size=getattr(settings, 'TOKEN_CACHE_MAX_SIZE', 1024),
+        ttl=getattr(settings, 'TOKEN_CACHE_TTL', 60),
+    )
+
     def authenticate_credentials(self, key):
-        try:
-            token = Token.objects.get(key=key)
-        except Token.DoesNotExist:
-            raise AuthenticationFailed('Invalid token')
+        token = self.cache.get(key)
+        if token is None:
+            try:
+                # the seller and buyer accounts are loaded along so that the
+                # role of the user is resolved without further queries, see jengabay.roles
+                token = Token.objects.select_related('user__seller', 'user__buyer').get(key=key)
+            except Token.DoesNotExist:
+                raise AuthenticationFailed('Invalid token')
 
-        if not token.user.is_active:
-            raise AuthenticationFailed('User inactive or deleted')
+            if not token.user.is_active:
+                raise AuthenticationFailed('User inactive or deleted')
+            self.cache.set(key, token)
 
         # This is required for the time comparison
         utc_now = datetime.utcnow()
         utc_now = utc_now.replace(tzinfo=pytz.utc)
 
         if token.created < utc_now - timedelta(hours=24):
+            self.cache.invalidate(key)
             raise AuthenticationFailed('Token has expired')
 
-        return token.user, token
\ No newline at end of file
+        # every request gets its own copy so that changes made while handling
+        # one request do not leak into the cached instances
+        token = copy.copy(token)
+        token.user = copy_user(token.user)
+        return token.user, token
+
+
+class SignedTokenAuthentication(ExpiringTokenAuthentication):
+    """Token authentication accepting the signed tokens of jengabay.signed_tokens, verified
+    without a database query, besides the database tokens of ExpiringTokenAuthentication.
+    Writes made with a signed token check in one query that it was not revoked"""
+
+    def authenticate(self, request):
+        result = super().authenticate(request)
+        if result is not None and isinstance(result[1], signed_tokens.SignedToken) \
+                and request.method not in permissions.SAFE_METHODS:
+            signed_tokens.check_revocation(result[1])
+        return result
+
+    def authenticate_credentials(self, key):
+        if not signed_tokens.is_signed(key):
+            return super().authenticate_credentials(key)
+        token = signed_tokens.verify(key)
+        return token.get_user(), token
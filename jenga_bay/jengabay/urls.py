@@ -1,34 +1,47 @@
+from django.conf import settings
 from django.urls import path
 from . import views
 
+
+def asgi_view(view):
+    """serves the natively async handlers of a view on the event loop when running under ASGI"""
+    return view.as_async_view() if settings.ASYNC_VIEWS else view.as_view()
+
+
 urlpatterns = [
     #api endpoint for creating a seller
     path('create_seller_account', views.SellerCreateView.as_view(), name='createseller'),
 
     #api for viewing all registered sellers
-    path('sellers/', views.SellerListView.as_view(), name='sellers'),
+    path('sellers/', asgi_view(views.SellerListView), name='sellers'),
 
     #api endpoint for viewing a specific seller
-    path('sellers/<str:pk>', views.SpecificSellerView.as_view(), name='seller'),
+    path('sellers/<str:pk>', asgi_view(views.SpecificSellerView), name='seller'),
 
     #api endpoint for viewing, updating and deleting a specific seller
     path('sellers/<str:pk>/profile', views.SpecificSellerProfileView.as_view(), name='seller_profile'),
 
     #api endpoint for viewing all items
-    path('items', views.AllItemsListView.as_view(), name='items'),
+    path('items', asgi_view(views.AllItemsListView), name='items'),
 
     #api endpoint for viewing a specific item in the home page
-    path('items/<int:pk>', views.SpecificItemView.as_view(), name='item_view'),
+    path('items/<int:pk>', asgi_view(views.SpecificItemView), name='item_view'),
 
     #api endpoint for viewing items belonging to a specific seller
-    path('sellers/<str:pk>/items', views.SpecificSellerItemsView.as_view(),name='seller_items'),
+    path('sellers/<str:pk>/items', asgi_view(views.SpecificSellerItemsView),name='seller_items'),
 
     #api endpoint for creating items
     path('sellers/<str:pk>/items/add_item', views.ItemCreateView.as_view(),name='add_item'),
 
+    #api endpoint for importing items in bulk from a csv or json lines file
+    path('sellers/<str:pk>/items/import', views.ItemImportView.as_view(),name='import_items'),
+
     #api endpoint for viewing and updating a specific item in a specific seller page
     path('sellers/<str:seller_id>/items/<int:pk>', views.SpecificSellerSpecificItemView.as_view(), name='seller_specific_item'),
 
+    #api endpoint for the sales dashboard of a seller
+    path('sellers/<str:pk>/sales', views.SellerSalesView.as_view(), name='seller_sales'),
+
     #api endpoint for creating a buyer account
     path('create_buyer', views.BuyerCreateView().as_view(), name='create_buyer'),
 
@@ -36,7 +49,7 @@ urlpatterns = [
     path('buyers/<str:pk>/profile', views.SpecificBuyerProfileView.as_view(), name='buyer_profile'),
 
     #api for viewing a specific buyer
-    path('buyers/<str:pk>', views.SpecificBuyerView.as_view(), name='buyer_profile'),
+    path('buyers/<str:pk>', asgi_view(views.SpecificBuyerView), name='buyer_profile'),
 
     #api for creating an order
     path('submit_order', views.OrderCreateView.as_view(), name='create_order'),
@@ -44,6 +57,15 @@ urlpatterns = [
     #api for listing seller orders
     path('sellers/<str:pk>/orders', views.OrderListView.as_view(), name='orders'),
 
+    #api for marking many orders of a seller delivered at once
+    path('sellers/<str:pk>/orders/fulfil', views.OrderFulfilmentView.as_view(), name='fulfil_orders'),
+
+    #api for downloading all orders of a seller as a csv or json lines file
+    path('sellers/<str:pk>/orders/export', views.OrderExportView.as_view(), name='export_orders'),
+
+    #api for downloading all transactions paid to a seller as a csv or json lines file
+    path('sellers/<str:pk>/transactions/export', views.TransactionExportView.as_view(), name='export_transactions'),
+
     #api for retreiving, updating and deleting a specific order
     path('sellers/<str:seller_id>/orders/<str:pk>/edit', views.SpecificSellerSpecificOrderView.as_view(), name='orders'),
 
@@ -53,5 +75,11 @@ urlpatterns = [
     #api for viewing a specific order
     path('buyers/<str:pk>/orders', views.SpecificBuyerOrderView.as_view(), name='buyer_orders'),
 
-    path('login', views.CustomAuthToken.as_view(), name='login')
+    path('login', asgi_view(views.CustomAuthToken), name='login'),
+
+    #api for revoking the token of a logged in user
+    path('logout', views.LogoutView.as_view(), name='logout'),
+
+    #api for viewing the cache hit ratios, admins only
+    path('stats/cache', views.CacheStatsView.as_view(), name='cache_stats'),
 ]
\ No newline at end of file
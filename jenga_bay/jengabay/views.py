@@ -1,4 +1,12 @@
+import hashlib
+import json
 from django.shortcuts import render
+from django.db import IntegrityError
+from datetime import timedelta
+from django.db.models import Prefetch, Sum
+from django.conf import settings
+from django.http import StreamingHttpResponse
+from django.utils.timezone import localdate
 from .serializers import *
 from rest_framework.generics import CreateAPIView, ListAPIView, RetrieveUpdateDestroyAPIView
 from .models import *
@@ -8,78 +16,156 @@ from . permissions import *
 from rest_framework.authtoken.views import ObtainAuthToken
 from rest_framework.authtoken.models import Token
 from rest_framework.response import Response
-
-class SellerCreateView(CreateAPIView):
+from .search import ItemSearchFilter
+from .filters import ItemFilter, ItemListingFilter, KeysetOrderingFilter, OrderFilter, TransactionFilter
+from . import exports, facets, fulfilment, instrumentation, listings, passwords, signed_tokens
+from .roles import get_buyer, get_role, get_seller
+from .imports import ItemImport, read_csv_rows, read_jsonl_rows
+from rest_framework.views import APIView
+from rest_framework import status
+from rest_framework.parsers import MultiPartParser
+from rest_framework.exceptions import PermissionDenied, ValidationError
+from rest_framework.utils.encoders import JSONEncoder
+from .mixins import AsyncListMixin, AsyncViewMixin, CachedResponseMixin, ConditionalResponseMixin, InstrumentedViewMixin
+from .cache import catalog_scopes, response_cache
+from .token_authentication import ExpiringTokenAuthentication
+from .pagination import IdCursorPagination, NewestFirstCursorPagination
+from .renderers import CSVRenderer, JSONLinesRenderer
+from .fieldsets import FieldsetViewMixin
+
+def order_queryset():
+    """returns orders together with the relations walked by OrderSerializer,
+    the payment transaction is joined and the ordered item ids are fetched in one extra query"""
+    return Order.objects.select_related('payment_transaction').prefetch_related(
+        Prefetch('ordered_items', queryset=Item.objects.only('id')))
+
+class SellerCreateView(InstrumentedViewMixin, CreateAPIView):
     """api for creating new sellers"""
 
     serializer_class = SellerProfileSerializer
     queryset = Seller.objects.all()
 
-class SellerListView(ListAPIView):
+class SellerListView(InstrumentedViewMixin, FieldsetViewMixin, CachedResponseMixin, ConditionalResponseMixin, AsyncListMixin, ListAPIView):
     """api for listing all sellers"""
 
+    pagination_class = IdCursorPagination
+    read_from_replica = True
     serializer_class = SellerSerializer
-    queryset = Seller.objects.all().filter(profile__is_active=True)
+    queryset = Seller.objects.select_related('sub_county__county').filter(profile__is_active=True)
+
+    def get_cache_scopes(self):
+        return ['sellers']
 
 
-class SpecificSellerProfileView(RetrieveUpdateDestroyAPIView):
+class SpecificSellerProfileView(InstrumentedViewMixin, ConditionalResponseMixin, RetrieveUpdateDestroyAPIView):
     """api used to get, update and delete a specific seller
     must be logged in as a seller"""
     permission_classes = [permissions.IsAuthenticated, IsAccountOwner]
     serializer_class = SellerProfileUpdateSerializer
-    queryset = Seller.objects.all()
+    queryset = Seller.objects.select_related('profile')
 
-class SpecificSellerView(ListAPIView):
+class SpecificSellerView(InstrumentedViewMixin, FieldsetViewMixin, CachedResponseMixin, ConditionalResponseMixin, AsyncListMixin, ListAPIView):
     """api used to get a specific seller"""
 
+    read_from_replica = True
     serializer_class = SellerSerializer
 
     def get_queryset(self):
-        return Seller.objects.all().filter(id=self.kwargs['pk'])
+        return Seller.objects.select_related('sub_county__county').filter(id=self.kwargs['pk'])
+
+    def get_cache_scopes(self):
+        return ['seller:{}'.format(self.kwargs['pk'])]
 
-class SpecificItemView(ListAPIView):
+class SpecificItemView(InstrumentedViewMixin, FieldsetViewMixin, CachedResponseMixin, ConditionalResponseMixin, AsyncListMixin, ListAPIView):
     """api used to get a specific item"""
 
-    serializer_class = ItemViewSerializer
+    validator_fields = ('updated_at', 'seller_updated_at')
+    read_from_replica = True
+    serializer_class = ItemListingSerializer
     
     def get_queryset(self):
-        return Item.objects.all().filter(id=self.kwargs['pk'])
+        return ItemListing.objects.filter(pk=self.kwargs['pk'])
 
-class SpecificSellerSpecificItemView(RetrieveUpdateDestroyAPIView):
+    def shape_queryset(self, queryset, serializer):
+        return listings.shape_queryset(queryset, serializer, self.get_required_columns())
+
+    def get_cache_scopes(self):
+        return ['item:{}'.format(self.kwargs['pk'])]
+
+class SpecificSellerSpecificItemView(InstrumentedViewMixin, RetrieveUpdateDestroyAPIView):
     """api used to get, update and delete a specific item in a specific seller page
     must be logged in as the item seller"""
     serializer_class = ItemSerializer
     queryset = Item.objects.all()
     permission_classes = [permissions.IsAuthenticated, IsItemSeller]
 
-class AllItemsListView(ListAPIView):
-    """api listing all items in the database"""
+class AllItemsListView(InstrumentedViewMixin, FieldsetViewMixin, CachedResponseMixin, ConditionalResponseMixin, AsyncListMixin, ListAPIView):
+    """api listing all items in the database, read from their flattened listings"""
 
-    serializer_class = ItemViewSerializer
-    queryset = Item.objects.all()
-    filter_backends = [filters.SearchFilter, DjangoFilterBackend,]
+    pagination_class = IdCursorPagination
+    validator_fields = ('updated_at', 'seller_updated_at')
+    read_from_replica = True
+    serializer_class = ItemListingSerializer
+    queryset = ItemListing.objects.all()
+    filter_backends = [KeysetOrderingFilter, ItemSearchFilter, DjangoFilterBackend,]
     search_fields = [
-        'item_seller__business_name', 'item_seller__sub_county__subcounty_name',
-        'item_seller__sub_county__county__county_name', 'item_seller__local_area_name',
-        'item_seller__town', 'item_seller__building', 'item_seller__street',
-        'item_name', 'item_description', 'category',]
+        'business_name', 'subcounty_name', 'county_name', 'local_area_name',
+        'town', 'building', 'street', 'item_name', 'item_description', 'category',]
         
-    filterset_fields = ['category',]
-
-class SpecificSellerItemsView(ListAPIView):
+    filterset_class = ItemListingFilter
+    ordering_fields = ['item_price',]
+
+    def shape_queryset(self, queryset, serializer):
+        return listings.shape_queryset(queryset, serializer, self.get_required_columns())
+
+    def get_cache_scopes(self):
+        return catalog_scopes(self.request.query_params.get('category'))
+
+    def get_facet_rows(self):
+        """returns the category, county and sub county counts of the listed items,
+        read from the precomputed counts unless a search or a price range narrows the list"""
+        params = self.request.query_params
+        if any(params.get(param) for param in (ItemSearchFilter.search_param, 'min_price', 'max_price')):
+            return facets.queryset_rows(self.filter_queryset(self.get_queryset()))
+        return facets.catalog_rows(self.request.query_params.get('category') or None)
+
+    def facets_requested(self, response):
+        return response.status_code == 200 and self.request.query_params.get('facets') in ('true', '1')
+
+    def list(self, request, *args, **kwargs):
+        """lists the items, with their facet counts when requested with 'facets=true'"""
+        response = super().list(request, *args, **kwargs)
+        if self.facets_requested(response):
+            response.data['facets'] = facets.build_facets(self.get_facet_rows())
+        return response
+
+    async def alist(self, request, *args, **kwargs):
+        response = await super().alist(request, *args, **kwargs)
+        if self.facets_requested(response):
+            response.data['facets'] = await facets.abuild_facets(self.get_facet_rows())
+        return response
+
+class SpecificSellerItemsView(InstrumentedViewMixin, CachedResponseMixin, ConditionalResponseMixin, AsyncListMixin, ListAPIView):
     """api for listing items belonging to a specific seller"""
 
+    pagination_class = IdCursorPagination
+    read_from_replica = True
     serializer_class = ItemSerializer
-    filter_backends = [filters.SearchFilter, DjangoFilterBackend,]
+    filter_backends = [KeysetOrderingFilter, ItemSearchFilter, DjangoFilterBackend,]
     search_fields = ['item_name', 'item_description', 'category',]
-    filterset_fields = ['category',]
+    search_index_columns = ['item_name', 'item_description', 'category',]
+    filterset_class = ItemFilter
+    ordering_fields = ['item_price',]
 
 
     def get_queryset(self):
         return Item.objects.all().filter(item_seller=self.kwargs['pk'])
 
+    def get_cache_scopes(self):
+        return ['seller-items:{}'.format(self.kwargs['pk'])]
 
-class ItemCreateView(CreateAPIView):
+
+class ItemCreateView(InstrumentedViewMixin, CreateAPIView):
     """api for creating items via a seller account
     must be logged in as a seller"""
 
@@ -87,101 +173,282 @@ class ItemCreateView(CreateAPIView):
     serializer_class = ItemCreateSerializer
     queryset = Item.objects.all()
 
-class BuyerCreateView(CreateAPIView):
+class ItemImportView(InstrumentedViewMixin, APIView):
+    """api for importing items in bulk from an uploaded CSV or JSON Lines file
+    must be logged in as the seller, pass 'mode=upsert' to update the items matching the sku of a row"""
+
+    permission_classes = [permissions.IsAuthenticated, HasAddItemPermission]
+    parser_classes = [MultiPartParser]
+
+    def post(self, request, *args, **kwargs):
+        seller = get_seller(request.user)
+        if str(seller.id) != self.kwargs['pk']:
+            raise PermissionDenied()
+
+        upload = request.data.get('file')
+        if upload is None:
+            raise ValidationError({'file': ['No file was submitted.']})
+        file_format = request.data.get('format') or upload.name.rsplit('.', 1)[-1].lower()
+        if file_format == 'csv':
+            rows = read_csv_rows(upload)
+        elif file_format in ('jsonl', 'ndjson'):
+            rows = read_jsonl_rows(upload)
+        else:
+            raise ValidationError({'format': ['Expected a csv or jsonl file.']})
+
+        mode = request.data.get('mode', 'create')
+        if mode not in ('create', 'upsert'):
+            raise ValidationError({'mode': ['Expected create or upsert.']})
+
+        return Response(ItemImport(seller, upsert=(mode == 'upsert')).run(rows))
+
+class BuyerCreateView(InstrumentedViewMixin, CreateAPIView):
     """api for creating new buyers"""
 
     serializer_class = BuyerProfileSerializer
     queryset = Buyer.objects.all()
 
-class BuyerListView(ListAPIView):
+class BuyerListView(InstrumentedViewMixin, ListAPIView):
     """api for listing all buyers"""
 
+    pagination_class = IdCursorPagination
     serializer_class = BuyerSerializer
-    queryset = Buyer.objects.all().filter(profile__is_active=True)
+    queryset = Buyer.objects.select_related('profile').filter(profile__is_active=True)
 
 
-class SpecificBuyerProfileView(RetrieveUpdateDestroyAPIView):
+class SpecificBuyerProfileView(InstrumentedViewMixin, RetrieveUpdateDestroyAPIView):
     """api used to get, update and delete a specific Buyer
     must be logged in as a buyer"""
     permission_classes = [permissions.IsAuthenticated, IsAccountOwner]
     serializer_class = BuyerProfileUpdateSerializer
-    queryset = Buyer.objects.all()
+    queryset = Buyer.objects.select_related('profile')
 
-class SpecificBuyerView(ListAPIView):
+class SpecificBuyerView(InstrumentedViewMixin, AsyncListMixin, ListAPIView):
     """api used to get a specific Buyer"""
 
     serializer_class = BuyerSerializer
 
     def get_queryset(self):
-        return Seller.objects.all().filter(id=self.kwargs['pk'])
+        return Buyer.objects.select_related('profile').filter(id=self.kwargs['pk'])
 
-class OrderCreateView(CreateAPIView):
+class OrderCreateView(InstrumentedViewMixin, CreateAPIView):
     """api for creating a new order
     must be logged in as a buyer"""
     permission_classes = [permissions.IsAuthenticated, IsABuyer]
     serializer_class = OrderSerializer
     queryset = Order.objects.all()
 
-class OrderListView(ListAPIView):
+    def get_submitted_order(self, idempotency_key):
+        """returns the order the buyer already submitted with the given Idempotency-Key header or None"""
+        return order_queryset().filter(
+            payment_transaction__payer=get_buyer(self.request.user),
+            payment_transaction__idempotency_key=idempotency_key,
+        ).first()
+
+    def get_body_hash(self):
+        """returns the hash of the submitted order, a retry reusing its Idempotency-Key must match it"""
+        data = self.request.data
+        if hasattr(data, 'lists'):
+            # form data, every value of a field counts
+            data = dict(data.lists())
+        return hashlib.sha256(json.dumps(data, sort_keys=True, cls=JSONEncoder).encode()).hexdigest()
+
+    def replay(self, order, body_hash):
+        stored_hash = order.payment_transaction.idempotency_hash
+        if stored_hash is not None and stored_hash != body_hash:
+            return Response({'Idempotency-Key': ['This key was used to submit a different order.']},
+                            status=status.HTTP_422_UNPROCESSABLE_ENTITY)
+        return Response(self.get_serializer(order).data, status=status.HTTP_200_OK,
+                        headers={'Idempotent-Replayed': 'true'})
+
+    def create(self, request, *args, **kwargs):
+        """submits an order, retries carrying the Idempotency-Key header of a submitted order
+        return that order instead of placing it again, and are refused with 422 when their
+        body differs from the submitted one"""
+        idempotency_key = request.headers.get('Idempotency-Key') or None
+        body_hash = None
+        if idempotency_key is not None:
+            if len(idempotency_key) > 255:
+                raise ValidationError({'Idempotency-Key': ['Ensure this header has no more than 255 characters.']})
+            body_hash = self.get_body_hash()
+            order = self.get_submitted_order(idempotency_key)
+            if order is not None:
+                return self.replay(order, body_hash)
+
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        try:
+            serializer.save(idempotency_key=idempotency_key, idempotency_hash=body_hash)
+        except IntegrityError:
+            # a concurrent retry placed the order first
+            order = self.get_submitted_order(idempotency_key) if idempotency_key is not None else None
+            if order is None:
+                raise
+            return self.replay(order, body_hash)
+        return Response(serializer.data, status=status.HTTP_201_CREATED)
+
+class OrderListView(InstrumentedViewMixin, FieldsetViewMixin, ConditionalResponseMixin, ListAPIView):
     """api for listing all orders for a specific seller
     must be logged in as a seller"""
     permission_classes = [permissions.IsAuthenticated, HasSellerPermission]
+    pagination_class = NewestFirstCursorPagination
+    # the orders nest their payment transaction
+    validator_fields = ('updated_at', 'payment_transaction__updated_at')
     serializer_class = OrderSerializer
+    filter_backends = [KeysetOrderingFilter, DjangoFilterBackend,]
+    filterset_class = OrderFilter
+    ordering_fields = ['date_placed', 'total_amount_payable',]
 
     def get_queryset(self):
-        return Order.objects.all().filter(payment_transaction__recipient=self.kwargs['pk'])
+        return order_queryset().filter(payment_transaction__recipient=self.kwargs['pk'])
+
+
+class OrderFulfilmentView(InstrumentedViewMixin, APIView):
+    """api for marking many orders of a seller delivered, or pending again with 'is_delivered': false,
+    in one update: either the listed 'order_ids' or the orders matching a 'filter' such as
+    {'date_placed_before': '2026-10-01'}. Listed orders paid to other sellers are rejected
+    must be logged in as the seller"""
+
+    permission_classes = [permissions.IsAuthenticated, HasAddItemPermission]
+
+    def post(self, request, *args, **kwargs):
+        seller = get_seller(request.user)
+        if str(seller.id) != self.kwargs['pk']:
+            raise PermissionDenied()
+
+        serializer = OrderFulfilmentSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        delivered = serializer.validated_data['is_delivered']
+        if 'order_ids' in serializer.validated_data:
+            updated, unchanged, rejected = fulfilment.set_orders_delivered(
+                seller, serializer.validated_data['order_ids'], delivered)
+        else:
+            filterset = OrderFilter(serializer.validated_data['filter'], queryset=Order.objects.all())
+            if not filterset.is_valid():
+                raise ValidationError({'filter': filterset.errors})
+            updated, unchanged = fulfilment.set_delivered(seller, filterset.qs, delivered)
+            rejected = []
+        return Response({'updated': updated, 'unchanged': unchanged, 'rejected': len(rejected), 'rejected_ids': rejected})
+
+class SellerExportView(InstrumentedViewMixin, APIView):
+    """base of the apis streaming rows of a seller as CSV, or as JSON Lines with '?format=jsonl',
+    narrowed by the filters of `filterset_class`
+    must be logged in as the seller"""
+
+    permission_classes = [permissions.IsAuthenticated, HasAddItemPermission]
+    renderer_classes = [CSVRenderer, JSONLinesRenderer]
+    filterset_class = None
+    fields = None
+    export_name = None
+
+    def get_queryset(self, seller):
+        raise NotImplementedError
 
+    def get_rows(self, queryset):
+        raise NotImplementedError
 
-class SpecificSellerSpecificOrderView(RetrieveUpdateDestroyAPIView):
+    def get(self, request, *args, **kwargs):
+        seller = get_seller(request.user)
+        if str(seller.id) != self.kwargs['pk']:
+            raise PermissionDenied()
+
+        filterset = self.filterset_class(request.query_params, queryset=self.get_queryset(seller))
+        if not filterset.is_valid():
+            raise ValidationError(filterset.errors)
+        renderer = request.accepted_renderer
+        response = StreamingHttpResponse(renderer.stream(self.get_rows(filterset.qs), self.fields),
+                                         content_type='{}; charset={}'.format(renderer.media_type, renderer.charset))
+        response['Content-Disposition'] = 'attachment; filename="{}.{}"'.format(self.export_name, renderer.format)
+        return response
+
+class OrderExportView(SellerExportView):
+    """api streaming all orders of a seller with their transaction and ordered item ids,
+    e.g. '?date_placed_after=2026-01-01&date_placed_before=2026-01-31&format=jsonl'"""
+
+    filterset_class = OrderFilter
+    fields = exports.ORDER_FIELDS
+    export_name = 'orders'
+
+    def get_queryset(self, seller):
+        return exports.seller_orders(seller)
+
+    def get_rows(self, queryset):
+        return exports.order_rows(queryset)
+
+class TransactionExportView(SellerExportView):
+    """api streaming all transactions paid to a seller with the ids of their orders and ordered items,
+    narrowed to the days the orders were placed on as the order export"""
+
+    filterset_class = TransactionFilter
+    fields = exports.TRANSACTION_FIELDS
+    export_name = 'transactions'
+
+    def get_queryset(self, seller):
+        return exports.seller_transactions(seller)
+
+    def get_rows(self, queryset):
+        return exports.transaction_rows(queryset)
+
+class SpecificSellerSpecificOrderView(InstrumentedViewMixin, FieldsetViewMixin, RetrieveUpdateDestroyAPIView):
     """api used to get, update and delete a specific Order
     must be logged in as a seller"""
     permission_classes = [permissions.IsAuthenticated, HasSellerPermission]
     serializer_class = OrderSerializer
-    queryset = Order.objects.all()
 
-class SpecificOrderView(ListAPIView):
+    def get_queryset(self):
+        return order_queryset()
+
+class SpecificOrderView(InstrumentedViewMixin, FieldsetViewMixin, ConditionalResponseMixin, ListAPIView):
     """api used to view a specific order by a seller or a buyer
     must be logged in as the seller or buyer involved in the order"""
     permission_classes = [permissions.IsAuthenticated, HasSellerPermission or HasBuyerOrderPermission]
 
+    # the orders nest their payment transaction
+    validator_fields = ('updated_at', 'payment_transaction__updated_at')
     serializer_class = OrderSerializer
 
     def get_queryset(self):
-        return Order.objects.all().filter(id=self.kwargs['pk'])
+        return order_queryset().filter(id=self.kwargs['pk'])
 
-class SpecificBuyerOrderView(ListAPIView):
+class SpecificBuyerOrderView(InstrumentedViewMixin, FieldsetViewMixin, ConditionalResponseMixin, ListAPIView):
     """api used to view all orders made by a buyer
     must be logged in as the buyer involved in the orders"""
     permission_classes = [permissions.IsAuthenticated, HasBuyerOrderPermission]
-
+    pagination_class = NewestFirstCursorPagination
+    # the orders nest their payment transaction
+    validator_fields = ('updated_at', 'payment_transaction__updated_at')
     serializer_class = OrderSerializer
+    filter_backends = [KeysetOrderingFilter, DjangoFilterBackend,]
+    filterset_class = OrderFilter
+    ordering_fields = ['date_placed', 'total_amount_payable',]
 
     def get_queryset(self):
-        return Order.objects.all().filter(payment_transaction__payer=self.kwargs['pk'])
+        return order_queryset().filter(payment_transaction__payer=self.kwargs['pk'])
 
 
-class TransactionCreateView(CreateAPIView):
+class TransactionCreateView(InstrumentedViewMixin, CreateAPIView):
     """api for creating a new Transaction"""
     permission_classes = [permissions.IsAuthenticated, IsABuyer]
     serializer_class = TransactionSerializer
     queryset = Transaction.objects.all()
 
-class TransactionListView(ListAPIView):
+class TransactionListView(InstrumentedViewMixin, FieldsetViewMixin, ListAPIView):
     """this api allows a specific seller to view all the transactions they are involved in"""
     permission_classes = [permissions.IsAuthenticated, HasTransactionViewPermission]
+    pagination_class = NewestFirstCursorPagination
     serializer_class = TransactionSerializer
 
     def get_queryset(self):
         return Transaction.objects.all().filter(recipient=self.kwargs['pk'])
 
 
-class SpecificSellerSpecificTransactionView(RetrieveUpdateDestroyAPIView):
+class SpecificSellerSpecificTransactionView(InstrumentedViewMixin, FieldsetViewMixin, RetrieveUpdateDestroyAPIView):
     """api used to get, update and delete a specific Transaction"""
     permission_classes = [permissions.IsAuthenticated, HasTransactionViewPermission]
     serializer_class = TransactionSerializer
     queryset = Transaction.objects.all()
 
-class SpecificTransactionView(ListAPIView):
+class SpecificTransactionView(InstrumentedViewMixin, FieldsetViewMixin, ListAPIView):
     """This api allows a buyer and a seller to view a specific transaction involving both of them"""
     permission_classes = [permissions.IsAuthenticated, HasTransactionViewPermission, IsABuyer]
 
@@ -190,7 +457,65 @@ class SpecificTransactionView(ListAPIView):
     def get_queryset(self):
         return Transaction.objects.all().filter(id=self.kwargs['pk'])
 
-class CustomAuthToken(ObtainAuthToken):
+class SellerSalesView(InstrumentedViewMixin, APIView):
+    """api for the sales dashboard of a seller: totals, daily sales of the last 'days' days (30 by default)
+    and the most ordered items, read from the sales summaries of jengabay.analytics
+    must be logged in as the seller"""
+
+    permission_classes = [permissions.IsAuthenticated, HasAddItemPermission]
+    read_from_replica = True
+    max_days = 366
+    top_items = 10
+
+    def get_days(self):
+        try:
+            days = int(self.request.query_params.get('days', 30))
+        except ValueError:
+            raise ValidationError({'days': ['A valid integer is required.']})
+        if not 1 <= days <= self.max_days:
+            raise ValidationError({'days': ['Expected a number of days from 1 to {}.'.format(self.max_days)]})
+        return days
+
+    def get(self, request, *args, **kwargs):
+        seller = get_seller(request.user)
+        if str(seller.id) != self.kwargs['pk']:
+            raise PermissionDenied()
+
+        days = self.get_days()
+        today = localdate()
+        start = today - timedelta(days=days - 1)
+        daily_sales = SellerDailySales.objects.filter(seller=seller)
+        totals = daily_sales.aggregate(revenue=Sum('revenue'), order_count=Sum('order_count'),
+                                       delivered_count=Sum('delivered_count'))
+        totals = SellerDailySales(revenue=totals['revenue'] or 0, order_count=totals['order_count'] or 0,
+                                  delivered_count=totals['delivered_count'] or 0)
+        # days without orders are listed with zero sales
+        stored = {sales.date: sales for sales in daily_sales.filter(date__range=(start, today))}
+        daily = [stored.get(start + timedelta(days=offset)) or SellerDailySales(date=start + timedelta(days=offset))
+                 for offset in range(days)]
+        top_items = ItemSales.objects.filter(item__item_seller=seller, order_count__gt=0).select_related(
+            'item').only('order_count', 'item__item_name').order_by('-order_count', 'item_id')[:self.top_items]
+
+        with instrumentation.phase('ser'):
+            data = {
+                'totals': {field: value for field, value in SellerDailySalesSerializer(totals).data.items() if field != 'date'},
+                'daily': SellerDailySalesSerializer(daily, many=True).data,
+                'top_items': ItemSalesSerializer(top_items, many=True).data,
+            }
+        return Response(data)
+
+class CacheStatsView(InstrumentedViewMixin, APIView):
+    """api reporting the hit ratios of the response and authentication token caches of this process
+    must be logged in as an admin"""
+    permission_classes = [permissions.IsAdminUser]
+
+    def get(self, request, *args, **kwargs):
+        return Response({
+            'responses': response_cache.stats(),
+            'tokens': ExpiringTokenAuthentication.cache.stats(),
+        })
+
+class CustomAuthToken(InstrumentedViewMixin, AsyncViewMixin, ObtainAuthToken):
     """A Custom authentication class that creates an expiring authentication token
     for a user who logs in"""
 
@@ -202,26 +527,66 @@ class CustomAuthToken(ObtainAuthToken):
                                        context={'request': request})
         serializer.is_valid(raise_exception=True)
         user = serializer.validated_data['user']
+        if settings.SIGNED_TOKENS:
+            return Response(self.get_login_data(user, None))
         token, created = Token.objects.get_or_create(user=user)
         if not created:
             # update the created time of the token to keep it valid
             token.created = datetime.utcnow()
             token.save()
 
-        if Seller.objects.filter(profile=user).exists():
-            account_id = Seller.objects.get(profile=user).id
-            session_status = 'seller'
-        elif Buyer.objects.filter(profile=user).exists():
-            account_id = Seller.objects.get(profile=user).id
-            session_status = 'buyer'
+        return Response(self.get_login_data(user, token))
+
+    async def apost(self, request, *args, **kwargs):
+        """The native counterpart of post(), the password is verified in a thread pool
+        so that hashing it does not block the event loop"""
+
+        serializer = LoginSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        user = await passwords.aauthenticate(
+            serializer.validated_data['username'], serializer.validated_data['password'],
+            users=User.objects.select_related('seller', 'buyer', 'token_version'))
+        if user is None:
+            raise ValidationError({'non_field_errors': [LoginSerializer.default_error_messages['invalid_credentials']]})
+        if settings.SIGNED_TOKENS:
+            return Response(self.get_login_data(user, None))
+        token, created = await Token.objects.aget_or_create(user=user)
+        if not created:
+            token.created = datetime.utcnow()
+            await token.asave()
+
+        return Response(self.get_login_data(user, token))
+
+    def get_login_data(self, user, token):
+        """returns the login response, with a new signed token when `token` is None"""
+        session_status, account = get_role(user)
+        account_id = account.id if account is not None else None
+        if token is None:
+            key = signed_tokens.issue(user.pk, session_status, account_id, signed_tokens.current_version(user))
         else:
-            account_id = None
-            session_status = None
+            key = token.key
 
-        return Response({
-            'token': token.key,
+        return {
+            'token': key,
             'user_id': user.pk,
             'email': user.email,
             'session_status': session_status,
             'account_id': account_id
-        })
\ No newline at end of file
+        }
+
+
+class LogoutView(InstrumentedViewMixin, APIView):
+    """api revoking the token of the request, signed or not, post 'all': true to revoke
+    every token of the user e.g. on a lost device"""
+
+    permission_classes = [permissions.IsAuthenticated]
+
+    def post(self, request, *args, **kwargs):
+        if request.data.get('all') in (True, 'true'):
+            signed_tokens.revoke_user_tokens(request.user.pk)
+            Token.objects.filter(user=request.user.pk).delete()
+        elif isinstance(request.auth, signed_tokens.SignedToken):
+            signed_tokens.revoke(request.auth)
+        elif isinstance(request.auth, Token):
+            request.auth.delete()
+        return Response({'detail': 'Successfully logged out.'})